@@ -0,0 +1,11 @@
+# classxlib/benchmark/__init__.py
+
+from ._synthetic import generate_synthetic_image, read_sample_crops
+from ._segmentation import (SEGMENT_METHODS, PREPROCESS_SETTINGS, POSTPROCESS_SETTINGS,
+                            EXECUTION_MODES, run_segmentation_benchmark,
+                            write_benchmark_report, compare_benchmark_reports)
+
+__all__ = ['generate_synthetic_image','read_sample_crops',
+           'SEGMENT_METHODS','PREPROCESS_SETTINGS','POSTPROCESS_SETTINGS',
+           'EXECUTION_MODES','run_segmentation_benchmark',
+           'write_benchmark_report','compare_benchmark_reports']
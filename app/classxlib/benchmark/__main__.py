@@ -0,0 +1,77 @@
+"""Command line entry point of the segmentation benchmark
+
+Example:
+    python -m classxlib.benchmark --sizes 256 512 --methods slic felzenszwalb \\
+        --output benchmark.json --baseline last_benchmark.json
+"""
+
+# Python Standard Library Imports
+import sys
+import json
+import argparse
+
+# Local Library Imports
+from ._segmentation import (DEFAULT_IMAGE_SIZES, SEGMENT_METHODS, PREPROCESS_SETTINGS,
+                            POSTPROCESS_SETTINGS, EXECUTION_MODES,
+                            run_segmentation_benchmark, write_benchmark_report,
+                            compare_benchmark_reports)
+
+def main(argument_list:list=None) -> int:
+    """Runs the benchmark from command line arguments
+
+    Args:
+        argument_list (list, optional): The arguments. Defaults to sys.argv.
+
+    Returns:
+        int: Exit code, 1 if there are regressions against the baseline
+    """
+    parser = argparse.ArgumentParser(prog='python -m classxlib.benchmark',
+                                     description="Benchmarks the segmentation pipeline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_IMAGE_SIZES),
+                        help="crop sizes to benchmark")
+    parser.add_argument('--methods', nargs='+', choices=list(SEGMENT_METHODS),
+                        help="segmentation algorithms, defaults to all")
+    parser.add_argument('--preprocess', nargs='+', choices=list(PREPROCESS_SETTINGS),
+                        help="preprocessing settings, defaults to all")
+    parser.add_argument('--postprocess', nargs='+', choices=list(POSTPROCESS_SETTINGS),
+                        help="post processing settings, defaults to all")
+    parser.add_argument('--modes', nargs='+', choices=list(EXECUTION_MODES),
+                        default=list(EXECUTION_MODES), help="execution modes")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case")
+    parser.add_argument('--samples', help="directory of real crops to include")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the traced peak memory run")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic images")
+    parser.add_argument('--output', default='segmentation_benchmark.json',
+                        help="path of the JSON report")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="allowed slow down before a case counts as a regression")
+    arguments = parser.parse_args(argument_list)
+
+    report = run_segmentation_benchmark(image_sizes=arguments.sizes,
+                                        segment_methods=arguments.methods,
+                                        preprocess_settings=arguments.preprocess,
+                                        postprocess_settings=arguments.postprocess,
+                                        execution_modes=arguments.modes,
+                                        repeat=arguments.repeat,
+                                        sample_directory=arguments.samples,
+                                        measure_memory=not arguments.no_memory,
+                                        seed=arguments.seed)
+    if not write_benchmark_report(report, arguments.output):
+        return 2
+    print("Benchmark report written to", arguments.output)
+
+    if arguments.baseline is None:
+        return 0
+    with open(arguments.baseline, encoding='utf-8') as baseline_file:
+        baseline_report = json.load(baseline_file)
+    regression_list = compare_benchmark_reports(baseline_report, report,
+                                                tolerance=arguments.tolerance)
+    for regression in regression_list:
+        print(f"REGRESSION {regression['case']}: {regression['baseline_seconds']:.4f}s -> "
+              f"{regression.get('error') or format(regression['seconds'], '.4f') + 's'}")
+    return 1 if regression_list else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
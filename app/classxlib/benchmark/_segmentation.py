@@ -0,0 +1,369 @@
+"""Submodule for benchmarking the segmentation algorithms together
+with their preprocessing and post processing stages"""
+
+# Python Standard Library Imports
+import os
+import sys
+import json
+import time
+import platform
+import traceback
+import tracemalloc
+from itertools import product
+from datetime import datetime, timezone
+
+# Python Third Party Imports
+import numpy as np
+
+# Local Library Imports
+from ..utils import submit_task, gather_tasks, get_max_workers
+from ..segment._run_segmentation import (_preprocess_image, _process_segment_image,
+                                         _multi_process_segment_image)
+from ._synthetic import generate_synthetic_image, read_sample_crops
+
+__all__ = ['SEGMENT_METHODS', 'PREPROCESS_SETTINGS', 'POSTPROCESS_SETTINGS',
+           'EXECUTION_MODES', 'run_segmentation_benchmark',
+           'write_benchmark_report', 'compare_benchmark_reports']
+
+# Version of the report layout, bumped when fields change meaning
+BENCHMARK_REPORT_VERSION = 1
+
+# Default crop sizes, the largest crops in the app are 2048 pixels
+DEFAULT_IMAGE_SIZES = (256, 512, 1024, 2048)
+
+# Parameters of each segmentation algorithm, these are mid range
+# values of the sliders on the segmentation page
+SEGMENT_METHODS = {'watershed': {'segment_method_id': 1, 'parameter_1': 10,
+                                 'parameter_2': 0, 'parameter_3': 2.0},
+                   'slic': {'segment_method_id': 2, 'parameter_1': 10,
+                            'parameter_2': 10, 'parameter_3': 1.0},
+                   'quickshift': {'segment_method_id': 3, 'parameter_1': 5,
+                                  'parameter_2': 10, 'parameter_3': 1.0},
+                   'felzenszwalb': {'segment_method_id': 4, 'parameter_1': 5,
+                                    'parameter_2': 5, 'parameter_3': 0.8}}
+
+# Preprocessing settings that are benchmarked
+PREPROCESS_SETTINGS = {'none': {},
+                       'light_adjustment': {'light_adjustment_check': 1,
+                                            'histogram_method': 3},
+                       'contrast_stretch': {'contrast_stretch_check': 1},
+                       'color_quantization': {'color_cluster_check': 1,
+                                              'color_cluster_method': 2,
+                                              'color_clusters': 32}}
+
+# Post processing settings that are benchmarked
+POSTPROCESS_SETTINGS = {'none': {},
+                        'threshold_cut': {'region_merge_check': 1,
+                                          'region_merge_method': 1,
+                                          'region_merge_threshold': 5},
+                        'hierarchical_merge': {'region_merge_check': 1,
+                                               'region_merge_method': 3,
+                                               'region_merge_threshold': 5},
+                        'small_removal': {'small_item_removal_check': 1,
+                                          'small_item_removal_threshold': 5}}
+
+# serial runs in the calling process, tiled splits the image
+# into tiles segmented on the shared process pool
+EXECUTION_MODES = ('serial', 'tiled')
+
+# Parameters every benchmark case starts from, 0 disables a stage
+_BASE_PARAMETERS = {'crop_image_id': None,
+                    'light': 'Invalid',
+                    'light_adjustment_check': 0,
+                    'histogram_method': 0,
+                    'contrast_stretch_check': 0,
+                    'color_cluster_check': 0,
+                    'color_cluster_method': 0,
+                    'color_clusters': 0,
+                    'multi_processing_check': 0,
+                    'region_merge_check': 0,
+                    'region_merge_method': 0,
+                    'region_merge_threshold': 0,
+                    'small_item_removal_check': 0,
+                    'small_item_removal_threshold': 0}
+
+def run_segmentation_benchmark(image_sizes:tuple=DEFAULT_IMAGE_SIZES,
+                               segment_methods:list=None,
+                               preprocess_settings:list=None,
+                               postprocess_settings:list=None,
+                               execution_modes:list=EXECUTION_MODES,
+                               repeat:int=3,
+                               sample_directory:str=None,
+                               measure_memory:bool=True,
+                               seed:int=0) -> dict:
+    """Times every combination of crop size, segmentation algorithm,
+    preprocessing, post processing and execution mode on a synthetic
+    image and the optional local sample crops
+
+    Args:
+        image_sizes (tuple, optional): Crop widths and heights to benchmark.
+        Defaults to 256, 512, 1024 and 2048.
+        segment_methods (list, optional): Names from SEGMENT_METHODS.
+        Defaults to every algorithm.
+        preprocess_settings (list, optional): Names from PREPROCESS_SETTINGS.
+        Defaults to every setting.
+        postprocess_settings (list, optional): Names from POSTPROCESS_SETTINGS.
+        Defaults to every setting.
+        execution_modes (list, optional): Names from EXECUTION_MODES.
+        Defaults to serial and tiled.
+        repeat (int, optional): Timed runs of each case. Defaults to 3.
+        sample_directory (str, optional): Directory of real crops to
+        benchmark alongside the synthetic image. Defaults to None.
+        measure_memory (bool, optional): Run each case once more with
+        tracemalloc to record the peak memory, this run isn't timed since
+        tracing slows allocations down. Defaults to True.
+        seed (int, optional): Seed of the synthetic images. Defaults to 0.
+
+    Raises:
+        ValueError: If a setting name doesn't exist
+
+    Returns:
+        dict: The benchmark report, see write_benchmark_report
+    """
+    segment_methods = _check_names(segment_methods, SEGMENT_METHODS)
+    preprocess_settings = _check_names(preprocess_settings, PREPROCESS_SETTINGS)
+    postprocess_settings = _check_names(postprocess_settings, POSTPROCESS_SETTINGS)
+    execution_modes = _check_names(execution_modes, EXECUTION_MODES)
+    repeat = max(int(repeat), 1)
+
+    # Starting every pool worker up front so the first tiled
+    # case doesn't include the process start up time
+    if 'tiled' in execution_modes:
+        gather_tasks([submit_task(os.getpid) for _ in range(get_max_workers())])
+
+    report = {'version': BENCHMARK_REPORT_VERSION,
+              'created': datetime.now(timezone.utc).isoformat(),
+              'environment': _get_environment(),
+              'settings': {'image_sizes': list(image_sizes),
+                           'repeat': repeat,
+                           'seed': seed,
+                           'sample_directory': sample_directory},
+              'results': []}
+
+    for image_size in image_sizes:
+        image_list = [('synthetic', generate_synthetic_image(image_size, seed=seed))]
+        image_list += read_sample_crops(sample_directory, image_size)
+
+        for (image_name, image), preprocess_name in product(image_list, preprocess_settings):
+            # The image data is clipped the same way segmentation does
+            clipped_image = np.clip(image, -1, 1)
+            preprocess_parameters = dict(_BASE_PARAMETERS,
+                                         **PREPROCESS_SETTINGS[preprocess_name])
+            preprocess_seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                preprocessed_image = _preprocess_image(input_image=np.copy(clipped_image),
+                                                       parameter_dict=preprocess_parameters,
+                                                       clipped=True)
+                preprocess_seconds.append(time.perf_counter() - start)
+
+            for method_name, postprocess_name, execution_mode in product(segment_methods,
+                                                                         postprocess_settings,
+                                                                         execution_modes):
+                parameter_dict = dict(preprocess_parameters,
+                                      **SEGMENT_METHODS[method_name],
+                                      **POSTPROCESS_SETTINGS[postprocess_name])
+                result = {'case': '/'.join((image_name, str(image_size), method_name,
+                                            preprocess_name, postprocess_name,
+                                            execution_mode)),
+                          'image': image_name,
+                          'image_size': image_size,
+                          'segment_method': method_name,
+                          'preprocess': preprocess_name,
+                          'postprocess': postprocess_name,
+                          'execution_mode': execution_mode,
+                          'preprocess_seconds': float(np.median(preprocess_seconds))}
+                print("Benchmarking", result['case'])
+                result.update(_time_segmentation(preprocessed_image=preprocessed_image,
+                                                 parameter_dict=parameter_dict,
+                                                 execution_mode=execution_mode,
+                                                 repeat=repeat,
+                                                 measure_memory=measure_memory))
+                report['results'].append(result)
+    return report
+
+def write_benchmark_report(report:dict,
+                           output_path:str) -> bool:
+    """Writes a benchmark report as JSON
+
+    Args:
+        report (dict): Report from run_segmentation_benchmark
+        output_path (str): Path of the JSON file
+
+    Returns:
+        bool: True if the report was written
+    """
+    try:
+        output_directory = os.path.dirname(output_path)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+        return True
+    except (OSError, TypeError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return False
+
+def compare_benchmark_reports(baseline_report:dict,
+                              report:dict,
+                              tolerance:float=0.1) -> list:
+    """Finds the cases that got slower or failed compared to a baseline report
+
+    Args:
+        baseline_report (dict): The earlier report
+        report (dict): The new report
+        tolerance (float, optional): Fraction a case can slow down by
+        before it counts as a regression. Defaults to 0.1.
+
+    Returns:
+        list: List of dicts with the case, the baseline and new median seconds
+        and their ratio, ordered by the largest slow down first
+    """
+    baseline_results = {result['case']: result for result in baseline_report['results']}
+    regression_list = []
+    for result in report['results']:
+        baseline_result = baseline_results.get(result['case'])
+        if baseline_result is None or 'error' in baseline_result:
+            continue
+        if 'error' in result:
+            regression_list.append({'case': result['case'],
+                                    'baseline_seconds': baseline_result['median_seconds'],
+                                    'seconds': None,
+                                    'ratio': float('inf'),
+                                    'error': result['error']})
+            continue
+        ratio = result['median_seconds'] / max(baseline_result['median_seconds'], 1e-9)
+        if ratio > 1 + tolerance:
+            regression_list.append({'case': result['case'],
+                                    'baseline_seconds': baseline_result['median_seconds'],
+                                    'seconds': result['median_seconds'],
+                                    'ratio': ratio})
+    return sorted(regression_list, key=lambda regression: regression['ratio'], reverse=True)
+
+def _time_segmentation(preprocessed_image:np.ndarray,
+                       parameter_dict:dict,
+                       execution_mode:str,
+                       repeat:int,
+                       measure_memory:bool) -> dict:
+    """Times the segmentation and post processing of one benchmark case
+
+    Args:
+        preprocessed_image (np.ndarray): The preprocessed image to segment
+        parameter_dict (dict): The segmentation parameters
+        execution_mode (str): serial or tiled
+        repeat (int): Amount of timed runs
+        measure_memory (bool): Run once more with tracemalloc
+
+    Returns:
+        dict: The timings, stage timings, throughput, peak memory and
+        segment count or the error if the case failed
+    """
+    try:
+        run_seconds = []
+        run_stage_timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            segment_image, stage_timings = _run_case(preprocessed_image,
+                                                     parameter_dict,
+                                                     execution_mode)
+            run_seconds.append(time.perf_counter() - start)
+            run_stage_timings.append(stage_timings)
+
+        # Tracing python and numpy allocations, the tiled pool workers
+        # run in other processes so only the parent memory is measured
+        peak_memory_mb = None
+        if measure_memory:
+            tracemalloc.start()
+            try:
+                _run_case(preprocessed_image, parameter_dict, execution_mode)
+                peak_memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            finally:
+                tracemalloc.stop()
+
+        median_seconds = float(np.median(run_seconds))
+        stage_names = sorted({stage for timings in run_stage_timings for stage in timings})
+        megapixels = preprocessed_image.shape[0] * preprocessed_image.shape[1] / 1_000_000
+        return {'seconds': run_seconds,
+                'median_seconds': median_seconds,
+                'minimum_seconds': float(np.min(run_seconds)),
+                'stage_seconds': {stage: float(np.median([timings.get(stage, 0.0)
+                                                          for timings in run_stage_timings]))
+                                  for stage in stage_names},
+                'megapixels_per_second': megapixels / median_seconds if median_seconds > 0 else None,
+                'peak_memory_mb': peak_memory_mb,
+                'segment_count': int(len(np.unique(segment_image)))}
+    except (ValueError, TypeError,
+            IndexError, RuntimeError,
+            MemoryError, TimeoutError) as error:
+        print("Benchmark case failed")
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return {'error': f"{type(error).__name__}: {error}"}
+
+def _run_case(preprocessed_image:np.ndarray,
+              parameter_dict:dict,
+              execution_mode:str) -> tuple:
+    """Runs the segmentation of one benchmark case
+
+    Args:
+        preprocessed_image (np.ndarray): The preprocessed image to segment
+        parameter_dict (dict): The segmentation parameters
+        execution_mode (str): serial or tiled
+
+    Returns:
+        tuple: Tuple of the segment image and the stage timings
+    """
+    stage_timings = {}
+    if execution_mode == 'tiled':
+        segment_image = _multi_process_segment_image(preprocessed_image=preprocessed_image,
+                                                     parameter_dict=parameter_dict,
+                                                     stage_timings=stage_timings)
+    else:
+        segment_image = _process_segment_image(preprocessed_image=preprocessed_image,
+                                               parameter_dict=parameter_dict,
+                                               stage_timings=stage_timings)
+    return segment_image, stage_timings
+
+def _check_names(name_list:list,
+                 valid_names) -> list:
+    """Checks a list of setting names, None selects every setting
+
+    Args:
+        name_list (list): The selected names
+        valid_names (iterable): The names that exist
+
+    Raises:
+        ValueError: If a name doesn't exist
+
+    Returns:
+        list: The selected names
+    """
+    if name_list is None:
+        return list(valid_names)
+    unknown_names = [name for name in name_list if name not in valid_names]
+    if unknown_names:
+        raise ValueError(f"Unknown benchmark settings {unknown_names}, "
+                         f"valid settings are {list(valid_names)}")
+    return list(name_list)
+
+def _get_environment() -> dict:
+    """Gets the machine and library versions a report was recorded on
+
+    Returns:
+        dict: Environment description
+    """
+    # Imported here since they are only needed for the report
+    import scipy # pylint: disable=import-outside-toplevel
+    import skimage # pylint: disable=import-outside-toplevel
+    import sklearn # pylint: disable=import-outside-toplevel
+
+    return {'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'process_pool_workers': get_max_workers(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'scikit-image': skimage.__version__,
+            'scikit-learn': sklearn.__version__}
@@ -0,0 +1,90 @@
+"""Submodule for generating the images segmentation is benchmarked on"""
+
+# Python Standard Library Imports
+import os
+import traceback
+
+# Python Third Party Imports
+import cv2
+import numpy as np
+from scipy.spatial import cKDTree
+from skimage.util import img_as_float32
+
+__all__ = ['generate_synthetic_image', 'read_sample_crops']
+
+# Average area in pixels of the regions in a synthetic image
+SYNTHETIC_REGION_AREA = 64 * 64
+
+# Image file extensions read from the sample crop directory
+SAMPLE_CROP_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+
+def generate_synthetic_image(image_size:int,
+                             seed:int=0) -> np.ndarray:
+    """Generates a textured image of irregular regions similar to a crop,
+    every region has its own color and striped texture and the whole image
+    has gaussian noise
+
+    Args:
+        image_size (int): The width and height of the image
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        np.ndarray: Float32 RGB image in the 0 to 1 range
+    """
+    random_generator = np.random.default_rng(seed)
+
+    # Splitting the image into voronoi regions around random centers
+    region_count = max(image_size * image_size // SYNTHETIC_REGION_AREA, 2)
+    region_centers = random_generator.uniform(0, image_size, size=(region_count, 2))
+    pixel_y, pixel_x = np.mgrid[0:image_size, 0:image_size].astype(np.float32)
+    region_image = cKDTree(region_centers).query(np.column_stack((pixel_y.ravel(),
+                                                                  pixel_x.ravel())),
+                                                 workers=-1)[1].reshape(image_size, image_size)
+
+    # Base color and stripe direction and frequency of each region
+    region_color = random_generator.uniform(0.15, 0.85, size=(region_count, 3))
+    region_angle = random_generator.uniform(0, np.pi, size=region_count)
+    region_frequency = random_generator.uniform(0.05, 0.5, size=region_count)
+
+    stripe_phase = (np.cos(region_angle)[region_image] * pixel_x +
+                    np.sin(region_angle)[region_image] * pixel_y) * \
+                   region_frequency[region_image]
+    texture = 0.08 * np.sin(stripe_phase)
+
+    synthetic_image = region_color[region_image] + texture[..., np.newaxis]
+    synthetic_image += random_generator.normal(0, 0.02, size=synthetic_image.shape)
+    return np.clip(synthetic_image, 0, 1).astype(np.float32)
+
+def read_sample_crops(sample_directory:str,
+                      image_size:int) -> list:
+    """Reads the crop images of a local directory resized to
+    the benchmark size
+
+    Args:
+        sample_directory (str): Directory holding the sample crops
+        image_size (int): The width and height to resize the crops to
+
+    Returns:
+        list: List of (file name, float32 RGB image) tuples
+    """
+    sample_list = []
+    if sample_directory is None or not os.path.isdir(sample_directory):
+        return sample_list
+
+    for file_name in sorted(os.listdir(sample_directory)):
+        if not file_name.lower().endswith(SAMPLE_CROP_EXTENSIONS):
+            continue
+        try:
+            sample_image = cv2.imread(os.path.join(sample_directory, file_name),
+                                      cv2.IMREAD_COLOR)
+            if sample_image is None:
+                raise OSError(f"Failed reading {file_name}")
+            sample_image = cv2.cvtColor(sample_image, cv2.COLOR_BGR2RGB)
+            sample_image = cv2.resize(sample_image, (image_size, image_size),
+                                      interpolation=cv2.INTER_LINEAR)
+            sample_list.append((file_name, img_as_float32(sample_image)))
+        # pylint: disable=catching-non-exception
+        except (OSError, ValueError, cv2.error) as error:
+            print("Error:", error)
+            traceback.print_tb(error.__traceback__)
+    return sample_list
@@ -1,5 +1,9 @@
 # classxlib/color/__init__.py
 from ._convert_hex import hex2rgb
 from ._colorlabel import color_labeled_image
+from ._label_overlay import (LabelOverlay, configure_label_overlay_cache,
+                             render_label_overlay, clear_label_overlay_cache)
 
-__all__ = ['hex2rgb', 'color_labeled_image']
\ No newline at end of file
+__all__ = ['hex2rgb', 'color_labeled_image', 'LabelOverlay',
+           'configure_label_overlay_cache', 'render_label_overlay',
+           'clear_label_overlay_cache']
\ No newline at end of file
@@ -9,11 +9,16 @@ import numpy as np
 # Local Library Imports
 from ._convert_hex import hex2rgb
 
+# Number of pixels colored at a time, this bounds the size of the
+# gathered color and fixed point blend temporaries for large crops
+BLEND_BAND_PIXELS = 1 << 20
+
 def color_labeled_image(input_image:np.ndarray,
                          segment_image:np.ndarray,
                          segment_info:np.ndarray,
                          research_label_map:dict,
-                         alpha:float=0.7)->np.ndarray:
+                         alpha:float=0.7,
+                         out:np.ndarray=None)->np.ndarray:
     """Takes in an image and a segment image array and
     colors the segments based off the stored labels
     within segment info and research field label map
@@ -26,6 +31,8 @@ def color_labeled_image(input_image:np.ndarray,
         research_label_map (dict): Label map for the research field retrieved from database
         alpha (float): Percentage value of blending/opacity
         value of labels in range 0-1.0(aka 0%-100%). Defaults to 0.7
+        out (np.ndarray, optional): Preallocated uint8 array with the shape of
+        the input image the colored image is written into. Defaults to None.
 
     Raises:
         TypeError: If input marked image is not an array
@@ -43,52 +50,150 @@ def color_labeled_image(input_image:np.ndarray,
             raise TypeError("segmented_image needs to be an ndarray")
         if input_image.shape[:2] != segment_image.shape:
             raise ValueError("marked image and segmented image need to be same shape")
+        if out is not None and (out.shape != input_image.shape or out.dtype != np.uint8):
+            raise ValueError("out needs to be a uint8 array of the input image shape")
 
 
         # Checking if there are any labeled segments before major logic begins
         if len(segment_info) == 0:
-            return input_image
-
-        # blank image to be colored
-        color_image = np.zeros(input_image.shape)
-
-        # Coloring all labeled areas does a loop for each label type
-        for label in research_label_map:
-            # Label ID to color image with
-            label_id = label["id"]
-
-            # Converting the Hexdecimal code to RGB tuple (R,G,B)
-            color = hex2rgb(label["color"])
-
-            # Boolean mask where to the segment number and label id match
-            # Utilizing segment label data from the segment_info it
-            # finds all pixels where the segment numbers/current label match
-            mask = np.isin(segment_image, np.where(segment_info[:,1] == label_id,
-                                                   segment_info[:,0],
-                                                   0))
-
-            # Stacking the mask to follow the shape of the colored image
-            # When using np.where to edit the arrays they need to be of the same shape
-            mask = np.dstack((mask,mask,mask))
-
-            # Updating the color image
-            # Wherever the mask is equal to True it puts the color pixel values
-            color_image = np.where(mask, color, color_image)
-
-        # Everywhere it's still 0 means there was no label
-        # to color there so we set it to be the marked image.
-        # Merging the color image and marked image together
-        # this blends the label ontop of the color image
-        color_image = np.where(color_image==[0,0,0],
-                               input_image,
-                               input_image * (1.0 - alpha) + color_image * alpha)
-
-        # Converting the datatype to uint8 to ensure data
-        # consistency since the segment images are uint32
-        color_image = color_image.astype(np.uint8)
-        return color_image
+            if out is None:
+                return input_image
+            np.copyto(out, input_image, casting='unsafe')
+            return out
+
+        # Color of every segment number, the lookup table covers
+        # every segment number in the segment image and the info
+        segment_count = int(max(np.amax(segment_image), np.amax(segment_info[:,0]))) + 1
+        segment_colors = _get_segment_colors(segment_info, research_label_map, segment_count)
+
+        if out is None:
+            out = np.empty(input_image.shape, dtype=np.uint8)
+        _render_label_colors(input_image, segment_image, segment_colors, alpha, out)
+        return out
     except (RuntimeError, TypeError,
             ValueError) as error:
         print("Error:", error)
         traceback.print_tb(error.__traceback__)
         return input_image
+
+def _get_label_palette(research_label_map:dict) -> tuple:
+    """Builds the label id to color palette of a research field
+
+    Args:
+        research_label_map (dict): Label map for the research field
+
+    Returns:
+        tuple: Sorted array of the label ids and a uint8 palette of shape
+        (label_count + 1, 3) where row i + 1 is the color of label id i
+        and row 0 is the (0,0,0) color of unlabeled segments
+    """
+    # Later labels in the map take priority over earlier ones with the same id
+    label_colors = {}
+    for label in research_label_map:
+        color = hex2rgb(label["color"])
+        if color is not None:
+            label_colors[label["id"]] = color
+    label_ids = np.array(sorted(label_colors), dtype=np.int64)
+    palette = np.zeros((len(label_ids) + 1, 3), dtype=np.uint8)
+    for palette_index, label_id in enumerate(label_ids, start=1):
+        palette[palette_index] = label_colors[int(label_id)]
+    return label_ids, palette
+
+def _get_segment_label_lut(segment_info:np.ndarray,
+                           label_ids:np.ndarray,
+                           segment_count:int) -> np.ndarray:
+    """Builds the segment number to palette index lookup table
+
+    Args:
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+        label_ids (np.ndarray): Sorted label ids of the palette
+        segment_count (int): The length of the lookup table, one more
+        than the largest segment number
+
+    Returns:
+        np.ndarray: The palette index of every segment number, 0 for
+        segments without a label in the palette
+    """
+    segment_lut = np.zeros(segment_count, dtype=np.intp)
+    if len(segment_info) == 0 or len(label_ids) == 0:
+        return segment_lut
+    segment_labels = segment_info[:,1].astype(np.int64)
+    palette_index = np.searchsorted(label_ids, segment_labels)
+    np.minimum(palette_index, len(label_ids) - 1, out=palette_index)
+    is_known = label_ids[palette_index] == segment_labels
+    segment_lut[segment_info[is_known,0].astype(np.intp)] = palette_index[is_known] + 1
+    return segment_lut
+
+def _get_segment_colors(segment_info:np.ndarray,
+                        research_label_map:dict,
+                        segment_count:int) -> np.ndarray:
+    """Gets the label color of every segment number through the segment
+    to label lookup table and the label palette
+
+    Args:
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+        research_label_map (dict): Label map for the research field
+        segment_count (int): The length of the lookup table, one more
+        than the largest segment number
+
+    Returns:
+        np.ndarray: uint8 array of shape (segment_count, 3) with the RGB
+        color of each segment number, unlabeled segments are (0,0,0)
+    """
+    label_ids, palette = _get_label_palette(research_label_map)
+    return palette[_get_segment_label_lut(segment_info, label_ids, segment_count)]
+
+def _render_label_colors(input_image:np.ndarray,
+                         segment_image:np.ndarray,
+                         segment_colors:np.ndarray,
+                         alpha:float,
+                         out:np.ndarray) -> None:
+    """Colors a whole image band by band, each band gathers the segment
+    colors once and blends them into the output buffer
+
+    Args:
+        input_image (np.ndarray): Image with 3 channels
+        segment_image (np.ndarray): The segment mask of the same size
+        segment_colors (np.ndarray): uint8 color of every segment number
+        alpha (float): Opacity of the labels in range 0-1.0
+        out (np.ndarray): uint8 output buffer of the input image shape
+    """
+    band_rows = max(1, BLEND_BAND_PIXELS // max(1, segment_image.shape[1]))
+    for row in range(0, segment_image.shape[0], band_rows):
+        band = slice(row, row + band_rows)
+        _blend_label_colors(input_image[band],
+                            segment_colors[segment_image[band]],
+                            alpha,
+                            out=out[band])
+
+def _blend_label_colors(input_pixels:np.ndarray,
+                        color_pixels:np.ndarray,
+                        alpha:float,
+                        out:np.ndarray=None) -> np.ndarray:
+    """Blends label colors on top of image pixels in 8 bit fixed point,
+    color channels that are 0 keep the image value
+
+    Args:
+        input_pixels (np.ndarray): Image pixels with 3 channels
+        color_pixels (np.ndarray): uint8 label color of each pixel, same shape
+        alpha (float): Opacity of the labels in range 0-1.0
+        out (np.ndarray, optional): uint8 array the blend is written into.
+        Defaults to None.
+
+    Returns:
+        np.ndarray: The blended uint8 pixels
+    """
+    # Opacity as a weight out of 256 so the blend fits in uint16
+    label_weight = int(round(min(max(alpha, 0.0), 1.0) * 256))
+    blend = input_pixels.astype(np.uint16)
+    blend *= 256 - label_weight
+    blend += color_pixels.astype(np.uint16) * np.uint16(label_weight)
+    blend >>= 8
+
+    if out is None:
+        out = np.empty(blend.shape, dtype=np.uint8)
+    np.copyto(out, blend, casting='unsafe')
+    np.copyto(out, input_pixels, casting='unsafe', where=color_pixels == 0)
+    return out
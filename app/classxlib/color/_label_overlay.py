@@ -0,0 +1,196 @@
+"""Module for incrementally rendering the label overlay of a segment
+image, only the segments whose label color changed are repainted"""
+
+# Python Standard Library Imports
+import threading
+from collections import OrderedDict
+
+# Python Third Party Imports
+import numpy as np
+
+# Local Library Imports
+from ._colorlabel import _get_segment_colors, _render_label_colors, _blend_label_colors
+
+__all__ = ['LabelOverlay', 'configure_label_overlay_cache',
+           'render_label_overlay', 'clear_label_overlay_cache']
+
+# Above this fraction of changed segments a full repaint is cheaper
+# than gathering the pixels of each segment
+FULL_REPAINT_FRACTION = 0.25
+
+_OVERLAY_CACHE = OrderedDict()
+_OVERLAY_CACHE_LOCK = threading.Lock()
+_OVERLAY_CACHE_SETTINGS = {'max_size': 256 * 1024 * 1024}
+
+class LabelOverlay:
+    """The colored label overlay of one segment image together with an
+    index of the pixels of every segment. The index is the pixel order
+    of a stable argsort of the segment image with CSR style offsets so
+    the pixels of segment n are pixel_order[pixel_offsets[n]:pixel_offsets[n+1]]
+    """
+    def __init__(self,
+                 marked_image:np.ndarray,
+                 segment_image:np.ndarray):
+        """
+        Args:
+            marked_image (np.ndarray): The 3 channel marked boundary image
+            segment_image (np.ndarray): The segment image mask of the same size
+
+        Raises:
+            ValueError: If the marked image and segment image shapes don't match
+        """
+        if marked_image.shape[:2] != segment_image.shape:
+            raise ValueError("marked image and segmented image need to be same shape")
+        self.marked_image = marked_image
+        self.segment_image = segment_image
+
+        # Building the segment to pixel index
+        segment_pixels = segment_image.ravel()
+        self.segment_count = int(segment_pixels.max()) + 1 if segment_pixels.size else 1
+        index_dtype = np.uint32 if segment_pixels.size < 2**32 else np.int64
+        self.pixel_order = np.argsort(segment_pixels, kind='stable').astype(index_dtype)
+        self.pixel_offsets = np.zeros(self.segment_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(segment_pixels, minlength=self.segment_count),
+                  out=self.pixel_offsets[1:])
+
+        # The overlay starts out without labels
+        self.overlay = np.ascontiguousarray(marked_image, dtype=np.uint8).copy()
+        self.segment_colors = np.zeros((self.segment_count, 3), dtype=np.uint8)
+        self.alpha = None
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """int: Memory used by the overlay and its pixel index"""
+        return (self.overlay.nbytes + self.pixel_order.nbytes +
+                self.pixel_offsets.nbytes + self.segment_colors.nbytes)
+
+    def render(self,
+               segment_info:np.ndarray,
+               research_label_map:dict,
+               alpha:float) -> np.ndarray:
+        """Updates the overlay to the current segment labels, only
+        segments whose color changed since the last render are repainted
+
+        Args:
+            segment_info (np.ndarray): Segment label information with each
+            row as (segment_number, segment_label_id, segment_area)
+            research_label_map (dict): Label map for the research field
+            alpha (float): Opacity of the labels in range 0-1.0
+
+        Returns:
+            np.ndarray: A copy of the colored overlay
+        """
+        segment_count = self.segment_count
+        if len(segment_info):
+            segment_count = max(segment_count, int(segment_info[:,0].max()) + 1)
+        segment_colors = _get_segment_colors(segment_info, research_label_map,
+                                             segment_count)[:self.segment_count]
+
+        with self.lock:
+            if alpha != self.alpha:
+                changed_segments = None
+            else:
+                changed_segments = np.flatnonzero(np.any(segment_colors != self.segment_colors,
+                                                         axis=1))
+
+            if changed_segments is None or \
+               len(changed_segments) > FULL_REPAINT_FRACTION * self.segment_count:
+                _render_label_colors(self.marked_image, self.segment_image,
+                                     segment_colors, alpha, self.overlay)
+            elif len(changed_segments):
+                pixel_index = self._get_segment_pixels(changed_segments)
+                overlay_pixels = self.overlay.reshape(-1, 3)
+                overlay_pixels[pixel_index] = _blend_label_colors(
+                    self.marked_image.reshape(-1, 3)[pixel_index],
+                    segment_colors[self.segment_image.ravel()[pixel_index]],
+                    alpha)
+
+            self.segment_colors = segment_colors
+            self.alpha = alpha
+            return self.overlay.copy()
+
+    def _get_segment_pixels(self, segment_list:np.ndarray) -> np.ndarray:
+        """Gets the flat pixel indexes of a list of segments
+
+        Args:
+            segment_list (np.ndarray): The segment numbers
+
+        Returns:
+            np.ndarray: The flat pixel indexes of every segment in the list
+        """
+        segment_starts = self.pixel_offsets[segment_list]
+        segment_lengths = self.pixel_offsets[segment_list + 1] - segment_starts
+        # Expanding each (start, length) range into consecutive positions
+        range_positions = np.arange(segment_lengths.sum()) - \
+                          np.repeat(np.cumsum(segment_lengths) - segment_lengths, segment_lengths)
+        return self.pixel_order[np.repeat(segment_starts, segment_lengths) + range_positions]
+
+def configure_label_overlay_cache(max_size_mb:int=None) -> None:
+    """Sets the memory budget of the label overlays kept by this process
+
+    Args:
+        max_size_mb (int, optional): The size in megabytes the cache is
+        trimmed to. A size of 0 disables the cache. Defaults to 256.
+    """
+    if max_size_mb is not None:
+        with _OVERLAY_CACHE_LOCK:
+            _OVERLAY_CACHE_SETTINGS['max_size'] = max(int(max_size_mb), 0) * 1024 * 1024
+            _trim_overlay_cache_locked()
+
+def render_label_overlay(overlay_key,
+                         marked_image:np.ndarray,
+                         segment_image:np.ndarray,
+                         segment_info:np.ndarray,
+                         research_label_map:dict,
+                         alpha:float=0.7) -> np.ndarray:
+    """Renders the label overlay of a segment image reusing the cached
+    overlay of the same key. The cached overlay is only reused while it was
+    built from the same marked image and segment image arrays, so callers
+    should pass the shared arrays from the segment image cache.
+
+    Args:
+        overlay_key (hashable): Key of the overlay such as the segment image path
+        marked_image (np.ndarray): The 3 channel marked boundary image
+        segment_image (np.ndarray): The segment image mask
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+        research_label_map (dict): Label map for the research field
+        alpha (float, optional): Opacity of the labels in range 0-1.0.
+        Defaults to 0.7.
+
+    Returns:
+        np.ndarray: The 3 channel colored image
+    """
+    with _OVERLAY_CACHE_LOCK:
+        label_overlay = _OVERLAY_CACHE.get(overlay_key)
+        if label_overlay is not None:
+            # The image files changed so the overlay has to be rebuilt
+            if label_overlay.marked_image is not marked_image or \
+               label_overlay.segment_image is not segment_image:
+                del _OVERLAY_CACHE[overlay_key]
+                label_overlay = None
+            else:
+                _OVERLAY_CACHE.move_to_end(overlay_key)
+
+    if label_overlay is None:
+        label_overlay = LabelOverlay(marked_image, segment_image)
+        if label_overlay.nbytes <= _OVERLAY_CACHE_SETTINGS['max_size']:
+            with _OVERLAY_CACHE_LOCK:
+                _OVERLAY_CACHE[overlay_key] = label_overlay
+                _trim_overlay_cache_locked()
+
+    return label_overlay.render(segment_info, research_label_map, alpha)
+
+def clear_label_overlay_cache() -> None:
+    """Removes every cached label overlay"""
+    with _OVERLAY_CACHE_LOCK:
+        _OVERLAY_CACHE.clear()
+
+def _trim_overlay_cache_locked() -> None:
+    """Removes the least recently used overlays until the cache is within
+    its memory budget, the cache lock must be held"""
+    cache_size = sum(label_overlay.nbytes for label_overlay in _OVERLAY_CACHE.values())
+    while _OVERLAY_CACHE and cache_size > _OVERLAY_CACHE_SETTINGS['max_size']:
+        _, label_overlay = _OVERLAY_CACHE.popitem(last=False)
+        cache_size -= label_overlay.nbytes
@@ -3,6 +3,9 @@ from ._read import (read_cv_image, read_hdf5_image,
                     read_fits_image, read_geotiff_image)
 from ._write import (write_cv_image, write_hdf5_image)
 from ._convert import (image_as_b64, rgb2gray)
+from ._encode import (configure_image_encoder, register_image_encoder,
+                      encode_image, get_image_mime_type,
+                      get_preview_image_format, clear_image_encode_cache)
 from . import transform
 from . import analysis
 from . import process
@@ -11,6 +14,9 @@ from . import utils
 __all__ = ['read_cv_image','read_hdf5_image',
            'write_cv_image', 'write_hdf5_image',
            'image_as_b64', 'rgb2gray',
+           'configure_image_encoder','register_image_encoder',
+           'encode_image','get_image_mime_type',
+           'get_preview_image_format','clear_image_encode_cache',
            'read_fits_image','read_geotiff_image',
            'transform','analysis',
            'process','utils']
\ No newline at end of file
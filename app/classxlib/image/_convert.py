@@ -7,17 +7,24 @@ import base64
 import cv2
 import numpy as np
 
+# Local Library Imports
+from ._encode import encode_image
+
 __all__ = ['image_as_b64', 'rgb2gray']
 
 def image_as_b64(input_image:np.ndarray,
-                 reverse_channel:bool=True)->str:
+                 reverse_channel:bool=True,
+                 image_format:str=None)->str:
     """Converts an input image array to Base64 Image
 
     Args:
         input_image (np.ndarray): An image array to be converted
-        reverse_channel (bool): Condition whether to reverse the
-        color channels or not before encoding since OpenCV will
-        reverse them. Defaults to True
+        reverse_channel (bool): Condition whether the color channels are
+        in RGB order, False for images in the BGR order OpenCV reads.
+        Defaults to True
+        image_format (str, optional): Name of a registered image format.
+        Defaults to None which is the configured response format, see
+        get_image_mime_type.
     Raises:
         TypeError: If input is not an array
         ValueError: If input image is incorrect shape
@@ -26,23 +33,13 @@ def image_as_b64(input_image:np.ndarray,
         str: Base64 encoded string of image
     """
     try:
-        # Checking if the input image is the correct type
-        if not isinstance(input_image, (np.ndarray,np.generic)):
-            raise TypeError("Error: Input image needs to be an ndarray")
-        if len(input_image.shape) != 3:
-            raise ValueError("Error: Incorrect shape for input image")
-
-        # Reversing the color channels
-        if reverse_channel is True:
-            input_image = cv2.cvtColor(input_image, cv2.COLOR_BGR2RGB)
-
-        # Encoding the image
-        buffer = cv2.imencode('.png', input_image)[1]
+        # Encoding the image with the registered encoder of the format
+        buffer = encode_image(input_image, image_format, reverse_channel)
 
         # Encoding the buffer into base64 text
         return base64.b64encode(buffer).decode('utf-8')
     # pylint: disable=catching-non-exception
-    except (RuntimeError, TypeError,
+    except (RuntimeError, TypeError, KeyError, OSError,
             cv2.error, ValueError) as error:
         print("Error:", error)
         traceback.print_tb(error.__traceback__)
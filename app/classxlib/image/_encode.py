@@ -0,0 +1,224 @@
+"""ClassX image module for encoding images sent to the front-end. Each
+image format has a registered encoder, the formats used for responses
+and previews and their compression settings are configurable and
+encoded images can be cached by the hash of their pixels."""
+# Python Standard Library Imports
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Python Third Party Imports
+import cv2
+import numpy as np
+from PIL import Image
+
+__all__ = ['configure_image_encoder', 'register_image_encoder',
+           'encode_image', 'get_image_mime_type',
+           'get_preview_image_format', 'clear_image_encode_cache']
+
+_ENCODER_SETTINGS = {'response_format': 'png',
+                     'preview_format': 'png',
+                     'png_compression': 1,
+                     'jpeg_quality': 90,
+                     'webp_method': 0,
+                     'cache_size': 0}
+
+# Registered encoders as format: (mime type, encode function)
+_IMAGE_ENCODERS = {}
+
+_ENCODE_CACHE = OrderedDict()
+_ENCODE_CACHE_LOCK = threading.Lock()
+_ENCODE_CACHE_SIZE = {'current_size': 0}
+
+def configure_image_encoder(response_format:str=None,
+                            preview_format:str=None,
+                            png_compression:int=None,
+                            jpeg_quality:int=None,
+                            webp_method:int=None,
+                            cache_size_mb:int=None) -> None:
+    """Sets the image formats and compression used for front-end images
+
+    Args:
+        response_format (str, optional): Format of the labeling images,
+        a lossless format since label boundaries are one pixel wide.
+        Defaults to png.
+        preview_format (str, optional): Format of the segmentation
+        preview images. Defaults to png.
+        png_compression (int, optional): zlib level 0-9 of PNG images,
+        low levels encode faster. Defaults to 1.
+        jpeg_quality (int, optional): Quality 1-100 of JPEG images. Defaults to 90.
+        webp_method (int, optional): Effort 0-6 of lossless WebP images,
+        low methods encode faster. Defaults to 0.
+        cache_size_mb (int, optional): Memory budget of the encoded image
+        cache. A size of 0 disables the cache. Defaults to 0.
+
+    Raises:
+        ValueError: If a format has no registered encoder
+    """
+    for image_format in (response_format, preview_format):
+        if image_format is not None and image_format.lower() not in _IMAGE_ENCODERS:
+            raise ValueError(f"No image encoder registered for {image_format}")
+    if response_format is not None:
+        _ENCODER_SETTINGS['response_format'] = response_format.lower()
+    if preview_format is not None:
+        _ENCODER_SETTINGS['preview_format'] = preview_format.lower()
+    if png_compression is not None:
+        _ENCODER_SETTINGS['png_compression'] = min(max(int(png_compression), 0), 9)
+    if jpeg_quality is not None:
+        _ENCODER_SETTINGS['jpeg_quality'] = min(max(int(jpeg_quality), 1), 100)
+    if webp_method is not None:
+        _ENCODER_SETTINGS['webp_method'] = min(max(int(webp_method), 0), 6)
+    if cache_size_mb is not None:
+        _ENCODER_SETTINGS['cache_size'] = max(int(cache_size_mb), 0) * 1024 * 1024
+    # Cached images may have been encoded with the old settings
+    clear_image_encode_cache()
+
+def register_image_encoder(image_format:str,
+                           mime_type:str,
+                           encode_function) -> None:
+    """Adds or replaces the encoder of an image format
+
+    Args:
+        image_format (str): Name of the format such as png
+        mime_type (str): MIME type of the encoded image
+        encode_function (callable): Called with the image, whether its
+        channels are in RGB order and the encoder settings dict,
+        returns the encoded bytes
+    """
+    _IMAGE_ENCODERS[image_format.lower()] = (mime_type, encode_function)
+    clear_image_encode_cache()
+
+def get_image_mime_type(image_format:str=None) -> str:
+    """Gets the MIME type of an image format
+
+    Args:
+        image_format (str, optional): Name of the format. Defaults to
+        None which is the response format.
+
+    Returns:
+        str: The MIME type such as image/png
+    """
+    return _IMAGE_ENCODERS[_get_format(image_format)][0]
+
+def get_preview_image_format() -> str:
+    """Gets the configured format of segmentation preview images
+
+    Returns:
+        str: Name of the preview format
+    """
+    return _ENCODER_SETTINGS['preview_format']
+
+def encode_image(input_image:np.ndarray,
+                 image_format:str=None,
+                 reverse_channel:bool=True) -> bytes:
+    """Encodes an image array with a registered encoder
+
+    Args:
+        input_image (np.ndarray): A 3 channel uint8 image array
+        image_format (str, optional): Name of the format. Defaults to
+        None which is the response format.
+        reverse_channel (bool, optional): Whether the channels are in RGB
+        order, False for the BGR order OpenCV reads images in. Defaults to True.
+
+    Raises:
+        TypeError: If input is not an array
+        ValueError: If input image is incorrect shape
+
+    Returns:
+        bytes: The encoded image
+    """
+    if not isinstance(input_image, (np.ndarray,np.generic)):
+        raise TypeError("Error: Input image needs to be an ndarray")
+    if len(input_image.shape) != 3:
+        raise ValueError("Error: Incorrect shape for input image")
+    image_format = _get_format(image_format)
+
+    cache_key = None
+    if _ENCODER_SETTINGS['cache_size'] > 0:
+        image_hash = hashlib.blake2b(np.ascontiguousarray(input_image).data, digest_size=16)
+        cache_key = (image_hash.hexdigest(), input_image.shape,
+                     input_image.dtype.str, image_format, bool(reverse_channel))
+        with _ENCODE_CACHE_LOCK:
+            encoded_image = _ENCODE_CACHE.get(cache_key)
+            if encoded_image is not None:
+                _ENCODE_CACHE.move_to_end(cache_key)
+                return encoded_image
+
+    encode_function = _IMAGE_ENCODERS[image_format][1]
+    encoded_image = encode_function(input_image, reverse_channel, _ENCODER_SETTINGS)
+
+    if cache_key is not None:
+        with _ENCODE_CACHE_LOCK:
+            if cache_key not in _ENCODE_CACHE:
+                _ENCODE_CACHE[cache_key] = encoded_image
+                _ENCODE_CACHE_SIZE['current_size'] += len(encoded_image)
+            # Removing the least recently used images over the budget
+            while _ENCODE_CACHE and \
+                  _ENCODE_CACHE_SIZE['current_size'] > _ENCODER_SETTINGS['cache_size']:
+                _, removed_image = _ENCODE_CACHE.popitem(last=False)
+                _ENCODE_CACHE_SIZE['current_size'] -= len(removed_image)
+    return encoded_image
+
+def clear_image_encode_cache() -> None:
+    """Removes every cached encoded image"""
+    with _ENCODE_CACHE_LOCK:
+        _ENCODE_CACHE.clear()
+        _ENCODE_CACHE_SIZE['current_size'] = 0
+
+def _get_format(image_format:str) -> str:
+    """Gets the registered name of a format, None is the response format
+
+    Raises:
+        KeyError: If the format has no registered encoder
+    """
+    if image_format is None:
+        return _ENCODER_SETTINGS['response_format']
+    image_format = image_format.lower()
+    if image_format not in _IMAGE_ENCODERS:
+        raise KeyError(f"No image encoder registered for {image_format}")
+    return image_format
+
+def _encode_png(input_image:np.ndarray,
+                reverse_channel:bool,
+                settings:dict) -> bytes:
+    """Encodes a PNG with OpenCV, the sub filter at a low zlib level is
+    about as fast as the default settings with much smaller output"""
+    # OpenCV only writes BGR so RGB images are swapped, a small cost next to zlib
+    if reverse_channel:
+        input_image = cv2.cvtColor(input_image, cv2.COLOR_RGB2BGR)
+    return cv2.imencode('.png', input_image,
+                        [cv2.IMWRITE_PNG_COMPRESSION, settings['png_compression'],
+                         cv2.IMWRITE_PNG_FILTER, cv2.IMWRITE_PNG_FILTER_SUB])[1].tobytes()
+
+def _encode_webp(input_image:np.ndarray,
+                 reverse_channel:bool,
+                 settings:dict) -> bytes:
+    """Encodes a lossless WebP with Pillow straight from the array"""
+    webp_buffer = io.BytesIO()
+    _as_pil_image(input_image, reverse_channel).save(webp_buffer, 'WEBP', lossless=True,
+                                                     quality=0, method=settings['webp_method'])
+    return webp_buffer.getvalue()
+
+def _encode_jpeg(input_image:np.ndarray,
+                 reverse_channel:bool,
+                 settings:dict) -> bytes:
+    """Encodes a JPEG with Pillow straight from the array, lossy so
+    only meant for previews"""
+    jpeg_buffer = io.BytesIO()
+    _as_pil_image(input_image, reverse_channel).save(jpeg_buffer, 'JPEG',
+                                                     quality=settings['jpeg_quality'])
+    return jpeg_buffer.getvalue()
+
+def _as_pil_image(input_image:np.ndarray,
+                  reverse_channel:bool) -> Image.Image:
+    """Wraps a 3 channel uint8 array as a Pillow image without copying,
+    BGR arrays are unpacked in channel order by Pillow"""
+    input_image = np.ascontiguousarray(input_image, dtype=np.uint8)
+    height, width = input_image.shape[:2]
+    return Image.frombuffer('RGB', (width, height), input_image, 'raw',
+                            'RGB' if reverse_channel else 'BGR', 0, 1)
+
+register_image_encoder('png', 'image/png', _encode_png)
+register_image_encoder('webp', 'image/webp', _encode_webp)
+register_image_encoder('jpeg', 'image/jpeg', _encode_jpeg)
@@ -4,11 +4,12 @@ from ._rescale_intensity import rescale_intensity
 from ._resize_image import resize_image
 from ._crop_rotate import crop_rotate_image
 from ._pad import pad_image
-from ._quantize import quantize_image
+from ._quantize import quantize_image, clear_palette_cache
 from ._adjust_light import equalize_image
 from ._contrast import stretch_image_contrast
 
 __all__ = ['rescale_intensity', 'resize_image',
            'crop_rotate_image','pad_image',
-           'quantize_image','equalize_image',
+           'quantize_image','clear_palette_cache',
+           'equalize_image',
            'stretch_image_contrast']
\ No newline at end of file
@@ -1,24 +1,39 @@
 """Image Processing Submodule for reducing or quantizing the number of colors
 in an image color pallete"""
 # Python Standard Library Imports
+import threading
 import traceback
+from collections import OrderedDict
 
 # Python Third Party Imports
 import numpy as np
 from PIL import Image
-from sklearn.cluster import KMeans
+from scipy.spatial import cKDTree
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.utils import shuffle
-from sklearn.metrics import pairwise_distances_argmin
 
 # Local Library Imports
 from ..transform import rescale_intensity
 from ..analysis import get_dtype_range
 
-__all__ = ['quantize_image']
+__all__ = ['quantize_image', 'clear_palette_cache']
+
+# Amount of pixels sampled to fit the kmeans palette
+KMEANS_SAMPLE_SIZE = 10_000
+
+# Bins per channel of the color cube used to map pixels to the palette
+PALETTE_LUT_BINS = 64
+
+# Amount of fitted palettes kept for warm starting
+PALETTE_CACHE_SIZE = 128
+
+_PALETTE_CACHE = OrderedDict()
+_PALETTE_CACHE_LOCK = threading.Lock()
 
 def quantize_image(input_image:np.ndarray,
                    method:int=2,
-                   n_colors:int=64) -> np.ndarray:
+                   n_colors:int=64,
+                   palette_key=None) -> np.ndarray:
     """Function to reduce or quantize the number of distinct colors in an image
 
     Args:
@@ -28,6 +43,9 @@ def quantize_image(input_image:np.ndarray,
                 2:Kmeans quantization
                 3:Random sample reduction
         n_colors (int, optional): Number of colors to reduce to. Defaults to 64.
+        palette_key (hashable, optional): Key of the kmeans palette cache, the
+        palette fitted for the same key is used to warm start the next fit.
+        Defaults to None.
 
     Raises:
         TypeError: If input is not np.ndarray
@@ -49,7 +67,7 @@ def quantize_image(input_image:np.ndarray,
         if method == 1:
             input_image = _quantize_image_pil(input_image.copy(), n_colors)
         if method == 2:
-            input_image = _quantize_image_kmeans(input_image.copy(), n_colors)
+            input_image = _quantize_image_kmeans(input_image.copy(), n_colors, palette_key)
         if method == 3:
             input_image = _quantize_image_random(input_image.copy(), n_colors)
 
@@ -62,6 +80,11 @@ def quantize_image(input_image:np.ndarray,
         traceback.print_tb(error.__traceback__)
         return input_image
 
+def clear_palette_cache() -> None:
+    """Removes every cached kmeans palette"""
+    with _PALETTE_CACHE_LOCK:
+        _PALETTE_CACHE.clear()
+
 ### METHOD 1 ###
 def _quantize_image_pil(input_image:np.ndarray,
                         n_colors:int) -> np.ndarray:
@@ -103,8 +126,10 @@ def _quantize_image_pil(input_image:np.ndarray,
 
 ### METHOD 2 ###
 def _quantize_image_kmeans(input_image:np.ndarray,
-                           n_colors:int) -> np.ndarray:
-    """Function for quantizing image using KMeans Clustering"""
+                           n_colors:int,
+                           palette_key=None) -> np.ndarray:
+    """Function for quantizing image using Mini-Batch KMeans Clustering,
+    the fit is warm started from the cached palette of the same key"""
     # Confirming the dtype is a float before processing
     if not np.issubdtype(input_image.dtype, np.floating):
         input_image = rescale_intensity(input_image,
@@ -117,17 +142,30 @@ def _quantize_image_kmeans(input_image:np.ndarray,
     # Reshaping the data
     input_image = np.reshape(input_image, (width * height, depth))
 
-    # Creating Sample Data
-    image_sample = shuffle(input_image, random_state=0, n_samples=1_000)
-
-    # Fitting the model
-    model = KMeans(n_clusters=n_colors, random_state=0, n_init=10).fit(image_sample)
-
-    # Generate cluster points from our image
-    labels = model.predict(input_image)
-
-    # Recreating image from model and labels
-    input_image = _recreate_image(model.cluster_centers_, labels, width, height)
+    # Creating Sample Data, sampling with replacement avoids
+    # permuting every pixel of the image
+    sample_index = np.random.default_rng(0).integers(0, len(input_image),
+                                                     KMEANS_SAMPLE_SIZE)
+    image_sample = input_image[sample_index]
+
+    # Fitting the model, a cached palette of the same shape is
+    # close to the solution so a single initialization is enough
+    cache_key = None if palette_key is None else (palette_key, n_colors, depth)
+    palette = _get_cached_palette(cache_key)
+    if palette is not None:
+        model = MiniBatchKMeans(n_clusters=n_colors, init=palette, n_init=1,
+                                random_state=0, batch_size=1024)
+    else:
+        model = MiniBatchKMeans(n_clusters=n_colors, random_state=0, n_init=1,
+                                batch_size=1024)
+    palette = model.fit(image_sample).cluster_centers_.astype(input_image.dtype)
+    _set_cached_palette(cache_key, palette)
+
+    # Mapping every pixel to its closest palette color
+    labels = _get_palette_labels(input_image, palette)
+
+    # Recreating image from the palette and labels
+    input_image = _recreate_image(palette, labels, width, height)
 
     return input_image
 
@@ -148,17 +186,86 @@ def _quantize_image_random(input_image:np.ndarray,
     # Shuffle the data
     codebook_random = shuffle(input_image, random_state=0, n_samples=n_colors)
 
-    # Get the list of Dominant Colors randomly generated
-    labels_random = pairwise_distances_argmin(codebook_random, input_image, axis=0)
-
-    # Recreating the image from the random labels
-    input_image = _recreate_image(input_image, labels_random, width, height)
+    # Mapping every pixel to its closest random color
+    labels_random = _get_palette_labels(input_image, codebook_random)
 
     # Recreating the image from the random labels
-    input_image = codebook_random[labels_random].reshape(width, height, -1)
+    input_image = _recreate_image(codebook_random, labels_random, width, height)
 
     return input_image
 
+def _get_palette_labels(pixels:np.ndarray,
+                        palette:np.ndarray) -> np.ndarray:
+    """Finds the closest palette color of every pixel. Three channel
+    pixels are snapped to a color cube, the closest palette color of each
+    occupied cube cell is found once and the pixels gather their label
+    from that lookup table. Other channel counts query a KD-tree directly.
+
+    Args:
+        pixels (np.ndarray): Pixel array of shape (pixel count, channels)
+        palette (np.ndarray): Palette colors of shape (colors, channels)
+
+    Returns:
+        np.ndarray: The palette index of each pixel
+    """
+    palette_tree = cKDTree(palette)
+    if pixels.shape[1] != 3:
+        return palette_tree.query(pixels)[1]
+
+    # Snapping each channel to the bins of the color cube, the cube spans
+    # a strided sample of the pixels and the palette, pixels outside of
+    # it are snapped to the closest edge cell
+    cube_shape = (PALETTE_LUT_BINS,) * 3
+    cube_points = np.concatenate((pixels[::PALETTE_LUT_BINS], palette))
+    channel_minimum = cube_points.min(axis=0).astype(pixels.dtype)
+    channel_range = cube_points.max(axis=0) - channel_minimum
+    bin_scale = ((PALETTE_LUT_BINS - 1) /
+                 np.where(channel_range > 0, channel_range, 1)).astype(pixels.dtype)
+    cell_index = np.rint((pixels - channel_minimum) * bin_scale).astype(np.intp)
+    np.clip(cell_index, 0, PALETTE_LUT_BINS - 1, out=cell_index)
+    cell_code = np.ravel_multi_index(cell_index.T, cube_shape)
+
+    # Only the cells holding pixels need a palette lookup
+    occupied_cells = np.flatnonzero(np.bincount(cell_code, minlength=PALETTE_LUT_BINS**3))
+    cell_color = np.column_stack(np.unravel_index(occupied_cells, cube_shape)) / bin_scale \
+                 + channel_minimum
+    palette_lut = np.zeros(PALETTE_LUT_BINS**3, dtype=np.intp)
+    palette_lut[occupied_cells] = palette_tree.query(cell_color)[1]
+    return palette_lut[cell_code]
+
+def _get_cached_palette(cache_key) -> np.ndarray:
+    """Gets a cached palette and marks it as recently used
+
+    Args:
+        cache_key (hashable): Key of the palette, None disables the cache
+
+    Returns:
+        np.ndarray: The cached palette or None if it isn't cached
+    """
+    if cache_key is None:
+        return None
+    with _PALETTE_CACHE_LOCK:
+        palette = _PALETTE_CACHE.get(cache_key)
+        if palette is not None:
+            _PALETTE_CACHE.move_to_end(cache_key)
+        return palette
+
+def _set_cached_palette(cache_key, palette:np.ndarray) -> None:
+    """Caches a palette removing the least recently used palettes
+    once the cache is full
+
+    Args:
+        cache_key (hashable): Key of the palette, None disables the cache
+        palette (np.ndarray): The fitted palette
+    """
+    if cache_key is None:
+        return
+    with _PALETTE_CACHE_LOCK:
+        _PALETTE_CACHE[cache_key] = palette
+        _PALETTE_CACHE.move_to_end(cache_key)
+        while len(_PALETTE_CACHE) > PALETTE_CACHE_SIZE:
+            _PALETTE_CACHE.popitem(last=False)
+
 def _recreate_image(codebook,
                     labels,
                     width:int,
@@ -1,5 +1,7 @@
 # classxlib/label/__init__.py
 from ._get_label import get_unknown_label_from_research_field
 from ._remove_small_labels import remove_small_labels
+from ._batch_edit import resolve_label_edit, apply_label_edits
 
-__all__ = ['get_unknown_label_from_research_field', 'remove_small_labels']
\ No newline at end of file
+__all__ = ['get_unknown_label_from_research_field', 'remove_small_labels',
+           'resolve_label_edit', 'apply_label_edits']
\ No newline at end of file
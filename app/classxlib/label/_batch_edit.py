@@ -0,0 +1,119 @@
+"""Submodule for applying a batch of label edits to a segment image,
+clicks, segment numbers, brush strokes and lasso selections are
+resolved against the segment raster and applied in memory"""
+
+# Python Standard Library Imports
+import traceback
+
+# Python Third Party Imports
+import cv2
+import numpy as np
+
+__all__ = ['resolve_label_edit', 'apply_label_edits']
+
+def resolve_label_edit(segment_image:np.ndarray,
+                       label_edit:dict,
+                       scale:float=1.0) -> np.ndarray:
+    """Gets the segment numbers selected by one label edit
+
+    Args:
+        segment_image (np.ndarray): The segment image mask
+        label_edit (dict): The edit, one of
+            -{'segment_id': n} a segment number
+            -{'x': x, 'y': y} a click location
+            -{'brush': [[x, y], ...], 'radius': r} a brush stroke
+            -{'polygon': [[x, y], ...]} a lasso selection
+        scale (float, optional): Factor from the display coordinates
+        to the segment image coordinates. Defaults to 1.0.
+
+    Raises:
+        ValueError: If the edit has no selection or is malformed
+
+    Returns:
+        np.ndarray: The unique segment numbers of the selection
+    """
+    height, width = segment_image.shape
+
+    if label_edit.get('segment_id') is not None:
+        return np.array([int(label_edit['segment_id'])])
+
+    if label_edit.get('x') is not None and label_edit.get('y') is not None:
+        # Same rounding as the single click endpoint
+        location_x = min(max(int(scale * float(label_edit['x'])), 0), width - 1)
+        location_y = min(max(int(scale * float(label_edit['y'])), 0), height - 1)
+        return np.array([int(segment_image[location_y, location_x])])
+
+    if label_edit.get('brush') is not None or label_edit.get('polygon') is not None:
+        selection_mask = np.zeros((height, width), dtype=np.uint8)
+        if label_edit.get('polygon') is not None:
+            points = _scale_points(label_edit['polygon'], scale)
+            cv2.fillPoly(selection_mask, [points], 1)
+        else:
+            points = _scale_points(label_edit['brush'], scale)
+            radius = max(int(round(scale * float(label_edit.get('radius', 1)))), 1)
+            cv2.polylines(selection_mask, [points], False, 1, thickness=2 * radius)
+            for point_x, point_y in points:
+                cv2.circle(selection_mask, (int(point_x), int(point_y)), radius, 1, thickness=-1)
+        return np.unique(segment_image[selection_mask.view(bool)])
+
+    raise ValueError("label edit needs a segment_id, x and y, brush or polygon")
+
+def apply_label_edits(segment_image:np.ndarray,
+                      segment_info:np.ndarray,
+                      label_edit_list:list,
+                      allowed_label_ids:set=None,
+                      scale:float=1.0) -> int:
+    """Applies label edits in order to the segment info in memory, a
+    later edit overrides an earlier one for the same segment
+
+    Args:
+        segment_image (np.ndarray): The segment image mask
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area), edited in place
+        label_edit_list (list): The edits, each a dict with a label_id and
+        a selection as described in resolve_label_edit
+        allowed_label_ids (set, optional): Label ids the edits may use.
+        Defaults to None which allows any label id.
+        scale (float, optional): Factor from the display coordinates
+        to the segment image coordinates. Defaults to 1.0.
+
+    Returns:
+        int: The number of segment rows changed or None if an edit is invalid
+    """
+    try:
+        previous_labels = segment_info[:,1].copy()
+        segment_count = len(segment_info)
+        for label_edit in label_edit_list:
+            label_id = int(label_edit['label_id'])
+            if allowed_label_ids is not None and label_id not in allowed_label_ids:
+                raise ValueError(f"label id {label_id} is not in the research field")
+
+            segment_numbers = resolve_label_edit(segment_image, label_edit, scale)
+
+            # Segment number n is stored on row n-1 of the segment info
+            segment_rows = segment_numbers.astype(np.int64) - 1
+            segment_rows = segment_rows[(segment_rows >= 0) & (segment_rows < segment_count)]
+            segment_info[segment_rows, 1] = label_id
+        return int(np.count_nonzero(previous_labels != segment_info[:,1]))
+    except (KeyError, TypeError, ValueError,
+            IndexError, cv2.error) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def _scale_points(point_list:list,
+                  scale:float) -> np.ndarray:
+    """Scales display coordinates to segment image pixel coordinates
+
+    Args:
+        point_list (list): List of [x, y] points
+        scale (float): Factor from the display coordinates to the segment
+        image coordinates
+
+    Returns:
+        np.ndarray: Array of int32 points of shape (N, 2) for OpenCV
+    """
+    points = np.asarray(point_list, dtype=np.float64).reshape(-1, 2) * scale
+    if len(points) == 0:
+        raise ValueError("selection needs at least one point")
+    return np.round(points).astype(np.int32)
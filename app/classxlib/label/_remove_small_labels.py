@@ -7,10 +7,7 @@ import numpy as np
 
 # Python Third Party Imports
 from flask import make_response
-from skimage import morphology
-
-# Local imports
-from classxlib.train._export import _create_sub_masks, extract_label_mask_from_image
+from scipy import ndimage
 
 __all__ = ['remove_small_labels']
 
@@ -19,48 +16,68 @@ def remove_small_labels(segment_image:np.ndarray,
                         unique_label_ids:list[int],
                         area_removal_percentage:float,
                         unknown_label_id:int) -> np.ndarray:
-    """_summary_
+    """Relabels segments inside small holes of a label to that label.
+    A hole of a label is a 4-connected region of pixels without that
+    label smaller than the area threshold. Labels are processed in the
+    order of unique_label_ids and each sees the relabeling of the labels
+    before it, so where holes of several labels overlap the last label wins.
 
     Args:
-        segment_image (np.ndarray): _description_
-        segment_info (np.ndarray): _description_
-        unique_label_ids (list[int]): _description_
-        area_removal_percentage (float): _description_
-        unknown_label_id (int): _description_
+        segment_image (np.ndarray): The segment mask should be single channel
+        segment_info (np.ndarray): Segment label information stored
+        in an array with each row as (segment_number, segment_label_id, segment_area)
+        unique_label_ids (list[int]): Label ids to remove holes from, 0 is skipped
+        area_removal_percentage (float): Fraction of the image area below
+        which a hole is removed
+        unknown_label_id (int): The id of the "unknown" label which is never
+        used to fill holes
 
     Returns:
-        np.ndarray: _description_
+        np.ndarray: The updated segment info
     """
     try:
         print("SMALL LABEL REMOVAL USED")
-        label_mask = extract_label_mask_from_image(segment_image, segment_info, unique_label_ids, unknown_label_id, False)
-        sub_masks = _create_sub_masks(label_mask, unique_label_ids)
         image_area = segment_image.shape[0] * segment_image.shape[1]
         area_removal_threshold = int(image_area * area_removal_percentage)
-        
-        for label_id in sub_masks.keys():
-            sub_mask = np.zeros(label_mask.shape, dtype=bool)
-            if label_id == 0: # Change to unknown label id
-                continue
-            
-            sub_mask[label_mask == label_id] = True
-            #sub_mask:np.ndarray = sub_masks[label_id]            
-            #sub_mask = sub_mask.astype(np.uint8)
-            new_sub_mask = morphology.remove_small_holes(np.copy(sub_mask), area_removal_threshold)
-            
-            #print(sub_mask[sub_mask != new_sub_mask])
-            segment_update = np.unique(np.where(sub_mask != new_sub_mask, segment_image, 0)).tolist()
-            segment_update.pop(0)
-            
-            for segment_number in segment_update:
-                segment_info[segment_number-1][1] = label_id
-                
-                #segment_info[:, 1] = np.where(segment_info[:,0] == segment, label_id, segment_info[:,1])
-            label_mask = extract_label_mask_from_image(segment_image, segment_info, unique_label_ids, unknown_label_id, False)
+
+        # Label of every segment number, labels that aren't removed from
+        # are background the same as unlabeled segments
+        segment_count = int(max(np.amax(segment_image), np.amax(segment_info[:,0]))) + 1
+        hole_label_ids = [label_id for label_id in dict.fromkeys(unique_label_ids)
+                          if label_id not in (0, unknown_label_id)]
+        segment_labels = np.zeros(segment_count, dtype=np.int64)
+        segment_labels[segment_info[:,0].astype(np.intp)] = np.where(
+            np.isin(segment_info[:,1], hole_label_ids), segment_info[:,1], 0)
+        segment_pixels = segment_image.ravel()
+
+        # New label of every segment, 0 where the segment isn't in a hole
+        segment_update = np.zeros(segment_count, dtype=np.int64)
+        for label_id in hole_label_ids:
+            # Connected regions without the label on the current labels,
+            # the default structure is the 4-connectivity remove_small_holes uses
+            hole_components, _ = ndimage.label(segment_labels[segment_image] != label_id)
+            component_areas = np.bincount(hole_components.ravel())
+            is_small_hole = component_areas < area_removal_threshold
+            is_small_hole[0] = False
+
+            # A segment can be split over several regions when it isn't
+            # 4-connected, any of its pixels in a small hole relabels it
+            in_small_hole = np.bincount(segment_pixels,
+                                        weights=is_small_hole[hole_components].ravel(),
+                                        minlength=segment_count) > 0
+            in_small_hole[0] = False
+            segment_labels[in_small_hole] = label_id
+            segment_update[in_small_hole] = label_id
+
+        # Segment number n is stored on row n-1 of the segment info
+        updated_segments = np.flatnonzero(segment_update)
+        updated_rows = updated_segments - 1
+        in_range = (updated_rows >= 0) & (updated_rows < len(segment_info))
+        segment_info[updated_rows[in_range], 1] = segment_update[updated_segments[in_range]]
     except (ValueError, IndexError,
             TypeError, RuntimeError,
             RuntimeWarning) as error:
         print(error)
         traceback.print_tb(error.__traceback__)
         return make_response(('',500, {'error': "Couldn't remove small holes."}))
-    return segment_info
\ No newline at end of file
+    return segment_info
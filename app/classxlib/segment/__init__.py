@@ -2,12 +2,48 @@
 
 from . import algorithm
 from . import process
-from ._run_segmentation import run_segmentation
+from ._run_segmentation import run_segmentation, run_segmentation_preview
 from ._write import write_segment_image,update_segment_image_info
-from ._read import read_segment_image
+from ._read import read_segment_image, read_segment_index, locate_segment
+from ._spatial_index import (build_segment_index, get_segment_neighbors,
+                             get_next_unlabeled_segment)
+from ._preprocess_cache import configure_preprocess_cache
+from ._preview_artifact import (configure_preview_artifacts, write_preview_artifact,
+                                read_preview_artifact, read_preview_artifact_b64,
+                                read_preview_artifact_image,
+                                promote_preview_artifact, delete_preview_artifact,
+                                expire_preview_artifacts)
+from ._segment_cache import (configure_segment_cache, read_cached_segment_image,
+                             read_cached_marked_image, read_cached_segment_index,
+                             read_cached_label_histogram, update_cached_segment_info,
+                             clear_segment_cache)
+from ._label_histogram import (build_label_histogram, get_histogram_segment_count,
+                               get_label_class_list, get_label_areas)
 from ._segment_count import get_image_segment_count, get_labeled_segment_count
+from ._label_journal import (configure_label_journal, compact_label_journal,
+                             delete_label_journal)
+from ._label_state import (encode_segment_raster, get_segment_label_state,
+                           get_label_delta, clear_segment_raster_cache)
 
 __all__ = ['algorithm','process',
-           'run_segmentation','write_segment_image',
+           'run_segmentation','run_segmentation_preview',
+           'write_segment_image',
            'update_segment_image_info','read_segment_image',
-           'get_image_segment_count','get_labeled_segment_count']
\ No newline at end of file
+           'get_image_segment_count','get_labeled_segment_count',
+           'configure_preprocess_cache','configure_preview_artifacts',
+           'write_preview_artifact','read_preview_artifact',
+           'read_preview_artifact_b64','read_preview_artifact_image',
+           'promote_preview_artifact',
+           'delete_preview_artifact','expire_preview_artifacts',
+           'configure_segment_cache','read_cached_segment_image',
+           'read_cached_marked_image','update_cached_segment_info',
+           'clear_segment_cache','encode_segment_raster',
+           'get_segment_label_state','get_label_delta',
+           'clear_segment_raster_cache','configure_label_journal',
+           'compact_label_journal','delete_label_journal',
+           'build_segment_index','read_segment_index',
+           'read_cached_segment_index','locate_segment',
+           'get_segment_neighbors','get_next_unlabeled_segment',
+           'read_cached_label_histogram','build_label_histogram',
+           'get_histogram_segment_count','get_label_class_list',
+           'get_label_areas']
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Submodule for the label histogram of a segment image, the number of
+segments and pixels of every label. The histogram is stored with the
+segment info and kept up to date by applying each label edit as a
+delta so labeling responses don't rescan the segment info."""
+
+# Python Third Party Imports
+import numpy as np
+import h5py
+
+__all__ = ['build_label_histogram', 'update_label_histogram',
+           'write_label_histogram', 'read_label_histogram', 'get_histogram_segment_count',
+           'get_label_class_list', 'get_label_areas']
+
+LABEL_HISTOGRAM_DATASET = "label_histogram"
+
+def build_label_histogram(segment_info:np.ndarray) -> dict:
+    """Counts the segments and pixels of every label
+
+    Args:
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+
+    Returns:
+        dict: The histogram with keys
+            -total_segments(int): Number of segments
+            -segment_counts(dict): Label id to its number of segments
+            -pixel_areas(dict): Label id to its number of pixels
+    """
+    label_ids, label_index = np.unique(segment_info[:,1], return_inverse=True)
+    segment_counts = np.bincount(label_index.ravel(), minlength=len(label_ids))
+    pixel_areas = np.bincount(label_index.ravel(), weights=segment_info[:,2],
+                              minlength=len(label_ids))
+    return {'total_segments': len(segment_info),
+            'segment_counts': dict(zip(label_ids.tolist(), segment_counts.tolist())),
+            'pixel_areas': dict(zip(label_ids.tolist(), pixel_areas.astype(np.int64).tolist()))}
+
+def update_label_histogram(label_histogram:dict,
+                           previous_labels:np.ndarray,
+                           new_labels:np.ndarray,
+                           segment_areas:np.ndarray) -> dict:
+    """Applies the label changes of some segments to a histogram in place
+
+    Args:
+        label_histogram (dict): Histogram from build_label_histogram
+        previous_labels (np.ndarray): Label ids of the changed segments before the edit
+        new_labels (np.ndarray): Label ids of the changed segments after the edit
+        segment_areas (np.ndarray): Pixel areas of the changed segments
+
+    Returns:
+        dict: The updated histogram
+    """
+    segment_counts = label_histogram['segment_counts']
+    pixel_areas = label_histogram['pixel_areas']
+    for previous_label, new_label, segment_area in zip(np.asarray(previous_labels).tolist(),
+                                                       np.asarray(new_labels).tolist(),
+                                                       np.asarray(segment_areas).tolist()):
+        if previous_label == new_label:
+            continue
+        segment_counts[previous_label] -= 1
+        pixel_areas[previous_label] -= segment_area
+        # Labels without segments are left out the same as a rebuilt histogram
+        if segment_counts[previous_label] == 0:
+            del segment_counts[previous_label]
+            del pixel_areas[previous_label]
+        segment_counts[new_label] = segment_counts.get(new_label, 0) + 1
+        pixel_areas[new_label] = pixel_areas.get(new_label, 0) + segment_area
+    return label_histogram
+
+def write_label_histogram(segment_h5_file:h5py.File,
+                          label_histogram:dict) -> None:
+    """Writes a histogram next to the segment info of an open segment
+    image file as rows of (label_id, segment_count, pixel_area)
+
+    Args:
+        segment_h5_file (h5py.File): Segment image file open for writing
+        label_histogram (dict): Histogram from build_label_histogram
+    """
+    label_ids = sorted(label_histogram['segment_counts'])
+    histogram_rows = np.array([(label_id,
+                                label_histogram['segment_counts'][label_id],
+                                label_histogram['pixel_areas'][label_id])
+                               for label_id in label_ids], dtype=np.int64).reshape(-1, 3)
+    if LABEL_HISTOGRAM_DATASET in segment_h5_file:
+        del segment_h5_file[LABEL_HISTOGRAM_DATASET]
+    segment_h5_file.create_dataset(name=LABEL_HISTOGRAM_DATASET, data=histogram_rows)
+
+def read_label_histogram(segment_h5_file:h5py.File,
+                         segment_info:np.ndarray) -> dict:
+    """Reads the histogram stored with the segment info of an open
+    segment image file
+
+    Args:
+        segment_h5_file (h5py.File): Segment image file open for reading
+        segment_info (np.ndarray): The segment info read from the same file
+
+    Returns:
+        dict: The histogram in the form of build_label_histogram or None
+        if the file has none, such as files written before histograms were
+        stored, or its totals don't match the segment info
+    """
+    if LABEL_HISTOGRAM_DATASET not in segment_h5_file:
+        return None
+    histogram_rows = np.asarray(segment_h5_file[LABEL_HISTOGRAM_DATASET][:], dtype=np.int64)
+    if histogram_rows.ndim != 2 or histogram_rows.shape[1] != 3:
+        return None
+    # A histogram written for another segment info is stale
+    if histogram_rows[:,1].sum() != len(segment_info) or \
+       histogram_rows[:,2].sum() != np.asarray(segment_info[:,2], dtype=np.int64).sum():
+        return None
+    label_ids = histogram_rows[:,0].tolist()
+    return {'total_segments': len(segment_info),
+            'segment_counts': dict(zip(label_ids, histogram_rows[:,1].tolist())),
+            'pixel_areas': dict(zip(label_ids, histogram_rows[:,2].tolist()))}
+
+def get_histogram_segment_count(label_histogram:dict) -> tuple:
+    """Counts the total, labeled, and unlabeled segments
+    from a label histogram
+
+    Args:
+        label_histogram (dict): Histogram from build_label_histogram
+
+    Returns:
+        tuple: The total, labeled and unlabeled segment counts
+    """
+    total_segment_count = label_histogram['total_segments']
+    unlabeled_segment_count = label_histogram['segment_counts'].get(0, 0)
+    labeled_segment_count = total_segment_count - unlabeled_segment_count
+
+    return total_segment_count, labeled_segment_count, unlabeled_segment_count
+
+def get_label_class_list(label_histogram:dict) -> list:
+    """Gets the segment count of every label
+
+    Args:
+        label_histogram (dict): Histogram from build_label_histogram
+
+    Returns:
+        list: [label_id, segment_count] pairs sorted by label id
+    """
+    return [[label_id, label_histogram['segment_counts'][label_id]]
+            for label_id in sorted(label_histogram['segment_counts'])]
+
+def get_label_areas(label_histogram:dict) -> dict:
+    """Gets the pixel area of every label
+
+    Args:
+        label_histogram (dict): Histogram from build_label_histogram
+
+    Returns:
+        dict: Label id to its number of pixels
+    """
+    return dict(sorted(label_histogram['pixel_areas'].items()))
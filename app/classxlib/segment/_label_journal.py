@@ -0,0 +1,371 @@
+"""Submodule for the append only journal of segment label edits.
+Label edits are appended to a small journal file next to the segment
+image file and replayed on read, the journal is compacted into the
+segment info of the segment image file once it grows large. Every
+access is guarded by a file lock on the journal."""
+
+# Python Standard Library Imports
+import os
+import time
+import zlib
+import struct
+import threading
+import traceback
+from contextlib import contextmanager
+
+# fcntl is only available on Unix, Windows locks with msvcrt instead
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Python Third Party Imports
+import numpy as np
+import h5py
+
+# Local Library Imports
+from ._write import update_segment_image_info
+
+__all__ = ['configure_label_journal', 'get_label_journal_path',
+           'label_journal_lock', 'read_label_journal_records',
+           'replay_label_records', 'append_label_edits',
+           'compact_label_journal', 'write_compacted_segment_info',
+           'delete_label_journal']
+
+JOURNAL_SUFFIX = '.journal'
+
+# Each append is one batch, a header of (magic, record count, crc32 of
+# the records) followed by the (segment_number, label_id) records. A batch
+# cut short by a crash fails the length or checksum and ends the replay.
+_BATCH_HEADER = struct.Struct('<4sII')
+_BATCH_MAGIC = b'CXLJ'
+_RECORD_DTYPE = np.dtype([('segment_number', '<u4'), ('label_id', '<u4')])
+
+_JOURNAL_SETTINGS = {'compact_size': 256 * 1024,
+                     'compact_callback': None,
+                     'reschedule_seconds': 60}
+_COMPACTION_SCHEDULED = {}
+_COMPACTION_LOCK = threading.Lock()
+
+def configure_label_journal(compact_size_kb:int=None,
+                            compact_callback=None) -> None:
+    """Sets when and how label journals are compacted
+
+    Args:
+        compact_size_kb (int, optional): Journal size in kilobytes that
+        triggers a compaction. Defaults to 256.
+        compact_callback (callable, optional): Called with the segment image
+        path to compact the journal in the background. Defaults to None
+        which compacts in the request that crossed the size.
+    """
+    if compact_size_kb is not None:
+        _JOURNAL_SETTINGS['compact_size'] = max(int(compact_size_kb), 1) * 1024
+    _JOURNAL_SETTINGS['compact_callback'] = compact_callback
+
+def get_label_journal_path(segment_image_path:str) -> str:
+    """Gets the path of the label journal of a segment image
+
+    Args:
+        segment_image_path (str): File path of the segment image
+
+    Returns:
+        str: File path of the journal
+    """
+    return segment_image_path + JOURNAL_SUFFIX
+
+@contextmanager
+def label_journal_lock(segment_image_path:str,
+                       exclusive:bool=False):
+    """Locks the label journal of a segment image, a shared lock lets
+    the segment image file and journal be read consistently and an
+    exclusive lock lets them be written
+
+    Args:
+        segment_image_path (str): File path of the segment image
+        exclusive (bool, optional): Takes the exclusive lock and creates
+        the journal if it doesn't exist. Defaults to False.
+
+    Yields:
+        file: The open journal file or None if there is no journal
+        and a shared lock was requested
+    """
+    journal_path = get_label_journal_path(segment_image_path)
+    try:
+        journal_file = open(journal_path, 'a+b' if exclusive else 'rb')
+    except FileNotFoundError:
+        if exclusive:
+            raise
+        yield None
+        return
+
+    try:
+        _lock_file(journal_file, exclusive)
+        yield journal_file
+    finally:
+        _unlock_file(journal_file)
+        journal_file.close()
+
+def _lock_file(journal_file,
+               exclusive:bool) -> None:
+    """Blocks until a lock on an open file is taken, on Windows the
+    lock is always exclusive since msvcrt has no shared locks"""
+    if fcntl is not None:
+        fcntl.flock(journal_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return
+    # msvcrt locks the bytes from the current position, the first byte
+    # stands for the whole file and may lie past the end of the file
+    journal_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(journal_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after 10 seconds, waiting on
+            continue
+
+def _unlock_file(journal_file) -> None:
+    """Releases the lock taken by _lock_file"""
+    if fcntl is not None:
+        fcntl.flock(journal_file.fileno(), fcntl.LOCK_UN)
+        return
+    journal_file.seek(0)
+    try:
+        msvcrt.locking(journal_file.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        # The lock was never taken because locking raised
+        pass
+
+def read_label_journal_records(journal_file,
+                               offset:int=0) -> tuple:
+    """Reads the complete batches of a locked journal from an offset
+
+    Args:
+        journal_file (file): The journal from label_journal_lock
+        offset (int, optional): Byte offset of the first batch. Defaults to 0.
+
+    Returns:
+        tuple: The structured array of (segment_number, label_id) records
+        in journal order and the byte offset after the last complete batch,
+        or (None, offset) if the offset is past the end of the journal
+    """
+    journal_file.seek(0, os.SEEK_END)
+    if journal_file.tell() < offset:
+        return None, offset
+    journal_file.seek(offset)
+    journal_bytes = journal_file.read()
+
+    record_list = []
+    position = 0
+    while position + _BATCH_HEADER.size <= len(journal_bytes):
+        magic, record_count, checksum = _BATCH_HEADER.unpack_from(journal_bytes, position)
+        record_end = position + _BATCH_HEADER.size + record_count * _RECORD_DTYPE.itemsize
+        if magic != _BATCH_MAGIC or record_end > len(journal_bytes):
+            break
+        record_bytes = journal_bytes[position + _BATCH_HEADER.size:record_end]
+        if zlib.crc32(record_bytes) != checksum:
+            break
+        record_list.append(np.frombuffer(record_bytes, dtype=_RECORD_DTYPE))
+        position = record_end
+
+    if record_list:
+        records = np.concatenate(record_list)
+    else:
+        records = np.empty(0, dtype=_RECORD_DTYPE)
+    return records, offset + position
+
+def replay_label_records(segment_info:np.ndarray,
+                         records:np.ndarray) -> np.ndarray:
+    """Applies journal records to a segment info in place, the last
+    record of a segment wins
+
+    Args:
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+        records (np.ndarray): Records from read_label_journal_records
+
+    Returns:
+        np.ndarray: The updated segment info
+    """
+    if len(records) == 0:
+        return segment_info
+    # Keeping only the last record of each segment
+    reversed_numbers = records['segment_number'][::-1]
+    segment_numbers, last_index = np.unique(reversed_numbers, return_index=True)
+    label_ids = records['label_id'][::-1][last_index]
+
+    # Segment number n is stored on row n-1 of the segment info
+    segment_rows = segment_numbers.astype(np.int64) - 1
+    in_range = (segment_rows >= 0) & (segment_rows < len(segment_info))
+    segment_info[segment_rows[in_range], 1] = label_ids[in_range]
+    return segment_info
+
+def append_label_edits(segment_image_path:str,
+                       segment_numbers:np.ndarray,
+                       label_ids:np.ndarray) -> tuple:
+    """Appends label edits to the journal of a segment image as one batch
+
+    Args:
+        segment_image_path (str): File path of the segment image
+        segment_numbers (np.ndarray): The edited segment numbers
+        label_ids (np.ndarray): The new label id of each segment
+
+    Returns:
+        tuple: The byte offsets of the journal before and after the batch
+        or None if the append failed
+    """
+    try:
+        records = np.empty(len(segment_numbers), dtype=_RECORD_DTYPE)
+        records['segment_number'] = segment_numbers
+        records['label_id'] = label_ids
+        record_bytes = records.tobytes()
+        batch_bytes = _BATCH_HEADER.pack(_BATCH_MAGIC, len(records),
+                                         zlib.crc32(record_bytes)) + record_bytes
+
+        with label_journal_lock(segment_image_path, exclusive=True) as journal_file:
+            journal_file.seek(0, os.SEEK_END)
+            start_offset = journal_file.tell()
+            journal_file.write(batch_bytes)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            end_offset = journal_file.tell()
+    except (OSError, TypeError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+    if end_offset >= _JOURNAL_SETTINGS['compact_size']:
+        _schedule_compaction(segment_image_path)
+    return start_offset, end_offset
+
+def compact_label_journal(segment_image_path:str,
+                          segment_info_dataset_name:str="segment_info") -> bool:
+    """Writes the journaled label edits into the segment info of the
+    segment image file and empties the journal
+
+    Args:
+        segment_image_path (str): File path of the segment image
+        segment_info_dataset_name (str, optional): Name of the dataset where
+        the segment label information is stored. Defaults to "segment_info".
+
+    Returns:
+        bool: Returns True if the journal is compacted or empty, False if an error occurs.
+    """
+    try:
+        if not os.path.exists(get_label_journal_path(segment_image_path)):
+            return True
+        with label_journal_lock(segment_image_path, exclusive=True) as journal_file:
+            records, _ = read_label_journal_records(journal_file)
+            if len(records) == 0:
+                journal_file.truncate(0)
+                return True
+            with h5py.File(segment_image_path, 'r') as segment_h5_file:
+                segment_info = segment_h5_file[segment_info_dataset_name][:]
+            replay_label_records(segment_info, records)
+            return _write_compacted_locked(journal_file, segment_image_path,
+                                           segment_info, segment_info_dataset_name)
+    except (OSError, RuntimeError,
+            KeyError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return False
+    finally:
+        with _COMPACTION_LOCK:
+            _COMPACTION_SCHEDULED.pop(segment_image_path, None)
+
+def write_compacted_segment_info(segment_info:np.ndarray,
+                                 segment_image_path:str,
+                                 segment_info_dataset_name:str="segment_info",
+                                 read_labels:np.ndarray=None) -> bool:
+    """Writes a whole segment info to the segment image file and empties
+    the journal, used when more than the labels changed. The journal is
+    replayed under the lock first so label edits other processes appended
+    since the segment info was read are kept.
+
+    Args:
+        segment_info (np.ndarray): The segment info to write
+        segment_image_path (str): File path of the segment image
+        segment_info_dataset_name (str, optional): Name of the dataset where
+        the segment label information is stored. Defaults to "segment_info".
+        read_labels (np.ndarray, optional): The labels the segment info was
+        read with, rows whose label wasn't changed from them take the saved
+        label. Defaults to None which writes every label as it is.
+
+    Returns:
+        bool: Returns True if write successful, False if an error occurs.
+    """
+    try:
+        with label_journal_lock(segment_image_path, exclusive=True) as journal_file:
+            if read_labels is not None and len(read_labels) == len(segment_info):
+                with h5py.File(segment_image_path, 'r') as segment_h5_file:
+                    saved_info = segment_h5_file[segment_info_dataset_name][:]
+                records, _ = read_label_journal_records(journal_file)
+                replay_label_records(saved_info, records)
+                # Only the same segments can take over the saved labels
+                if len(saved_info) == len(segment_info):
+                    segment_info = np.array(segment_info, copy=True)
+                    unchanged_rows = segment_info[:,1] == read_labels
+                    segment_info[unchanged_rows,1] = saved_info[unchanged_rows,1]
+            return _write_compacted_locked(journal_file, segment_image_path,
+                                           segment_info, segment_info_dataset_name)
+    except (OSError, RuntimeError,
+            KeyError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return False
+
+def delete_label_journal(segment_image_path:str) -> None:
+    """Removes the journal of a deleted segment image
+
+    Args:
+        segment_image_path (str): File path of the segment image
+    """
+    try:
+        os.remove(get_label_journal_path(segment_image_path))
+    except FileNotFoundError:
+        pass
+
+def _write_compacted_locked(journal_file,
+                            segment_image_path:str,
+                            segment_info:np.ndarray,
+                            segment_info_dataset_name:str) -> bool:
+    """Writes the segment info and empties the journal, the exclusive
+    journal lock must be held. A crash between the two steps is safe
+    since replaying the journal again gives the same labels.
+
+    Returns:
+        bool: Returns True if write successful, False if an error occurs.
+    """
+    if not update_segment_image_info(segment_info, segment_image_path,
+                                     segment_info_dataset_name):
+        return False
+    journal_file.truncate(0)
+    journal_file.flush()
+    os.fsync(journal_file.fileno())
+    return True
+
+def _schedule_compaction(segment_image_path:str) -> None:
+    """Compacts a journal that grew past the compaction size, through the
+    configured callback at most once per reschedule period or in place
+
+    Args:
+        segment_image_path (str): File path of the segment image
+    """
+    compact_callback = _JOURNAL_SETTINGS['compact_callback']
+    if compact_callback is None:
+        compact_label_journal(segment_image_path)
+        return
+
+    now = time.monotonic()
+    with _COMPACTION_LOCK:
+        scheduled_time = _COMPACTION_SCHEDULED.get(segment_image_path)
+        if scheduled_time is not None and \
+           now - scheduled_time < _JOURNAL_SETTINGS['reschedule_seconds']:
+            return
+        _COMPACTION_SCHEDULED[segment_image_path] = now
+    try:
+        compact_callback(segment_image_path)
+    except Exception as error: # pylint: disable=broad-except
+        # The broker may be down, the edits are safe in the journal
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
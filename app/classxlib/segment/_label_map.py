@@ -0,0 +1,61 @@
+"""Submodule for resolving equivalences between segment labels"""
+
+# Python Third Party Imports
+import numpy as np
+
+__all__ = ['flatten_label_map', 'resolve_label_equivalences']
+
+def flatten_label_map(parent_map:np.ndarray) -> np.ndarray:
+    """Flattens a union-find parent map so that every label
+    points directly at the root label of its set
+
+    Args:
+        parent_map (np.ndarray): 1D array where each index holds the
+        parent label of that label. Roots point to themselves.
+
+    Returns:
+        np.ndarray: Label lookup table mapping every label to its root
+    """
+    label_map = np.array(parent_map, copy=True)
+
+    # Pointer jumping, each pass halves the depth of every tree
+    while True:
+        root_map = label_map[label_map]
+        if np.array_equal(root_map, label_map):
+            return label_map
+        label_map = root_map
+
+def resolve_label_equivalences(label_pairs:np.ndarray,
+                               label_count:int) -> np.ndarray:
+    """Resolves a list of equivalent label pairs into a lookup table
+    that maps every label onto the smallest label of its equivalence set
+
+    Args:
+        label_pairs (np.ndarray): Array of shape (n, 2) where each row
+        is a pair of labels that belong to the same segment
+        label_count (int): The size of the label space, all labels
+        in label_pairs must be smaller than this value
+
+    Returns:
+        np.ndarray: Label lookup table of length label_count
+    """
+    parent_map = np.arange(label_count, dtype=np.int64)
+    label_pairs = np.asarray(label_pairs, dtype=np.int64).reshape(-1, 2)
+    if len(label_pairs) == 0:
+        return parent_map
+
+    first_labels, second_labels = label_pairs[:,0], label_pairs[:,1]
+
+    # Vectorized union-find, every pass links the larger root of each
+    # unresolved pair under the smaller root until all pairs share a root
+    while True:
+        first_roots = parent_map[first_labels]
+        second_roots = parent_map[second_labels]
+        unresolved = first_roots != second_roots
+        if not np.any(unresolved):
+            return parent_map
+
+        high_roots = np.maximum(first_roots[unresolved], second_roots[unresolved])
+        low_roots = np.minimum(first_roots[unresolved], second_roots[unresolved])
+        np.minimum.at(parent_map, high_roots, low_roots)
+        parent_map = flatten_label_map(parent_map)
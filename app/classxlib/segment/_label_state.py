@@ -0,0 +1,100 @@
+"""Submodule for the compact label state of a segment image, the segment
+raster is sent to the client once and label edits are sent as deltas so
+the client can composite the label overlay itself"""
+
+# Python Standard Library Imports
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Python Third Party Imports
+import numpy as np
+
+__all__ = ['encode_segment_raster', 'get_segment_label_state',
+           'get_label_delta', 'clear_segment_raster_cache']
+
+# Encoded rasters kept per process, the raster of a segment image
+# never changes so it is encoded once and reused for every request
+_RASTER_CACHE = OrderedDict()
+_RASTER_CACHE_LOCK = threading.Lock()
+RASTER_CACHE_ENTRIES = 32
+
+def encode_segment_raster(raster_key,
+                          segment_image:np.ndarray) -> dict:
+    """Encodes a segment image as a gzip compressed little endian
+    uint16 or uint32 raster with a content hash to use as ETag
+
+    Args:
+        raster_key (hashable): Key of the raster such as the segment image path
+        segment_image (np.ndarray): The segment image mask, the encoding is
+        reused while the same array is passed for the key
+
+    Returns:
+        dict: The encoded raster with keys
+            -etag(str): Hash of the raster contents
+            -dtype(str): uint16 or uint32
+            -height(int): Rows of the raster
+            -width(int): Columns of the raster
+            -data(bytes): The gzip compressed raster
+    """
+    with _RASTER_CACHE_LOCK:
+        cache_item = _RASTER_CACHE.get(raster_key)
+        if cache_item is not None and cache_item[0] is segment_image:
+            _RASTER_CACHE.move_to_end(raster_key)
+            return cache_item[1]
+
+    # The smallest type that holds every segment number
+    raster_dtype = np.dtype('<u2') if np.amax(segment_image) < 2**16 else np.dtype('<u4')
+    raster_bytes = np.ascontiguousarray(segment_image, dtype=raster_dtype).tobytes()
+    encoded_raster = {'etag': hashlib.blake2b(raster_bytes, digest_size=16).hexdigest(),
+                      'dtype': 'uint16' if raster_dtype.itemsize == 2 else 'uint32',
+                      'height': int(segment_image.shape[0]),
+                      'width': int(segment_image.shape[1]),
+                      'data': gzip.compress(raster_bytes, compresslevel=6)}
+
+    with _RASTER_CACHE_LOCK:
+        _RASTER_CACHE[raster_key] = (segment_image, encoded_raster)
+        _RASTER_CACHE.move_to_end(raster_key)
+        while len(_RASTER_CACHE) > RASTER_CACHE_ENTRIES:
+            _RASTER_CACHE.popitem(last=False)
+    return encoded_raster
+
+def get_segment_label_state(segment_info:np.ndarray) -> list:
+    """Gets the label of every segment number
+
+    Args:
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+
+    Returns:
+        list: The label id of each segment where index n is segment
+        number n, 0 for unlabeled segments
+    """
+    if len(segment_info) == 0:
+        return []
+    segment_labels = np.zeros(int(np.amax(segment_info[:,0])) + 1, dtype=np.int64)
+    segment_labels[segment_info[:,0].astype(np.intp)] = segment_info[:,1]
+    return segment_labels.tolist()
+
+def get_label_delta(previous_labels:np.ndarray,
+                    segment_info:np.ndarray) -> dict:
+    """Gets the segments whose label changed
+
+    Args:
+        previous_labels (np.ndarray): The label column of the segment
+        info before the edit
+        segment_info (np.ndarray): The segment info after the edit
+
+    Returns:
+        dict: Parallel lists of the changed segment numbers under
+        'segments' and their new label ids under 'labels'
+    """
+    changed_rows = np.flatnonzero(np.asarray(previous_labels) != segment_info[:,1])
+    return {'segments': segment_info[changed_rows,0].tolist(),
+            'labels': segment_info[changed_rows,1].tolist()}
+
+def clear_segment_raster_cache() -> None:
+    """Removes every encoded raster"""
+    with _RASTER_CACHE_LOCK:
+        _RASTER_CACHE.clear()
@@ -0,0 +1,171 @@
+"""Submodule for caching preprocessed images on local disk so
+that segmentation parameter changes skip preprocessing"""
+
+# Python Standard Library Imports
+import os
+import json
+import hashlib
+import tempfile
+import traceback
+
+# Python Third Party Imports
+import numpy as np
+
+__all__ = ['configure_preprocess_cache', 'get_preprocess_cache_key',
+           'read_preprocess_cache', 'write_preprocess_cache']
+
+# The parameters that change the output of preprocessing
+PREPROCESS_PARAMETER_LIST = ['light_adjustment_check', 'histogram_method',
+                             'contrast_stretch_check', 'color_cluster_check',
+                             'color_cluster_method', 'color_clusters']
+
+_CACHE_SETTINGS = {'cache_directory': os.path.join(tempfile.gettempdir(),
+                                                   'classx_preprocess_cache'),
+                   'max_size': 1024 * 1024 * 1024}
+
+def configure_preprocess_cache(cache_directory:str=None,
+                               max_size_mb:int=None) -> None:
+    """Sets the location and size limit of the preprocess cache
+
+    Args:
+        cache_directory (str, optional): Directory the cache files are stored in.
+        Defaults to a folder in the system temp directory.
+        max_size_mb (int, optional): The size in megabytes the cache is
+        trimmed to. A size of 0 disables the cache. Defaults to 1024.
+    """
+    if cache_directory:
+        _CACHE_SETTINGS['cache_directory'] = cache_directory
+    if max_size_mb is not None:
+        _CACHE_SETTINGS['max_size'] = max(int(max_size_mb), 0) * 1024 * 1024
+
+def get_preprocess_cache_key(parameter_dict:dict,
+                             image_path:str,
+                             h5_image_path:str=None) -> str:
+    """Creates the cache key of a preprocessed image from the crop
+    image id, the modification times of the source files and the
+    preprocessing parameters
+
+    Args:
+        parameter_dict (dict): Parameter dictionary
+        image_path (str): File path to the visualization image
+        h5_image_path (str, optional): Path to the original image data.
+        Defaults to None.
+
+    Returns:
+        str: The cache key or None if the image can't be cached
+    """
+    if _CACHE_SETTINGS['max_size'] == 0 or parameter_dict.get('crop_image_id') is None:
+        return None
+    try:
+        key_dict = {'crop_image_id': parameter_dict['crop_image_id'],
+                    'image_path': image_path,
+                    'image_mtime': os.path.getmtime(image_path),
+                    'h5_image_path': h5_image_path,
+                    'h5_image_mtime': os.path.getmtime(h5_image_path)
+                                      if h5_image_path is not None else None}
+        for parameter in PREPROCESS_PARAMETER_LIST:
+            key_dict[parameter] = parameter_dict.get(parameter)
+
+        # The histogram method is only used when adjusting light
+        if key_dict['light_adjustment_check'] != 1:
+            key_dict['histogram_method'] = None
+        # The cluster settings are only used when clustering colors
+        if key_dict['color_cluster_check'] != 1:
+            key_dict['color_cluster_method'] = None
+            key_dict['color_clusters'] = None
+
+        key_string = json.dumps(key_dict, sort_keys=True, default=str)
+        return hashlib.sha1(key_string.encode('utf-8')).hexdigest()
+    except (OSError, TypeError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def read_preprocess_cache(cache_key:str) -> np.ndarray:
+    """Reads a preprocessed image from the cache
+
+    Args:
+        cache_key (str): Key from get_preprocess_cache_key
+
+    Returns:
+        np.ndarray: The preprocessed image as a read only memory map
+        or None if the image is not cached
+    """
+    if cache_key is None:
+        return None
+    cache_path = _get_cache_path(cache_key)
+    try:
+        preprocessed_image = np.load(cache_path, mmap_mode='r')
+
+        # Updating the modification time to mark it as recently used
+        os.utime(cache_path)
+        return preprocessed_image
+    except (OSError, ValueError):
+        return None
+
+def write_preprocess_cache(cache_key:str,
+                           preprocessed_image:np.ndarray) -> bool:
+    """Writes a preprocessed image to the cache and trims the
+    least recently used files if the cache is over its size limit
+
+    Args:
+        cache_key (str): Key from get_preprocess_cache_key
+        preprocessed_image (np.ndarray): The preprocessed image
+
+    Returns:
+        bool: True if the image was cached
+    """
+    if cache_key is None or preprocessed_image is None:
+        return False
+    try:
+        os.makedirs(_CACHE_SETTINGS['cache_directory'], exist_ok=True)
+
+        # Writing to a temporary file first so other processes
+        # never read a partially written file
+        file_descriptor, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                                      dir=_CACHE_SETTINGS['cache_directory'])
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            np.save(temp_file, preprocessed_image)
+        os.replace(temp_path, _get_cache_path(cache_key))
+
+        _trim_preprocess_cache()
+        return True
+    except (OSError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return False
+
+def _get_cache_path(cache_key:str) -> str:
+    """Gets the file path of a cache key
+
+    Args:
+        cache_key (str): Key from get_preprocess_cache_key
+
+    Returns:
+        str: The path of the cache file
+    """
+    return os.path.join(_CACHE_SETTINGS['cache_directory'], cache_key + '.npy')
+
+def _trim_preprocess_cache() -> None:
+    """Removes the least recently used cache files
+    until the cache is within its size limit"""
+    cache_file_list = []
+    with os.scandir(_CACHE_SETTINGS['cache_directory']) as directory:
+        for entry in directory:
+            if not entry.name.endswith('.npy'):
+                continue
+            try:
+                file_stat = entry.stat()
+                cache_file_list.append((file_stat.st_mtime, file_stat.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+
+    cache_size = sum(file_size for _, file_size, _ in cache_file_list)
+    for _, file_size, file_path in sorted(cache_file_list):
+        if cache_size <= _CACHE_SETTINGS['max_size']:
+            break
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        cache_size -= file_size
@@ -0,0 +1,268 @@
+"""Submodule for storing segmentation previews on disk so that
+sessions only hold a short token instead of the image arrays"""
+
+# Python Standard Library Imports
+import os
+import re
+import time
+import base64
+import shutil
+import secrets
+import traceback
+from ctypes import c_uint32
+
+# Python Third Party Imports
+import cv2
+import numpy as np
+
+# Local Library Imports
+from ..image import (encode_image, get_image_mime_type,
+                     get_preview_image_format)
+from ._write import write_segment_image
+from ._read import read_segment_image
+
+__all__ = ['configure_preview_artifacts', 'write_preview_artifact',
+           'read_preview_artifact', 'read_preview_artifact_b64',
+           'read_preview_artifact_image',
+           'promote_preview_artifact', 'delete_preview_artifact',
+           'expire_preview_artifacts']
+
+# File names of the artifacts inside each token directory
+MARKED_IMAGE_FILENAME = "marked_image.png"
+SEGMENT_IMAGE_FILENAME = "segment_image.h5"
+# Stem of the copy of the marked image shown as preview when the
+# preview format isn't the PNG the marked image is saved as, the
+# file extension is the name of the preview format
+PREVIEW_IMAGE_STEM = "preview_image"
+
+# Tokens are url safe base64 strings
+_TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+_ARTIFACT_SETTINGS = {'artifact_directory': os.path.join('static', 'images',
+                                                         'preview_artifacts'),
+                      'ttl_seconds': 2 * 60 * 60,
+                      'max_size': 1024 * 1024 * 1024}
+
+def configure_preview_artifacts(artifact_directory:str=None,
+                                ttl_seconds:int=None,
+                                max_size_mb:int=None) -> None:
+    """Sets the location and expiry limits of the preview artifact store
+
+    Args:
+        artifact_directory (str, optional): Directory the previews are stored in.
+        Defaults to static/images/preview_artifacts.
+        ttl_seconds (int, optional): Seconds a preview is kept after its last use.
+        Defaults to 2 hours.
+        max_size_mb (int, optional): The size in megabytes the store is
+        trimmed to. Defaults to 1024.
+    """
+    if artifact_directory:
+        _ARTIFACT_SETTINGS['artifact_directory'] = artifact_directory
+    if ttl_seconds is not None:
+        _ARTIFACT_SETTINGS['ttl_seconds'] = max(int(ttl_seconds), 0)
+    if max_size_mb is not None:
+        _ARTIFACT_SETTINGS['max_size'] = max(int(max_size_mb), 0) * 1024 * 1024
+
+def write_preview_artifact(marked_image:np.ndarray,
+                           segment_image:np.ndarray) -> str:
+    """Writes a marked image and segment image to the preview store
+    in the same formats they are saved in
+
+    Args:
+        marked_image (np.ndarray): The marked boundary image
+        segment_image (np.ndarray): The segment image mask
+
+    Returns:
+        str: The token referencing the preview or None if writing failed
+    """
+    try:
+        # Clearing out expired previews before adding more
+        expire_preview_artifacts()
+
+        token = secrets.token_urlsafe(16)
+        token_directory = _get_token_directory(token)
+        os.makedirs(token_directory)
+
+        # The marked image is kept as PNG since it becomes the saved marked image
+        with open(os.path.join(token_directory, MARKED_IMAGE_FILENAME), 'wb') as png_file:
+            png_file.write(encode_image(marked_image, 'png'))
+
+        # Smaller lossy copy that is only shown as the preview
+        preview_format = get_preview_image_format()
+        if preview_format != 'png':
+            preview_filename = PREVIEW_IMAGE_STEM + "." + preview_format
+            with open(os.path.join(token_directory, preview_filename), 'wb') as preview_file:
+                preview_file.write(encode_image(marked_image, preview_format))
+
+        if not write_segment_image(segment_image=segment_image,
+                                   savepath=os.path.join(token_directory, SEGMENT_IMAGE_FILENAME),
+                                   datatype=c_uint32):
+            raise OSError("Failed writing the preview segment image")
+        return token
+    # pylint: disable=catching-non-exception
+    except (OSError, ValueError,
+            TypeError, cv2.error) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def read_preview_artifact(token:str) -> tuple:
+    """Reads the marked image and segment image of a preview
+
+    Args:
+        token (str): Token from write_preview_artifact
+
+    Returns:
+        tuple: Tuple of the marked image, segment image and segment info
+        or None if the preview doesn't exist
+    """
+    try:
+        token_directory = _get_token_directory(token)
+        marked_image = cv2.imread(os.path.join(token_directory, MARKED_IMAGE_FILENAME))
+        if marked_image is None:
+            raise FileNotFoundError(f"Preview {token} does not exist")
+        segment_image, segment_info = read_segment_image(os.path.join(token_directory,
+                                                                      SEGMENT_IMAGE_FILENAME))
+        _touch(token_directory)
+        return cv2.cvtColor(marked_image, cv2.COLOR_BGR2RGB), segment_image, segment_info
+    except (OSError, ValueError, TypeError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def read_preview_artifact_b64(token:str) -> str:
+    """Reads the already encoded preview image of a preview as base64
+
+    Args:
+        token (str): Token from write_preview_artifact
+
+    Returns:
+        str: Base64 encoded image or None if the preview doesn't exist
+    """
+    preview_image = read_preview_artifact_image(token)
+    return None if preview_image is None else preview_image[0]
+
+def read_preview_artifact_image(token:str) -> tuple:
+    """Reads the already encoded preview image of a preview as base64
+    along with its MIME type
+
+    Args:
+        token (str): Token from write_preview_artifact
+
+    Returns:
+        tuple: Base64 encoded image and its MIME type or None if the
+        preview doesn't exist
+    """
+    try:
+        token_directory = _get_token_directory(token)
+        image_path = os.path.join(token_directory, MARKED_IMAGE_FILENAME)
+        mime_type = get_image_mime_type('png')
+        # Previews written with another preview format have their own copy
+        for file_name in os.listdir(token_directory):
+            if file_name.startswith(PREVIEW_IMAGE_STEM + "."):
+                image_path = os.path.join(token_directory, file_name)
+                mime_type = get_image_mime_type(file_name[len(PREVIEW_IMAGE_STEM) + 1:])
+                break
+        with open(image_path, 'rb') as image_file:
+            image_bytes = image_file.read()
+        _touch(token_directory)
+        return base64.b64encode(image_bytes).decode('utf-8'), mime_type
+    except (OSError, ValueError, KeyError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def promote_preview_artifact(token:str,
+                             marked_image_savepath:str,
+                             segment_image_savepath:str) -> bool:
+    """Moves the files of a preview to their permanent save paths
+    and removes the preview from the store
+
+    Args:
+        token (str): Token from write_preview_artifact
+        marked_image_savepath (str): Path to move the marked image to
+        segment_image_savepath (str): Path to move the segment image to
+
+    Returns:
+        bool: True if the preview was moved
+    """
+    try:
+        token_directory = _get_token_directory(token)
+        shutil.move(os.path.join(token_directory, MARKED_IMAGE_FILENAME),
+                    marked_image_savepath)
+        shutil.move(os.path.join(token_directory, SEGMENT_IMAGE_FILENAME),
+                    segment_image_savepath)
+        shutil.rmtree(token_directory, ignore_errors=True)
+        return True
+    except (OSError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return False
+
+def delete_preview_artifact(token:str) -> None:
+    """Removes a preview from the store
+
+    Args:
+        token (str): Token from write_preview_artifact
+    """
+    try:
+        shutil.rmtree(_get_token_directory(token), ignore_errors=True)
+    except ValueError as error:
+        print("Error:", error)
+
+def expire_preview_artifacts() -> None:
+    """Removes previews unused for longer than the TTL and then the
+    least recently used previews until the store is within its size limit"""
+    artifact_directory = _ARTIFACT_SETTINGS['artifact_directory']
+    if not os.path.isdir(artifact_directory):
+        return
+
+    current_time = time.time()
+    artifact_list = []
+    with os.scandir(artifact_directory) as directory:
+        for entry in directory:
+            if not entry.is_dir() or not _TOKEN_PATTERN.match(entry.name):
+                continue
+            try:
+                last_used = entry.stat().st_mtime
+                if current_time - last_used > _ARTIFACT_SETTINGS['ttl_seconds']:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                artifact_size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                artifact_list.append((last_used, artifact_size, entry.path))
+            except FileNotFoundError:
+                continue
+
+    store_size = sum(artifact_size for _, artifact_size, _ in artifact_list)
+    for _, artifact_size, artifact_path in sorted(artifact_list):
+        if store_size <= _ARTIFACT_SETTINGS['max_size']:
+            break
+        shutil.rmtree(artifact_path, ignore_errors=True)
+        store_size -= artifact_size
+
+def _get_token_directory(token:str) -> str:
+    """Gets the directory of a preview token
+
+    Args:
+        token (str): Token from write_preview_artifact
+
+    Raises:
+        ValueError: If the token is not a valid token
+
+    Returns:
+        str: The directory holding the preview files
+    """
+    if not isinstance(token, str) or not _TOKEN_PATTERN.match(token):
+        raise ValueError("Invalid preview token")
+    return os.path.join(_ARTIFACT_SETTINGS['artifact_directory'], token)
+
+def _touch(token_directory:str) -> None:
+    """Marks a preview as recently used
+
+    Args:
+        token_directory (str): The directory holding the preview files
+    """
+    try:
+        os.utime(token_directory)
+    except OSError:
+        pass
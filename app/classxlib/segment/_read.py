@@ -1,6 +1,7 @@
 """Module for reading segment images into memory"""
 
 # Python Standard Library Imports
+import os
 import traceback
 from ctypes import c_uint32
 
@@ -10,12 +11,18 @@ import h5py
 
 # Local Library Imports
 from ..file import merge_directory
+from ._label_journal import (label_journal_lock, read_label_journal_records,
+                             replay_label_records)
+from ._label_histogram import read_label_histogram, update_label_histogram
+from ._spatial_index import (SEGMENT_INDEX_GROUP, SEGMENT_INDEX_VERSION,
+                             build_segment_index)
 
-__all__ = ['read_segment_image']
+__all__ = ['read_segment_image', 'read_segment_index', 'locate_segment']
 
 def read_segment_image(segment_image_path:str,
                        base_directory:str="") -> tuple[np.ndarray, np.ndarray]:
-    """Loads a segment image mask from a segment image object
+    """Loads a segment image mask from a segment image object, label
+    edits in the label journal are replayed onto the segment info
 
     Args:
         segment_image_path (str): File directory for the segment image
@@ -40,20 +47,136 @@ def read_segment_image(segment_image_path:str,
             # Formatting the path to the image
             segment_image_path = merge_directory(base_directory,segment_image_path)
 
+        segment_file = _read_segment_file(segment_image_path)
+        if segment_file is None:
+            return None
+        segment_image, segment_info, _, _, _ = segment_file
+        return segment_image, segment_info
+    except (OSError, RuntimeError,
+            ValueError, TypeError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def read_segment_index(segment_image_path:str) -> dict:
+    """Reads the spatial index of a segment image file, the index of a
+    file written before indexes were stored is built from its raster
+
+    Args:
+        segment_image_path (str): File path of the segment image
+
+    Returns:
+        dict: The index arrays from build_segment_index or None if
+        reading failed
+    """
+    try:
+        with label_journal_lock(segment_image_path):
+            with h5py.File(segment_image_path, 'r') as segment_h5_file:
+                index_group = segment_h5_file.get(SEGMENT_INDEX_GROUP)
+                if index_group is not None and \
+                   index_group.attrs.get('version') == SEGMENT_INDEX_VERSION:
+                    return {index_name: index_dataset[:]
+                            for index_name, index_dataset in index_group.items()}
+                segment_image = segment_h5_file['segment_data'][:]
+        return build_segment_index(segment_image)
+    except (OSError, RuntimeError,
+            KeyError, ValueError, TypeError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def locate_segment(segment_image_path:str,
+                   segment_index:dict,
+                   location_x:int,
+                   location_y:int,
+                   segment_image:np.ndarray=None) -> int:
+    """Gets the segment at a pixel, the segments are narrowed down with
+    the bounding boxes of the index and the raster is only read when
+    more than one bounding box holds the pixel
+
+    Args:
+        segment_image_path (str): File path of the segment image
+        segment_index (dict): Index of the segment image
+        location_x (int): Column of the pixel, clipped to the image
+        location_y (int): Row of the pixel, clipped to the image
+        segment_image (np.ndarray, optional): The segment image mask if it
+        is already in memory. Defaults to None which reads the pixel
+        from the file.
+
+    Returns:
+        int: The segment number or None if the pixel can't be read
+    """
+    bboxes = segment_index['bboxes']
+    if len(bboxes) == 0:
+        return None
+    location_x = min(max(int(location_x), 0), int(np.amax(bboxes[:, 3])) - 1)
+    location_y = min(max(int(location_y), 0), int(np.amax(bboxes[:, 2])) - 1)
+    candidate_rows = np.flatnonzero((bboxes[:, 0] <= location_y) & (location_y < bboxes[:, 2]) &
+                                    (bboxes[:, 1] <= location_x) & (location_x < bboxes[:, 3]))
+    # Segment number n is stored on row n-1 of the index
+    if len(candidate_rows) == 1:
+        return int(candidate_rows[0]) + 1
+    if segment_image is not None:
+        return int(segment_image[location_y, location_x])
+
+    # Overlapping boxes, reading the single pixel window of the raster
+    try:
+        with label_journal_lock(segment_image_path):
+            with h5py.File(segment_image_path, 'r') as segment_h5_file:
+                return int(segment_h5_file['segment_data'][location_y, location_x])
+    except (OSError, RuntimeError,
+            KeyError, ValueError, IndexError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def _read_segment_file(segment_image_path:str) -> tuple:
+    """Reads a segment image file and replays its label journal while
+    holding the shared journal lock
+
+    Args:
+        segment_image_path (str): File path of the segment image
+
+    Returns:
+        tuple: The segment image, segment info, stat of the segment image
+        file, the journal offset that was replayed up to and the stored
+        label histogram with the journal applied or None if the file has
+        no usable histogram, or None if reading failed
+    """
+    try:
         # Legacy Loading
         if segment_image_path.endswith(".txt"):
             # Loading the mask
             segment_image = np.loadtxt(segment_image_path)
-        elif segment_image_path.endswith(".h5"):
-            h5_file = h5py.File(segment_image_path, 'r')
-            segment_image = h5_file['segment_data'][:]
-            # Converting the datatype to ensure consistent processing
-            segment_image = np.ndarray.astype(segment_image, c_uint32)
-            segment_info = h5_file['segment_info'][:]
+            return segment_image, None, os.stat(segment_image_path), 0, None
 
-        return segment_image, segment_info
+        with label_journal_lock(segment_image_path) as journal_file:
+            file_stat = os.stat(segment_image_path)
+            with h5py.File(segment_image_path, 'r') as h5_file:
+                segment_image = h5_file['segment_data'][:]
+                # Converting the datatype to ensure consistent processing
+                segment_image = np.ndarray.astype(segment_image, c_uint32)
+                segment_info = h5_file['segment_info'][:]
+                label_histogram = read_label_histogram(h5_file, segment_info)
+
+            # Replaying the label edits that weren't compacted yet
+            journal_offset = 0
+            if journal_file is not None:
+                records, journal_offset = read_label_journal_records(journal_file)
+                # Segment number n is stored on row n-1 of the segment info
+                segment_rows = np.unique(records['segment_number']).astype(np.int64) - 1
+                segment_rows = segment_rows[(segment_rows >= 0) &
+                                            (segment_rows < len(segment_info))]
+                previous_labels = segment_info[segment_rows,1].copy()
+                replay_label_records(segment_info, records)
+                if label_histogram is not None:
+                    update_label_histogram(label_histogram, previous_labels,
+                                           segment_info[segment_rows,1],
+                                           segment_info[segment_rows,2])
+
+        return segment_image, segment_info, file_stat, journal_offset, label_histogram
     except (OSError, RuntimeError,
-            ValueError, TypeError) as error:
+            KeyError, ValueError, TypeError) as error:
         print("Error:", error)
         traceback.print_tb(error.__traceback__)
         return None
@@ -1,8 +1,10 @@
 """Submodule for segmenting an image with preset parameters"""
 
 # Python Standard Library Imports
+import time
 import traceback
-from multiprocessing import Pool
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from ctypes import c_uint32
 
 # Python Third Party Imports
@@ -13,12 +15,17 @@ from skimage.util import img_as_float32
 from ..image import read_cv_image, read_hdf5_image
 from ..image.transform import (equalize_image, stretch_image_contrast,
                                           quantize_image)
+from ..utils import submit_task, gather_tasks, cancel_tasks
 from .algorithm import (watershed_transformation, slic_transformation,
                         quickshift_transformation, felzenszwalb_transformation)
 from .process import (mark_segment_boundaries, merge_segments,
                       remove_small_segments)
+from ._preprocess_cache import (get_preprocess_cache_key, read_preprocess_cache,
+                                write_preprocess_cache)
+from ._tile import (TILE_SIZE, TILE_HALO, generate_tiles,
+                    get_tile_label_offsets, stitch_tiles)
 
-__all__ = ['run_segmentation']
+__all__ = ['run_segmentation', 'run_segmentation_preview']
 
 def run_segmentation(image_path:str,
                      h5_image_path:str,
@@ -33,6 +40,82 @@ def run_segmentation(image_path:str,
     Returns:
         tuple: Tuple of marked image and segment image mask
     """
+    # Reading the visualization image and the image data to segment
+    image, h5_image = _read_segmentation_image(image_path=image_path,
+                                               h5_image_path=h5_image_path)
+
+    cache_key = get_preprocess_cache_key(parameter_dict=parameter_dict,
+                                         image_path=image_path,
+                                         h5_image_path=h5_image_path)
+
+    return _run_segmentation_branch(image=image,
+                                    h5_image=h5_image,
+                                    parameter_dict=parameter_dict,
+                                    preprocess_cache_key=cache_key)
+
+def run_segmentation_preview(image_path:str,
+                             h5_image_path:str,
+                             parameter_dict:dict,
+                             histogram_method_list:list,
+                             progress_callback=None) -> list:
+    """Function to segment an image once per histogram method,
+    the image is read and clipped once and every histogram method
+    branch is preprocessed and segmented concurrently
+
+    Args:
+        image_path (str): File path to the visualzation image
+        h5_image_path (str): Path to the original image data
+        parameter_dict (dict): Parameter dictionary
+        histogram_method_list (list): The histogram methods to segment with
+        progress_callback (callable, optional): Called from the branch threads
+        as progress_callback(histogram_method, stage, seconds) each time a
+        stage of a branch finishes. Defaults to None.
+
+    Returns:
+        list: List of marked image and segment image mask tuples
+        in the same order as the histogram methods
+    """
+    # Reading the visualization image and the image data to segment
+    image, h5_image = _read_segmentation_image(image_path=image_path,
+                                               h5_image_path=h5_image_path)
+
+    # Clipping is shared by all the branches so it's only done once
+    h5_image = np.clip(h5_image, -1, 1)
+
+    # Each branch runs in its own thread, the segmentation of each
+    # branch is handed off to the shared process pool
+    with ThreadPoolExecutor(max_workers=max(len(histogram_method_list), 1)) as thread_pool:
+        future_list = []
+        for histogram_method in histogram_method_list:
+            branch_parameter_dict = dict(parameter_dict, histogram_method=histogram_method)
+            cache_key = get_preprocess_cache_key(parameter_dict=branch_parameter_dict,
+                                                 image_path=image_path,
+                                                 h5_image_path=h5_image_path)
+            branch_callback = partial(progress_callback, histogram_method) \
+                              if progress_callback is not None else None
+            future_list.append(thread_pool.submit(_run_segmentation_branch,
+                                                  image=image,
+                                                  h5_image=h5_image,
+                                                  parameter_dict=branch_parameter_dict,
+                                                  clipped=True,
+                                                  use_process_pool=True,
+                                                  preprocess_cache_key=cache_key,
+                                                  progress_callback=branch_callback))
+        return [future.result() for future in future_list]
+
+def _read_segmentation_image(image_path:str,
+                             h5_image_path:str) -> tuple:
+    """Reads the visualization image and the image data used
+    for segmentation
+
+    Args:
+        image_path (str): File path to the visualzation image
+        h5_image_path (str): Path to the original image data
+
+    Returns:
+        tuple: Tuple of the visualization image and the
+        float image data to segment
+    """
     # Reading the visualization image
     image = read_cv_image(image_path)
 
@@ -58,42 +141,105 @@ def run_segmentation(image_path:str,
     if not np.issubdtype(h5_image.dtype, np.floating):
         h5_image = img_as_float32(h5_image)
 
-    # Pre-process the image data
-    preprocessed_image = _preprocess_image(input_image=np.copy(h5_image),
-                                           parameter_dict=parameter_dict)
+    return image, h5_image
+
+def _run_segmentation_branch(image:np.ndarray,
+                             h5_image:np.ndarray,
+                             parameter_dict:dict,
+                             clipped:bool=False,
+                             use_process_pool:bool=False,
+                             preprocess_cache_key:str=None,
+                             progress_callback=None) -> tuple:
+    """Preprocesses, segments and marks an image that
+    has already been read
+
+    Args:
+        image (np.ndarray): The visualization image
+        h5_image (np.ndarray): The float image data to segment
+        parameter_dict (dict): Parameter dictionary
+        clipped (bool, optional): If the image data is already
+        clipped to the -1 to 1 range. Defaults to False.
+        use_process_pool (bool, optional): Run a single segmentation on
+        the shared process pool instead of the calling thread. Defaults to False.
+        preprocess_cache_key (str, optional): Key of the preprocessed image
+        in the preprocess cache. Defaults to None.
+        progress_callback (callable, optional): Called as
+        progress_callback(stage, seconds) each time a stage finishes,
+        the stages are preprocess, segment, merge, small_removal, stitch
+        and boundary_marking. Defaults to None.
+
+    Returns:
+        tuple: Tuple of marked image and segment image mask
+    """
+    def report_stage(stage:str, seconds:float) -> None:
+        if progress_callback is not None:
+            progress_callback(stage, seconds)
+
+    # Pre-process the image data, reusing the cached result when only
+    # the segmentation parameters changed
+    stage_start = time.perf_counter()
+    preprocessed_image = read_preprocess_cache(preprocess_cache_key)
+    if preprocessed_image is None:
+        preprocessed_image = _preprocess_image(input_image=np.copy(h5_image),
+                                               parameter_dict=parameter_dict,
+                                               clipped=clipped)
+        write_preprocess_cache(preprocess_cache_key, preprocessed_image)
+    else:
+        preprocessed_image = np.array(preprocessed_image)
+    report_stage('preprocess', time.perf_counter() - stage_start)
 
-    # Process the segmentation & post processing for the image
+    # Process the segmentation & post processing for the image, the
+    # stage timings are measured where the work runs and reported after
+    stage_timings = {}
     if parameter_dict['multi_processing_check'] == 1:
         segment_image = _multi_process_segment_image(preprocessed_image=preprocessed_image,
-                                                     parameter_dict=parameter_dict)
+                                                     parameter_dict=parameter_dict,
+                                                     tile_size=parameter_dict.get('tile_size',
+                                                                                  TILE_SIZE),
+                                                     tile_halo=parameter_dict.get('tile_halo',
+                                                                                  TILE_HALO),
+                                                     stage_timings=stage_timings)
+    elif use_process_pool:
+        segment_image, stage_timings = gather_tasks([submit_task(_timed_process_segment_image,
+                                                                 preprocessed_image,
+                                                                 parameter_dict)])[0]
     else:
         segment_image = _process_segment_image(preprocessed_image=preprocessed_image,
-                                               parameter_dict=parameter_dict)
+                                               parameter_dict=parameter_dict,
+                                               stage_timings=stage_timings)
+    for stage, seconds in stage_timings.items():
+        report_stage(stage, seconds)
 
     # Marking the boundaries of the segment image
+    stage_start = time.perf_counter()
     marked_image = mark_segment_boundaries(input_image=image,
                                            segment_image=segment_image,
                                            light=parameter_dict['light'])
+    report_stage('boundary_marking', time.perf_counter() - stage_start)
 
     return marked_image, segment_image
 
 
 #### Preprocessing ####
 def _preprocess_image(input_image:np.ndarray,
-                      parameter_dict:dict) -> np.ndarray:
+                      parameter_dict:dict,
+                      clipped:bool=False) -> np.ndarray:
     """Preprocesses an image before segmentation
 
     Args:
         input_image (np.ndarray): An image array
         parameter_dict (dict): The parameter settings for
         preprocessing
+        clipped (bool, optional): If the image is already clipped
+        to the -1 to 1 range. Defaults to False.
 
     Returns:
         np.ndarray: preprocessed image array
     """
     try:
         # Clipping the image to the correct range
-        input_image = np.clip(input_image, -1, 1)
+        if not clipped:
+            input_image = np.clip(input_image, -1, 1)
 
         # Check for adjusting image light
         if parameter_dict['light_adjustment_check'] == 1:
@@ -107,9 +253,17 @@ def _preprocess_image(input_image:np.ndarray,
         # Check for reducing or quantizing the amount of
         # colors in an image
         if parameter_dict['color_cluster_check'] == 1:
+            # The palette of the same crop and light adjustment is
+            # reused to warm start the clustering
+            palette_key = (parameter_dict.get('crop_image_id'),
+                           parameter_dict['light_adjustment_check'],
+                           parameter_dict.get('histogram_method'),
+                           parameter_dict['contrast_stretch_check']) \
+                          if parameter_dict.get('crop_image_id') is not None else None
             input_image = quantize_image(input_image=input_image,
                                         method=parameter_dict['color_cluster_method'],
-                                        n_colors=parameter_dict['color_clusters'])
+                                        n_colors=parameter_dict['color_clusters'],
+                                        palette_key=palette_key)
         return input_image
     except (ValueError, TypeError,
             RuntimeError, RuntimeWarning) as error:
@@ -121,19 +275,24 @@ def _preprocess_image(input_image:np.ndarray,
 #### Processing/Segmentation ####
 def _process_segment_image(preprocessed_image:np.ndarray,
                            parameter_dict:dict,
-                           index:tuple=None) -> np.ndarray:
+                           index:int=None,
+                           stage_timings:dict=None) -> np.ndarray:
     """Processes the segmentation and
     post processing of the segment image
 
     Args:
         preprocessed_image (np.ndarray): The preprocessed image to segment
         parameter_dict (dict): Parameter data to use
-        index (tuple, optional): The mutliprocessing index only used
+        index (int, optional): The mutliprocessing tile index only used
         if multiprocessing is true. Defaults to None.
+        stage_timings (dict, optional): Dict the seconds spent in each
+        stage are added to. Defaults to None.
 
     Returns:
         np.ndarray: The segmented image mask
     """
+    stage_timings = {} if stage_timings is None else stage_timings
+    stage_start = time.perf_counter()
 
     # Segmenting image based off
     # which segment method id is set
@@ -162,117 +321,152 @@ def _process_segment_image(preprocessed_image:np.ndarray,
                                                     minimum_size=parameter_dict['parameter_2'],
                                                     gausian_kernal_size=parameter_dict['parameter_3']) #pylint: disable=line-too-long
 
+    _add_stage_time(stage_timings, 'segment', stage_start)
+
     # Post processing segments
     postprocessed_segment_image = _postprocess_segment_image(segment_image=segment_image,
                                                              preprocessed_image=preprocessed_image,
-                                                             parameter_dict=parameter_dict)
+                                                             parameter_dict=parameter_dict,
+                                                             stage_timings=stage_timings)
 
     # This is here because of the multiprocessing
     # If its a multiprocessing call we return the index of the
-    # grid portion that was being worked on
+    # tile that was being worked on
     if index is None:
         return postprocessed_segment_image
     return postprocessed_segment_image, index
 
+def _timed_process_segment_image(preprocessed_image:np.ndarray,
+                                 parameter_dict:dict,
+                                 index:int=None) -> tuple:
+    """Runs _process_segment_image and returns its stage timings,
+    used on the process pool where a timing dict can't be shared
+
+    Args:
+        preprocessed_image (np.ndarray): The preprocessed image to segment
+        parameter_dict (dict): Parameter data to use
+        index (int, optional): The mutliprocessing tile index. Defaults to None.
+
+    Returns:
+        tuple: Tuple of the _process_segment_image result and the stage timings
+    """
+    stage_timings = {}
+    result = _process_segment_image(preprocessed_image=preprocessed_image,
+                                    parameter_dict=parameter_dict,
+                                    index=index,
+                                    stage_timings=stage_timings)
+    return result, stage_timings
+
+def _add_stage_time(stage_timings:dict,
+                    stage:str,
+                    stage_start:float) -> None:
+    """Adds the seconds since stage_start to a stage timing
+
+    Args:
+        stage_timings (dict): Dict of seconds spent in each stage
+        stage (str): Name of the stage
+        stage_start (float): The time.perf_counter value the stage started at
+    """
+    stage_timings[stage] = stage_timings.get(stage, 0.0) + time.perf_counter() - stage_start
 
 def _multi_process_segment_image(preprocessed_image:np.ndarray,
-                                 parameter_dict:dict) -> np.ndarray:
+                                 parameter_dict:dict,
+                                 tile_size:int=TILE_SIZE,
+                                 tile_halo:int=TILE_HALO,
+                                 stage_timings:dict=None) -> np.ndarray:
     """function for utilizing multiprocessing on an
     segmenting an image array, does this by splitting the image into
-    multiple crops and running simultaneous segmentations
+    multiple overlapping tiles and running simultaneous segmentations on
+    the shared process pool, segments that continue across tile seams
+    are merged when stitching
 
     Args:
         preprocessed_image (np.ndarray): preprocessed image array
         parameter_dict (dict): settings for processing
+        tile_size (int, optional): The core size of each tile. Defaults to 256.
+        tile_halo (int, optional): The amount of pixels each tile overlaps
+        into its neighbors. Defaults to 32.
+        stage_timings (dict, optional): Dict the seconds spent in each stage
+        are added to, tile stages are summed over all tiles. Defaults to None.
 
     Returns:
         np.ndarray: The segmented image array
     """
-    # Crop size for the multi-processing
-    crop_size = 256
+    stage_timings = {} if stage_timings is None else stage_timings
+    # Splitting the image into tiles that cover every pixel
+    image_shape = preprocessed_image.shape[:2]
+    tile_list = generate_tiles(image_shape=image_shape,
+                               tile_size=tile_size,
+                               halo=tile_halo)
 
-    # Creating list to store the asynchronus process references in
-    process_list = []
-
-    # The index counts of the image
-    # functions like a grid index of which crop to work on
-    crop_index_count = (preprocessed_image.shape[1]//crop_size,
-                        preprocessed_image.shape[0]//crop_size)
-
-    # Process pool that handles all the processes running asynchronusly
-    with Pool(processes=10) as process_pool:
-
-        # looping through each index region
-        for x_index in range(crop_index_count[0]):
-            for y_index in range(crop_index_count[1]):
-                # x and y pixel spans of where to crop out an image
-                x_span = x_index * crop_size
-                y_span = y_index * crop_size
-
-                # Creating the asynchronus call
-                print("Starting process async",x_index, y_index)
-                async_process = process_pool.apply_async(_process_segment_image,
-                                                args=(preprocessed_image[y_span:y_span+crop_size,
-                                                                        x_span:x_span+crop_size],
-                                                    parameter_dict,
-                                                    (x_index,y_index)))
-
-                # Appending the reference to the process list
-                process_list.append(async_process)
-
-        # The segment image to apply all the asynchronus calls to
-        segment_image = np.zeros((preprocessed_image.shape[0],
-                                preprocessed_image.shape[1]),
-                                dtype=np.uint32)
-        # Retrieving all the processes after completion
-        for process in process_list:
-            # Retrieves the result of the process
-            # NOTE this will hold until the process is completed
-            crop_segment_image, (x_index,y_index) = process.get()
-            print("Process ID",x_index,y_index,"Complete")
-
-            # Recreating the x and y spans based off index retrieved
-            x_span = x_index * crop_size
-            y_span = y_index * crop_size
-
-            # Adding max of the crop image to the result
-            # This is because each image is processed separately so
-            # there are overlaps in segment ID numbers so we need to make
-            # sure overlaps are handled correctly
-            crop_segment_image += np.max(segment_image)
-            segment_image[y_span:y_span+crop_size,
-                        x_span:x_span+crop_size] = crop_segment_image
-        # This lets the class know there are no more processes to add
-        # after all processes are completed it will close.
-        process_pool.close()
+    # Precomputing the label offsets of each tile
+    label_offsets = get_tile_label_offsets(tile_list)
 
+    # Submitting each tile including its halo to the shared process pool
+    process_list = []
+    try:
+        for tile_index, (_, (y_start, y_end, x_start, x_end)) in enumerate(tile_list):
+            process_list.append(submit_task(_timed_process_segment_image,
+                                            preprocessed_image[y_start:y_end,
+                                                               x_start:x_end],
+                                            parameter_dict,
+                                            tile_index))
+    except (RuntimeError, OSError):
+        # Cancelling the queued tiles if the pool could not take them all
+        cancel_tasks(process_list)
+        raise
+
+    # Retrieving all the processes after completion
+    # NOTE this will hold until the processes are completed
+    tile_segment_list = [None] * len(tile_list)
+    for (tile_segment_image, tile_index), tile_timings in gather_tasks(process_list):
+        tile_segment_list[tile_index] = tile_segment_image
+        for stage, seconds in tile_timings.items():
+            stage_timings[stage] = stage_timings.get(stage, 0.0) + seconds
+
+    # Stitching the tiles together and merging segments across seams
+    stage_start = time.perf_counter()
+    segment_image = stitch_tiles(tile_list=tile_list,
+                                 tile_segment_list=tile_segment_list,
+                                 image_shape=image_shape,
+                                 label_offsets=label_offsets)
+    _add_stage_time(stage_timings, 'stitch', stage_start)
     return segment_image
 
 #### Postprocessing ####
 def _postprocess_segment_image(segment_image:np.ndarray,
                                preprocessed_image:np.ndarray,
-                               parameter_dict:dict) -> np.ndarray:
+                               parameter_dict:dict,
+                               stage_timings:dict=None) -> np.ndarray:
     """function for post-processing the segments in a segment image
 
     Args:
         segment_image (np.ndarray): Segment image mask
         preprocessed_image (np.ndarray): The image used for comparision
         parameter_dict (dict): The parameter settings
+        stage_timings (dict, optional): Dict the seconds spent in each
+        stage are added to. Defaults to None.
 
     Returns:
         np.ndarray: Returns post processed segment image
     """
+    stage_timings = {} if stage_timings is None else stage_timings
+
     # Region Merging Check
     if parameter_dict['region_merge_check'] == 1:
+        stage_start = time.perf_counter()
         segment_image = merge_segments(segment_image=segment_image,
                                     preprocessed_image=preprocessed_image,
                                     region_merge_method=parameter_dict['region_merge_method'],
                                     region_merge_threshold=parameter_dict['region_merge_threshold'])
+        _add_stage_time(stage_timings, 'merge', stage_start)
     # Small Feature removal check
     if parameter_dict['small_item_removal_check'] == 1:
+        stage_start = time.perf_counter()
         segment_image = remove_small_segments(segment_image=segment_image,
                                     preprocessed_image=preprocessed_image,
                                     size_removal_threshold=parameter_dict['small_item_removal_threshold'])
+        _add_stage_time(stage_timings, 'small_removal', stage_start)
     # Making sure the Segment ID minimum is 1 not 0
     segment_image = segment_image + 1 if np.min(segment_image) == 0 else segment_image
 
@@ -0,0 +1,435 @@
+"""Submodule for keeping recently used segment images and marked
+images in memory so labeling requests don't re-read them from disk.
+Label edits are appended to the label journal and edits appended by
+other processes are replayed onto the cached segment info."""
+
+# Python Standard Library Imports
+import os
+import threading
+import traceback
+from collections import OrderedDict
+
+# Python Third Party Imports
+import numpy as np
+
+# Local Library Imports
+from ..image import read_cv_image
+from ._read import _read_segment_file, read_segment_index
+from ._label_histogram import build_label_histogram, update_label_histogram
+from ._label_journal import (get_label_journal_path, label_journal_lock,
+                             read_label_journal_records, replay_label_records,
+                             append_label_edits, write_compacted_segment_info)
+
+__all__ = ['configure_segment_cache', 'read_cached_segment_image',
+           'read_cached_marked_image', 'read_cached_segment_index',
+           'read_cached_label_histogram', 'update_cached_segment_info',
+           'clear_segment_cache']
+
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_CACHE_SETTINGS = {'max_size': 256 * 1024 * 1024,
+                   'current_size': 0}
+
+def configure_segment_cache(max_size_mb:int=None) -> None:
+    """Sets the memory budget of the segment image cache of this process
+
+    Args:
+        max_size_mb (int, optional): The size in megabytes the cache is
+        trimmed to. A size of 0 disables the cache. Defaults to 256.
+    """
+    if max_size_mb is not None:
+        with _CACHE_LOCK:
+            _CACHE_SETTINGS['max_size'] = max(int(max_size_mb), 0) * 1024 * 1024
+            _trim_cache_locked()
+
+def read_cached_segment_image(segment_image_path:str) -> tuple:
+    """Reads a segment image and its segment info through the cache,
+    the cached copy is used while the file modification time and size
+    are unchanged
+
+    Args:
+        segment_image_path (str): File path of the segment image
+
+    Returns:
+        tuple: 2D Array of segment image mask and segment info or None if
+        reading failed. The segment image is shared by all requests and is
+        read only, the segment info is a copy that can be edited.
+    """
+    cache_entry = None
+    cache_item = _get_cache_entry(segment_image_path)
+    if cache_item is not None:
+        cache_entry = _replay_journal_tail(segment_image_path, cache_item)
+    if cache_entry is None:
+        segment_file = _read_segment_file(segment_image_path)
+        if segment_file is None:
+            return None
+        segment_image, segment_info, file_stat, journal_offset, label_histogram = segment_file
+        cache_entry = _set_cache_entry(segment_image_path, (segment_image, segment_info),
+                                       file_stat, journal_offset, label_histogram)
+        if cache_entry is None:
+            return segment_image, segment_info
+    segment_image, segment_info = cache_entry
+    return segment_image, segment_info.copy()
+
+def read_cached_marked_image(marked_image_path:str) -> np.ndarray:
+    """Reads a marked boundary image through the cache, the cached copy
+    is used while the file modification time and size are unchanged
+
+    Args:
+        marked_image_path (str): File path of the marked image
+
+    Returns:
+        np.ndarray: The read only RGB marked image or None if reading failed
+    """
+    cache_item = _get_cache_entry(marked_image_path)
+    if cache_item is not None:
+        return cache_item['data'][0]
+
+    marked_image = read_cv_image(marked_image_path, noflag=True)
+    if marked_image is None:
+        return None
+    cache_entry = _set_cache_entry(marked_image_path, (marked_image,))
+    return marked_image if cache_entry is None else cache_entry[0]
+
+def read_cached_segment_index(segment_image_path:str) -> dict:
+    """Reads the spatial index of a segment image through the cache, the
+    index is kept with the cached segment image
+
+    Args:
+        segment_image_path (str): File path of the segment image
+
+    Returns:
+        dict: The read only index arrays or None if reading failed
+    """
+    cache_item = _get_cache_entry(segment_image_path)
+    if cache_item is not None and 'index' in cache_item:
+        return cache_item['index']
+
+    segment_index = read_segment_index(segment_image_path)
+    if segment_index is None:
+        return None
+    for index_array in segment_index.values():
+        index_array.setflags(write=False)
+
+    if cache_item is not None:
+        index_size = sum(index_array.nbytes for index_array in segment_index.values())
+        with _CACHE_LOCK:
+            # The item may have been replaced while the index was read
+            if _CACHE.get(os.path.abspath(segment_image_path)) is cache_item and \
+               'index' not in cache_item:
+                cache_item['index'] = segment_index
+                cache_item['size'] += index_size
+                _CACHE_SETTINGS['current_size'] += index_size
+                _trim_cache_locked()
+    return segment_index
+
+def read_cached_label_histogram(segment_image_path:str,
+                                segment_info:np.ndarray=None) -> dict:
+    """Reads the label histogram of a segment image through the cache, the
+    histogram is kept with the cached segment info and every label edit
+    is applied to it as a delta instead of counting the labels again.
+    A segment image read from disk starts from the histogram stored in
+    its file and only counts the labels when that one is missing or stale.
+
+    Args:
+        segment_image_path (str): File path of the segment image
+        segment_info (np.ndarray, optional): The current segment info to
+        count when the segment image isn't cached. Defaults to None which
+        reads the segment image.
+
+    Returns:
+        dict: A copy of the histogram from build_label_histogram or None
+        if reading failed
+    """
+    label_histogram = _get_cached_label_histogram(segment_image_path)
+    if label_histogram is not None:
+        return label_histogram
+
+    if segment_info is None:
+        segment_file = read_cached_segment_image(segment_image_path)
+        if segment_file is None:
+            return None
+        # The read cached the segment image with its stored histogram
+        label_histogram = _get_cached_label_histogram(segment_image_path)
+        if label_histogram is not None:
+            return label_histogram
+        segment_info = segment_file[1]
+    return build_label_histogram(segment_info)
+
+def _get_cached_label_histogram(segment_image_path:str) -> dict:
+    """Gets a copy of the histogram kept with a cached segment image,
+    counting the labels of the cached segment info if it has none
+
+    Args:
+        segment_image_path (str): File path of the segment image
+
+    Returns:
+        dict: A copy of the histogram or None if the segment image isn't cached
+    """
+    cache_item = _get_cache_entry(segment_image_path)
+    if cache_item is None or \
+       _replay_journal_tail(segment_image_path, cache_item) is None:
+        return None
+    with _CACHE_LOCK:
+        if 'histogram' not in cache_item:
+            cache_item['histogram'] = build_label_histogram(cache_item['data'][1])
+        return {'total_segments': cache_item['histogram']['total_segments'],
+                'segment_counts': dict(cache_item['histogram']['segment_counts']),
+                'pixel_areas': dict(cache_item['histogram']['pixel_areas'])}
+
+def update_cached_segment_info(segment_info:np.ndarray,
+                               segment_image_path:str,
+                               read_labels:np.ndarray=None) -> bool:
+    """Saves the segment info by appending the changed labels to the label
+    journal and updates the cached copy so the next read doesn't go to disk.
+    Only the labels that differ from read_labels are saved so edits other
+    requests made since the segment info was read aren't reverted.
+
+    Args:
+        segment_info (np.ndarray): The updated segment info
+        segment_image_path (str): File path of the segment image
+        read_labels (np.ndarray, optional): Copy of the labels of the segment
+        info taken when it was read from read_cached_segment_image. Defaults
+        to None which saves every label that differs from the saved labels.
+
+    Returns:
+        bool: Returns True if write successful, False if an error occurs.
+    """
+    current_file = read_cached_segment_image(segment_image_path)
+    if current_file is None:
+        return False
+    current_info = current_file[1]
+    if read_labels is None or len(read_labels) != len(current_info):
+        read_labels = current_info[:,1]
+
+    # Only label changes are journaled, anything else rewrites the segment info
+    if current_info.shape != np.shape(segment_info) or \
+       np.any(current_info[:,[0,2]] != segment_info[:,[0,2]]):
+        saved = write_compacted_segment_info(segment_info, segment_image_path,
+                                             read_labels=read_labels)
+        clear_segment_cache(segment_image_path)
+        return saved
+
+    changed_rows = np.flatnonzero(read_labels != segment_info[:,1])
+    if len(changed_rows) == 0:
+        return True
+    journal_offsets = append_label_edits(segment_image_path,
+                                         segment_info[changed_rows,0],
+                                         segment_info[changed_rows,1])
+    if journal_offsets is None:
+        clear_segment_cache(segment_image_path)
+        return False
+
+    with _CACHE_LOCK:
+        cache_item = _CACHE.get(os.path.abspath(segment_image_path))
+        if cache_item is None:
+            return True
+        # Another process appended in between so the cache has to replay it
+        if cache_item['journal_offset'] != journal_offsets[0]:
+            _pop_cache_item_locked(segment_image_path)
+            return True
+        # The cache holds every edit before this one, so this request's
+        # edits are applied to it. Only the info changes, so the cached
+        # segment image is kept
+        cached_info = cache_item['data'][1].copy()
+        if 'histogram' in cache_item:
+            update_label_histogram(cache_item['histogram'],
+                                   cached_info[changed_rows,1],
+                                   segment_info[changed_rows,1],
+                                   cached_info[changed_rows,2])
+        cached_info[changed_rows,1] = segment_info[changed_rows,1]
+        cached_info.setflags(write=False)
+        cache_item['data'] = (cache_item['data'][0], cached_info)
+        cache_item['journal_offset'] = journal_offsets[1]
+    return True
+
+def clear_segment_cache(path:str=None) -> None:
+    """Removes a file or every file from the segment image cache
+
+    Args:
+        path (str, optional): File path to remove. Defaults to None
+        which clears the whole cache.
+    """
+    with _CACHE_LOCK:
+        if path is None:
+            _CACHE.clear()
+            _CACHE_SETTINGS['current_size'] = 0
+        else:
+            _pop_cache_item_locked(path)
+
+def _get_cache_entry(path:str) -> dict:
+    """Gets the cache item of a file if the file hasn't changed
+
+    Args:
+        path (str): File path of the cached file
+
+    Returns:
+        dict: The cache item with the cached arrays under 'data' and the
+        replayed journal offset, or None if the file isn't cached
+    """
+    if _CACHE_SETTINGS['max_size'] == 0:
+        return None
+    try:
+        file_stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+
+    cache_key = os.path.abspath(path)
+    with _CACHE_LOCK:
+        cache_item = _CACHE.get(cache_key)
+        if cache_item is None:
+            return None
+        # Another process rewrote the file so the cached copy is stale
+        if cache_item['stat'] != (file_stat.st_mtime_ns, file_stat.st_size):
+            _pop_cache_item_locked(path)
+            return None
+        _CACHE.move_to_end(cache_key)
+        return cache_item
+
+def _replay_journal_tail(segment_image_path:str,
+                         cache_item:dict) -> tuple:
+    """Replays the label edits other processes appended to the journal
+    since the segment info was cached
+
+    Args:
+        segment_image_path (str): File path of the segment image
+        cache_item (dict): The cache item of the segment image
+
+    Returns:
+        tuple: The up to date cached arrays or None if the segment image
+        has to be read again
+    """
+    try:
+        journal_size = os.path.getsize(get_label_journal_path(segment_image_path))
+    except OSError:
+        journal_size = 0
+    if journal_size == cache_item['journal_offset']:
+        return cache_item['data']
+
+    try:
+        with label_journal_lock(segment_image_path) as journal_file:
+            # The file stat is checked again under the lock since a
+            # compaction rewrites the file and empties the journal
+            file_stat = os.stat(segment_image_path)
+            if journal_file is None or \
+               cache_item['stat'] != (file_stat.st_mtime_ns, file_stat.st_size):
+                return None
+            records, journal_offset = read_label_journal_records(journal_file,
+                                                                 cache_item['journal_offset'])
+    except OSError:
+        return None
+    if records is None:
+        return None
+
+    with _CACHE_LOCK:
+        # Another request replayed the same records in the meantime
+        if cache_item['journal_offset'] >= journal_offset:
+            return cache_item['data']
+        segment_image, segment_info = cache_item['data']
+        segment_info = segment_info.copy()
+        # Segment number n is stored on row n-1 of the segment info
+        segment_rows = np.unique(records['segment_number']).astype(np.int64) - 1
+        segment_rows = segment_rows[(segment_rows >= 0) & (segment_rows < len(segment_info))]
+        previous_labels = segment_info[segment_rows,1].copy()
+        replay_label_records(segment_info, records)
+        if 'histogram' in cache_item:
+            update_label_histogram(cache_item['histogram'], previous_labels,
+                                   segment_info[segment_rows,1],
+                                   segment_info[segment_rows,2])
+        segment_info.setflags(write=False)
+        cache_item['data'] = (segment_image, segment_info)
+        cache_item['journal_offset'] = journal_offset
+    return segment_image, segment_info
+
+def _set_cache_entry(path:str,
+                     data:tuple,
+                     file_stat:os.stat_result=None,
+                     journal_offset:int=0,
+                     label_histogram:dict=None) -> tuple:
+    """Caches the arrays read from a file as read only arrays
+
+    Args:
+        path (str): File path the arrays were read from
+        data (tuple): The arrays read from the file
+        file_stat (os.stat_result, optional): Stat of the file when it was
+        read. Defaults to None which stats the file now.
+        journal_offset (int, optional): Journal offset the segment info
+        was replayed up to. Defaults to 0.
+        label_histogram (dict, optional): Label histogram of the segment
+        info. Defaults to None which counts it when it's first read.
+
+    Returns:
+        tuple: The cached arrays or None if they weren't cached
+    """
+    if _CACHE_SETTINGS['max_size'] == 0:
+        return None
+    try:
+        if file_stat is None:
+            file_stat = os.stat(path)
+        data = tuple(np.asarray(array) for array in data)
+        for array in data:
+            array.setflags(write=False)
+    except (OSError, TypeError, ValueError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+    with _CACHE_LOCK:
+        _pop_cache_item_locked(path)
+        _add_cache_item_locked(os.path.abspath(path), data, file_stat,
+                               journal_offset, label_histogram)
+    return data
+
+def _add_cache_item_locked(cache_key:str,
+                           data:tuple,
+                           file_stat:os.stat_result,
+                           journal_offset:int=0,
+                           label_histogram:dict=None) -> None:
+    """Adds arrays to the cache and trims it, the cache lock must be held
+
+    Args:
+        cache_key (str): Absolute path of the file
+        data (tuple): The read only arrays to cache
+        file_stat (os.stat_result): Stat of the file the arrays match
+        journal_offset (int, optional): Journal offset the segment info
+        was replayed up to. Defaults to 0.
+        label_histogram (dict, optional): Label histogram of the segment
+        info. Defaults to None.
+    """
+    item_size = sum(array.nbytes for array in data)
+    # Files larger than the whole budget are never cached
+    if item_size > _CACHE_SETTINGS['max_size']:
+        return
+    _CACHE[cache_key] = {'data': data,
+                         'size': item_size,
+                         'stat': (file_stat.st_mtime_ns, file_stat.st_size),
+                         'journal_offset': journal_offset}
+    if label_histogram is not None:
+        _CACHE[cache_key]['histogram'] = label_histogram
+    _CACHE_SETTINGS['current_size'] += item_size
+    _trim_cache_locked()
+
+def _pop_cache_item_locked(path:str) -> tuple:
+    """Removes a file from the cache, the cache lock must be held
+
+    Args:
+        path (str): File path of the cached file
+
+    Returns:
+        tuple: Tuple of the cache key and the removed item or None
+    """
+    try:
+        cache_key = os.path.abspath(path)
+    except (TypeError, ValueError):
+        return None, None
+    cache_item = _CACHE.pop(cache_key, None)
+    if cache_item is not None:
+        _CACHE_SETTINGS['current_size'] -= cache_item['size']
+    return cache_key, cache_item
+
+def _trim_cache_locked() -> None:
+    """Removes the least recently used files until the cache is within
+    its memory budget, the cache lock must be held"""
+    while _CACHE and _CACHE_SETTINGS['current_size'] > _CACHE_SETTINGS['max_size']:
+        _, cache_item = _CACHE.popitem(last=False)
+        _CACHE_SETTINGS['current_size'] -= cache_item['size']
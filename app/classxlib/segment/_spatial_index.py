@@ -0,0 +1,208 @@
+"""Submodule for the spatial index of a segment image. The index holds
+the centroid, bounding box, area and neighbors of every segment and a
+spatial ordering of the segments, it is computed once when the segment
+image is written and stored in the segment image file."""
+
+# Python Standard Library Imports
+from collections import deque
+
+# Python Third Party Imports
+import numpy as np
+import h5py
+from scipy import ndimage
+
+__all__ = ['build_segment_index', 'write_segment_index',
+           'get_segment_neighbors', 'get_next_unlabeled_segment']
+
+SEGMENT_INDEX_GROUP = "segment_index"
+SEGMENT_INDEX_VERSION = 1
+
+def build_segment_index(segment_image:np.ndarray) -> dict:
+    """Computes the spatial index of a segment image, row n-1 of every
+    array describes segment number n the same as the segment info
+
+    Args:
+        segment_image (np.ndarray): The segment image mask
+
+    Returns:
+        dict: The index arrays
+            -centroids(np.ndarray): (N,2) float32 centroid as (row, column)
+            -bboxes(np.ndarray): (N,4) int32 bounding box as
+            (min_row, min_column, max_row, max_column) with exclusive max
+            -areas(np.ndarray): (N,) uint32 pixel count
+            -neighbor_offsets(np.ndarray): (N+1,) int64 CSR offsets, the
+            neighbors of segment n are neighbors[offsets[n-1]:offsets[n]]
+            -neighbors(np.ndarray): 4-connected neighbor segment numbers
+            -spatial_order(np.ndarray): Segment numbers along a Hilbert
+            curve through the centroids
+    """
+    segment_image = np.asarray(segment_image)
+    segment_count = int(np.amax(segment_image)) if segment_image.size else 0
+    segment_pixels = segment_image.ravel().astype(np.intp)
+
+    # Areas and centroids from pixel counts and coordinate sums
+    areas = np.bincount(segment_pixels, minlength=segment_count + 1)[1:]
+    row_index, column_index = np.indices(segment_image.shape, dtype=np.float64)
+    row_sums = np.bincount(segment_pixels, weights=row_index.ravel(),
+                           minlength=segment_count + 1)[1:]
+    column_sums = np.bincount(segment_pixels, weights=column_index.ravel(),
+                              minlength=segment_count + 1)[1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = np.column_stack((row_sums / areas, column_sums / areas))
+    centroids = np.nan_to_num(centroids, nan=-1).astype(np.float32)
+
+    # Bounding boxes, segment numbers without pixels get an empty box
+    bboxes = np.zeros((segment_count, 4), dtype=np.int32)
+    for segment_row, segment_slice in enumerate(ndimage.find_objects(segment_image)):
+        if segment_slice is not None:
+            bboxes[segment_row] = (segment_slice[0].start, segment_slice[1].start,
+                                   segment_slice[0].stop, segment_slice[1].stop)
+
+    # Neighbor pairs from horizontally and vertically touching pixels
+    pair_list = []
+    for first_pixels, second_pixels in ((segment_image[:, :-1], segment_image[:, 1:]),
+                                        (segment_image[:-1, :], segment_image[1:, :])):
+        is_boundary = first_pixels != second_pixels
+        pair_list.append(np.column_stack((first_pixels[is_boundary],
+                                          second_pixels[is_boundary])))
+    neighbor_pairs = np.concatenate(pair_list).astype(np.int64)
+    neighbor_pairs = neighbor_pairs[(neighbor_pairs > 0).all(axis=1)]
+    # Unique pairs in both directions, packed into one key so the sort is 1D
+    key_base = segment_count + 1
+    pair_keys = np.unique(np.concatenate((neighbor_pairs[:, 0] * key_base + neighbor_pairs[:, 1],
+                                          neighbor_pairs[:, 1] * key_base + neighbor_pairs[:, 0])))
+    neighbor_offsets = np.zeros(segment_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_keys // key_base - 1, minlength=segment_count),
+              out=neighbor_offsets[1:])
+
+    # Ordering the segments with pixels along a Hilbert curve
+    present_segments = np.flatnonzero(areas) + 1
+    curve_bits = max(int(np.ceil(np.log2(max(segment_image.shape + (2,))))), 1)
+    curve_position = _hilbert_index(centroids[present_segments - 1, 1].astype(np.int64),
+                                    centroids[present_segments - 1, 0].astype(np.int64),
+                                    curve_bits)
+    spatial_order = present_segments[np.argsort(curve_position, kind='stable')]
+
+    return {'centroids': centroids,
+            'bboxes': bboxes,
+            'areas': areas.astype(np.uint32),
+            'neighbor_offsets': neighbor_offsets,
+            'neighbors': (pair_keys % key_base).astype(np.uint32),
+            'spatial_order': spatial_order.astype(np.uint32)}
+
+def write_segment_index(segment_h5_file:h5py.File,
+                        segment_index:dict) -> None:
+    """Writes a spatial index into an open segment image file
+
+    Args:
+        segment_h5_file (h5py.File): Segment image file open for writing
+        segment_index (dict): Index from build_segment_index
+    """
+    if SEGMENT_INDEX_GROUP in segment_h5_file:
+        del segment_h5_file[SEGMENT_INDEX_GROUP]
+    index_group = segment_h5_file.create_group(SEGMENT_INDEX_GROUP)
+    index_group.attrs['version'] = SEGMENT_INDEX_VERSION
+    for index_name, index_array in segment_index.items():
+        index_group.create_dataset(name=index_name, data=index_array)
+
+def get_segment_neighbors(segment_index:dict,
+                          segment_number:int) -> np.ndarray:
+    """Gets the segments touching a segment
+
+    Args:
+        segment_index (dict): Index of the segment image
+        segment_number (int): The segment number
+
+    Returns:
+        np.ndarray: The neighbor segment numbers
+    """
+    neighbor_offsets = segment_index['neighbor_offsets']
+    if not 0 < segment_number < len(neighbor_offsets):
+        return np.empty(0, dtype=np.uint32)
+    return segment_index['neighbors'][neighbor_offsets[segment_number - 1]:
+                                      neighbor_offsets[segment_number]]
+
+def get_next_unlabeled_segment(segment_index:dict,
+                               segment_info:np.ndarray,
+                               current_segment:int=None,
+                               max_visited:int=256) -> int:
+    """Gets the unlabeled segment to label next, the nearest unlabeled
+    segment by an adjacency walk from the current segment or else the
+    next unlabeled segment in the spatial order
+
+    Args:
+        segment_index (dict): Index of the segment image
+        segment_info (np.ndarray): Segment label information with each
+        row as (segment_number, segment_label_id, segment_area)
+        current_segment (int, optional): The segment labeled last.
+        Defaults to None which starts at the beginning of the spatial order.
+        max_visited (int, optional): Segments the adjacency walk visits
+        before falling back to the spatial order. Defaults to 256.
+
+    Returns:
+        int: The segment number or None if every segment is labeled
+    """
+    # Segment number n is stored on row n-1 of the segment info
+    is_unlabeled = np.zeros(len(segment_index['areas']) + 1, dtype=bool)
+    info_rows = segment_info[:, 0].astype(np.intp)
+    in_range = info_rows < len(is_unlabeled)
+    is_unlabeled[info_rows[in_range]] = segment_info[in_range, 1] == 0
+    if not is_unlabeled.any():
+        return None
+
+    spatial_order = segment_index['spatial_order'].astype(np.intp)
+    if current_segment is None or not 0 < current_segment < len(is_unlabeled):
+        unlabeled_order = spatial_order[is_unlabeled[spatial_order]]
+        return int(unlabeled_order[0]) if len(unlabeled_order) else None
+
+    # Breadth first walk over the neighbors of the current segment
+    visited = {current_segment}
+    walk_queue = deque([current_segment])
+    while walk_queue and len(visited) < max_visited:
+        for neighbor in get_segment_neighbors(segment_index, walk_queue.popleft()).tolist():
+            if neighbor in visited:
+                continue
+            if is_unlabeled[neighbor]:
+                return neighbor
+            visited.add(neighbor)
+            walk_queue.append(neighbor)
+
+    # Continuing along the spatial order after the current segment
+    order_position = np.flatnonzero(spatial_order == current_segment)
+    start = int(order_position[0]) + 1 if len(order_position) else 0
+    rotated_order = np.roll(spatial_order, -start)
+    unlabeled_order = rotated_order[is_unlabeled[rotated_order]]
+    return int(unlabeled_order[0]) if len(unlabeled_order) else None
+
+def _hilbert_index(x_positions:np.ndarray,
+                   y_positions:np.ndarray,
+                   curve_bits:int) -> np.ndarray:
+    """Gets the distance of points along a Hilbert curve
+
+    Args:
+        x_positions (np.ndarray): Integer x coordinates
+        y_positions (np.ndarray): Integer y coordinates
+        curve_bits (int): Bits of the curve grid, coordinates are in
+        range 0 to 2**curve_bits - 1
+
+    Returns:
+        np.ndarray: The curve distance of each point
+    """
+    grid_size = 1 << curve_bits
+    x_positions = np.clip(x_positions, 0, grid_size - 1)
+    y_positions = np.clip(y_positions, 0, grid_size - 1)
+    curve_distance = np.zeros(len(x_positions), dtype=np.int64)
+    step = grid_size >> 1
+    while step > 0:
+        rotate_x = (x_positions & step) > 0
+        rotate_y = (y_positions & step) > 0
+        curve_distance += step * step * ((3 * rotate_x) ^ rotate_y)
+        # Rotating the quadrant so the curve stays continuous
+        flip = rotate_x & ~rotate_y
+        x_positions = np.where(flip, grid_size - 1 - x_positions, x_positions)
+        y_positions = np.where(flip, grid_size - 1 - y_positions, y_positions)
+        swap = ~rotate_y
+        x_positions, y_positions = (np.where(swap, y_positions, x_positions),
+                                    np.where(swap, x_positions, y_positions))
+        step >>= 1
+    return curve_distance
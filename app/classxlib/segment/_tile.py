@@ -0,0 +1,203 @@
+"""Submodule for splitting an image into overlapping tiles
+and stitching the tile segmentations back together"""
+
+# Python Third Party Imports
+import numpy as np
+
+# Local Library Imports
+from ._label_map import resolve_label_equivalences
+
+__all__ = ['TILE_SIZE', 'TILE_HALO', 'generate_tiles',
+           'get_tile_label_offsets', 'stitch_tiles']
+
+# Default core size of a tile and the amount of pixels each tile
+# overlaps into its neighbors
+TILE_SIZE = 256
+TILE_HALO = 32
+
+# The minimum intersection over union of two overlapping segments
+# before they are considered the same segment across a seam
+SEAM_OVERLAP_THRESHOLD = 0.5
+
+def generate_tiles(image_shape:tuple,
+                   tile_size:int=TILE_SIZE,
+                   halo:int=TILE_HALO) -> list:
+    """Splits an image shape into a grid of tiles covering
+    every pixel of the image
+
+    Args:
+        image_shape (tuple): The (height, width) of the image
+        tile_size (int, optional): The core size of each tile. Defaults to 256.
+        halo (int, optional): The amount of pixels each tile overlaps
+        into its neighbors. Defaults to 32.
+
+    Returns:
+        list: List of (core_bounds, padded_bounds) tuples where each
+        bounds is (y_start, y_end, x_start, x_end)
+    """
+    tile_size = max(int(tile_size), 1)
+    halo = max(int(halo), 0)
+
+    tile_list = []
+    for y_start, y_end in _tile_spans(image_shape[0], tile_size):
+        for x_start, x_end in _tile_spans(image_shape[1], tile_size):
+            core_bounds = (y_start, y_end, x_start, x_end)
+
+            # Padding the core with the halo clipped to the image
+            padded_bounds = (max(y_start - halo, 0), min(y_end + halo, image_shape[0]),
+                             max(x_start - halo, 0), min(x_end + halo, image_shape[1]))
+            tile_list.append((core_bounds, padded_bounds))
+    return tile_list
+
+def get_tile_label_offsets(tile_list:list) -> np.ndarray:
+    """Precomputes the label offset of each tile so that tile
+    labels never collide once stitched together. A tile can never
+    have more labels than it has pixels so the offsets are the
+    cumulative areas of the padded tiles.
+
+    Args:
+        tile_list (list): List of tiles from generate_tiles
+
+    Returns:
+        np.ndarray: Label offset for each tile
+    """
+    tile_areas = np.array([(y_end - y_start) * (x_end - x_start)
+                           for _, (y_start, y_end, x_start, x_end) in tile_list],
+                          dtype=np.int64)
+    return np.concatenate(([0], np.cumsum(tile_areas)[:-1]))
+
+def stitch_tiles(tile_list:list,
+                 tile_segment_list:list,
+                 image_shape:tuple,
+                 label_offsets:np.ndarray=None) -> np.ndarray:
+    """Stitches the segmentations of overlapping tiles into one
+    segment image, segments that continue across tile seams are merged
+
+    Args:
+        tile_list (list): List of tiles from generate_tiles
+        tile_segment_list (list): Segment image of each padded tile
+        image_shape (tuple): The (height, width) of the full image
+        label_offsets (np.ndarray, optional): Precomputed label offsets
+        from get_tile_label_offsets. Defaults to None.
+
+    Returns:
+        np.ndarray: The stitched segment image with sequential labels
+        starting at 1
+    """
+    if label_offsets is None:
+        label_offsets = get_tile_label_offsets(tile_list)
+
+    segment_image = np.zeros(image_shape[:2], dtype=np.int64)
+    offset_segment_list = []
+
+    # Placing the core of every tile into the segment image
+    for (core_bounds, padded_bounds), tile_segment_image, label_offset in zip(tile_list,
+                                                                             tile_segment_list,
+                                                                             label_offsets):
+        # Compacting the tile labels to 1..n so they fit within the tile offset
+        tile_labels = np.unique(tile_segment_image, return_inverse=True)[1]
+        tile_labels = tile_labels.reshape(tile_segment_image.shape) + 1 + label_offset
+        offset_segment_list.append(tile_labels)
+
+        segment_image[_slice(core_bounds)] = tile_labels[_slice(core_bounds, padded_bounds)]
+
+    # Collecting the segments that are the same across the tile seams
+    seam_pairs = _get_seam_pairs(tile_list, offset_segment_list, segment_image)
+
+    # Resolving the seam pairs in a compacted label space
+    output_labels, output_inverse = np.unique(segment_image, return_inverse=True)
+    label_space = np.union1d(output_labels, seam_pairs.ravel())
+    label_map = resolve_label_equivalences(np.searchsorted(label_space, seam_pairs),
+                                           len(label_space))
+
+    # Renumbering the merged labels sequentially starting at 1
+    output_roots = label_map[np.searchsorted(label_space, output_labels)]
+    root_inverse = np.unique(output_roots, return_inverse=True)[1]
+    segment_image = (root_inverse.ravel() + 1)[output_inverse.ravel()]
+    return segment_image.reshape(image_shape[:2]).astype(np.uint32)
+
+def _tile_spans(length:int, tile_size:int) -> list:
+    """Splits a length into spans of tile size, a remainder thinner
+    than a quarter of a tile is folded into the last span instead of
+    creating a sliver tile
+
+    Args:
+        length (int): The length of the axis to split
+        tile_size (int): The size of each span
+
+    Returns:
+        list: List of (start, end) spans covering the full length
+    """
+    span_starts = list(range(0, length, tile_size))
+    if len(span_starts) > 1 and length - span_starts[-1] < tile_size // 4:
+        span_starts.pop()
+    span_ends = span_starts[1:] + [length]
+    return list(zip(span_starts, span_ends))
+
+def _slice(bounds:tuple, origin_bounds:tuple=None) -> tuple:
+    """Converts bounds into a slice, optionally relative to
+    the origin of another set of bounds
+
+    Args:
+        bounds (tuple): The (y_start, y_end, x_start, x_end) bounds
+        origin_bounds (tuple, optional): Bounds to make the slice
+        relative to. Defaults to None.
+
+    Returns:
+        tuple: Tuple of slices for indexing an array
+    """
+    y_start, y_end, x_start, x_end = bounds
+    if origin_bounds is not None:
+        y_start, y_end = y_start - origin_bounds[0], y_end - origin_bounds[0]
+        x_start, x_end = x_start - origin_bounds[2], x_end - origin_bounds[2]
+    return (slice(y_start, y_end), slice(x_start, x_end))
+
+def _get_seam_pairs(tile_list:list,
+                    offset_segment_list:list,
+                    segment_image:np.ndarray) -> np.ndarray:
+    """Finds the pairs of labels that represent the same segment across
+    tile seams by comparing the halo of each tile with the cores of
+    its neighbors
+
+    Args:
+        tile_list (list): List of tiles from generate_tiles
+        offset_segment_list (list): The offset segment image of each padded tile
+        segment_image (np.ndarray): The stitched core labels
+
+    Returns:
+        np.ndarray: Array of shape (n, 2) of equivalent label pairs
+    """
+    label_base = np.int64(np.max(segment_image)) + 1
+    seam_pair_list = [np.zeros((0, 2), dtype=np.int64)]
+
+    for tile_index, (_, padded_bounds) in enumerate(tile_list):
+        for neighbor_index, (neighbor_core, _) in enumerate(tile_list):
+            if neighbor_index == tile_index:
+                continue
+
+            # The part of the neighbors core that lies within this tiles halo
+            overlap_bounds = (max(padded_bounds[0], neighbor_core[0]),
+                              min(padded_bounds[1], neighbor_core[1]),
+                              max(padded_bounds[2], neighbor_core[2]),
+                              min(padded_bounds[3], neighbor_core[3]))
+            if overlap_bounds[0] >= overlap_bounds[1] or overlap_bounds[2] >= overlap_bounds[3]:
+                continue
+
+            halo_labels = offset_segment_list[tile_index][_slice(overlap_bounds,
+                                                                 padded_bounds)].ravel()
+            core_labels = segment_image[_slice(overlap_bounds)].ravel()
+
+            # Intersection over union of every overlapping label pair
+            pair_keys, pair_counts = np.unique(halo_labels * label_base + core_labels,
+                                               return_counts=True)
+            pair_halo, pair_core = np.divmod(pair_keys, label_base)
+            halo_ids, halo_counts = np.unique(halo_labels, return_counts=True)
+            core_ids, core_counts = np.unique(core_labels, return_counts=True)
+            union_counts = (halo_counts[np.searchsorted(halo_ids, pair_halo)] +
+                            core_counts[np.searchsorted(core_ids, pair_core)] -
+                            pair_counts)
+
+            merge_check = pair_counts > SEAM_OVERLAP_THRESHOLD * union_counts
+            seam_pair_list.append(np.column_stack((pair_halo[merge_check],
+                                                   pair_core[merge_check])))
+    return np.concatenate(seam_pair_list)
@@ -7,6 +7,10 @@ from ctypes import c_uint32
 import numpy as np
 import h5py
 
+# Local Library Imports
+from ._spatial_index import build_segment_index, write_segment_index
+from ._label_histogram import build_label_histogram, write_label_histogram
+
 __all__ = ['write_segment_image','update_segment_image_info']
 
 def write_segment_image(segment_image:np.ndarray,
@@ -14,7 +18,8 @@ def write_segment_image(segment_image:np.ndarray,
                        segment_dataset_name:str="segment_data",
                        segment_info_dataset_name:str="segment_info",
                        datatype:np.dtype=c_uint32) -> bool:
-    """Writes an segment image mask to disk in an HDF5 file.
+    """Writes an segment image mask to disk in an HDF5 file along with
+    the spatial index of its segments.
 
     Args:
         segment_image (np.ndarray): Segment image mask array
@@ -81,6 +86,12 @@ def write_segment_image(segment_image:np.ndarray,
                                        data=segment_info,
                                        dtype=datatype)
 
+        # Storing the spatial index used for navigation and hit testing
+        write_segment_index(segment_h5_file, build_segment_index(segment_data))
+
+        # Storing the segment and pixel counts of every label
+        write_label_histogram(segment_h5_file, build_label_histogram(segment_info))
+
         # Closing the file to complete the writing
         segment_h5_file.close()
 
@@ -129,6 +140,9 @@ def update_segment_image_info(segment_info:np.ndarray,
         # Deleting old/updating data
         segment_h5_file[segment_info_dataset_name][:] = segment_info
 
+        # Refreshing the label counts stored with the segment info
+        write_label_histogram(segment_h5_file, build_label_histogram(np.asarray(segment_info)))
+
         # Closing the file to complete the writing
         segment_h5_file.close()
 
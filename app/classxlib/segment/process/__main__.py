@@ -0,0 +1,10 @@
+"""Builds the compiled extensions of the segment process package,
+python -m classxlib.segment.process"""
+
+# Python Standard Library Imports
+import sys
+
+# Local Library Imports
+from ._build_extension import build_segment_extensions
+
+sys.exit(0 if build_segment_extensions() else 1)
@@ -0,0 +1,112 @@
+"""Submodule for the optional compiled extensions of the segment process
+package. The extensions are built once at install or image build time
+with python -m classxlib.segment.process, processes only import them and
+fall back to Python when they aren't built or are older than their source."""
+
+# Python Standard Library Imports
+import os
+import glob
+import hashlib
+import tempfile
+import importlib
+import threading
+import traceback
+
+__all__ = ['load_segment_extension', 'build_segment_extensions']
+
+_EXTENSION_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+_PACKAGE_NAME = __package__
+
+# Extensions already loaded or found missing in this process
+_EXTENSIONS = {}
+_EXTENSION_LOCK = threading.Lock()
+
+def load_segment_extension(extension_name:str):
+    """Imports a compiled extension of this package
+
+    Args:
+        extension_name (str): Name of the .pyx module such as region_merge
+
+    Returns:
+        module: The extension or None if it isn't built or was built
+        from an older .pyx source
+    """
+    with _EXTENSION_LOCK:
+        if extension_name not in _EXTENSIONS:
+            _EXTENSIONS[extension_name] = _import_extension(extension_name)
+        return _EXTENSIONS[extension_name]
+
+def build_segment_extensions() -> bool:
+    """Compiles every .pyx source of this package into the package directory,
+    run once at install or image build time since concurrent builds of the
+    same outputs would race
+
+    Returns:
+        bool: True if every extension was built
+    """
+    built = True
+    for source_path in sorted(glob.glob(os.path.join(_EXTENSION_DIRECTORY, "*.pyx"))):
+        extension_name = os.path.splitext(os.path.basename(source_path))[0]
+        try:
+            _build_extension(source_path)
+        except (Exception, SystemExit) as error: # pylint: disable=broad-except
+            # setup() exits when the compiler fails, the Python loop is used instead
+            print("Error:", error)
+            traceback.print_tb(error.__traceback__)
+            built = False
+            # The extension of an older source may still be importable
+            if os.path.exists(_get_cache_path(extension_name)):
+                os.remove(_get_cache_path(extension_name))
+            continue
+        with open(_get_cache_path(extension_name), 'w', encoding='utf-8') as cache_file:
+            cache_file.write(_get_source_hash(source_path))
+    return built
+
+def _import_extension(extension_name:str):
+    """Imports an extension if it was built from the current .pyx source
+
+    Returns:
+        module: The extension or None
+    """
+    source_path = os.path.join(_EXTENSION_DIRECTORY, extension_name + ".pyx")
+    cached_hash = None
+    if os.path.exists(_get_cache_path(extension_name)):
+        with open(_get_cache_path(extension_name), 'r', encoding='utf-8') as cache_file:
+            cached_hash = cache_file.readline().strip()
+    if cached_hash != _get_source_hash(source_path):
+        print(f"{extension_name} extension is missing or out of date, "
+              f"rebuild it with python -m {_PACKAGE_NAME}")
+        return None
+
+    try:
+        return importlib.import_module(_PACKAGE_NAME + "." + extension_name)
+    except ImportError as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return None
+
+def _get_cache_path(extension_name:str) -> str:
+    """Gets the file the source hash of a built extension is stored in"""
+    return os.path.join(_EXTENSION_DIRECTORY, "." + extension_name + ".cache")
+
+def _get_source_hash(source_path:str) -> str:
+    """Hashes a .pyx source"""
+    with open(source_path, 'rb') as source_file:
+        return hashlib.sha1(source_file.read()).hexdigest()
+
+def _build_extension(source_path:str) -> None:
+    """Compiles a .pyx source into the package directory"""
+    # pylint: disable=import-outside-toplevel
+    from Cython.Build import cythonize
+    from setuptools import setup
+
+    # The build output is laid out by package so the root is above classxlib
+    package_root = _EXTENSION_DIRECTORY
+    for _ in _PACKAGE_NAME.split('.'):
+        package_root = os.path.dirname(package_root)
+    with tempfile.TemporaryDirectory() as build_directory:
+        setup(name=_PACKAGE_NAME,
+              ext_modules=cythonize([source_path],
+                                    compiler_directives={'language_level': "3"}),
+              script_args=['build_ext', '--build-lib', package_root,
+                           '--build-temp', build_directory])
@@ -4,9 +4,11 @@ import traceback
 
 # Python Third Party Imports
 import numpy as np
-from skimage.graph import (cut_threshold, cut_normalized,
-                           merge_hierarchical, rag_mean_color)
+from skimage.graph import cut_normalized, rag_mean_color
 
+# Local Library Imports
+from ._region_graph import (build_region_graph, cut_region_graph_threshold,
+                            merge_region_graph_hierarchical)
 
 
 def merge_segments(segment_image:np.ndarray,
@@ -34,11 +36,10 @@ def merge_segments(segment_image:np.ndarray,
         # Threshold Cut
         if region_merge_method == 1:
             # Getting the color graph for the image
-            segment_region_graph = rag_mean_color(image=preprocessed_image,
-                                                  labels=segment_image)
-            segment_image = cut_threshold(labels=segment_image,
-                                          rag=segment_region_graph,
-                                          thresh=region_merge_threshold)
+            segment_region_graph = build_region_graph(segment_image=segment_image,
+                                                      input_image=preprocessed_image)
+            segment_image = cut_region_graph_threshold(region_graph=segment_region_graph,
+                                                       threshold=region_merge_threshold)
         # Normalized Cut
         elif region_merge_method == 2:
             # Getting the color graph for the image
@@ -49,15 +50,10 @@ def merge_segments(segment_image:np.ndarray,
         # Hierarchical Merge
         elif region_merge_method == 3:
             # Getting the color graph for the image
-            segment_region_graph = rag_mean_color(image=preprocessed_image,
-                                                  labels=segment_image)
-            segment_image = merge_hierarchical(segment_image,
-                                               segment_region_graph,
-                                               thresh=region_merge_threshold,
-                                               rag_copy=False,
-                                               in_place_merge=True,
-                                               merge_func=_merge_mean_color,
-                                               weight_func=_weight_mean_color)
+            segment_region_graph = build_region_graph(segment_image=segment_image,
+                                                      input_image=preprocessed_image)
+            segment_image = merge_region_graph_hierarchical(region_graph=segment_region_graph,
+                                                            threshold=region_merge_threshold)
         return segment_image
     except (ValueError, IndexError,
             TypeError, RuntimeError,
@@ -68,47 +64,3 @@ def merge_segments(segment_image:np.ndarray,
         print("EXCEPTION AT REGION MERGING")
         traceback.print_tb(error.__traceback__)
         return segment_image
-
-#pylint: disable=unused-argument
-def _weight_mean_color(graph, src, dst, n):
-    """Callback to handle merging nodes by recomputing mean color.
-
-    The method expects that the mean color of `dst` is already computed.
-
-    Parameters
-    ----------
-    graph : RAG
-        The graph under consideration.
-    src, dst : int
-        The vertices in `graph` to be merged.
-    n : int
-        A neighbor of `src` or `dst` or both.
-
-    Returns
-    -------
-    data : dict
-        A dictionary with the `"weight"` attribute set as the absolute
-        difference of the mean color between node `dst` and `n`.
-    """
-
-    diff = graph.nodes[dst]['mean color'] - graph.nodes[n]['mean color']
-    diff = np.linalg.norm(diff)
-    return {'weight': diff}
-
-
-def _merge_mean_color(graph, src, dst):
-    """Callback called before merging two nodes of a mean color distance graph.
-
-    This method computes the mean color of `dst`.
-
-    Parameters
-    ----------
-    graph : RAG
-        The graph under consideration.
-    src, dst : int
-        The vertices in `graph` to be merged.
-    """
-    graph.nodes[dst]['total color'] += graph.nodes[src]['total color']
-    graph.nodes[dst]['pixel count'] += graph.nodes[src]['pixel count']
-    graph.nodes[dst]['mean color'] = (graph.nodes[dst]['total color'] /
-                                      graph.nodes[dst]['pixel count'])
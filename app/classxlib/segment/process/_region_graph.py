@@ -0,0 +1,313 @@
+"""Submodule for building region adjacency data from
+a segment image with vectorized array operations"""
+
+# Python Standard Library Imports
+import heapq
+from itertools import product
+
+# Python Third Party Imports
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Local Library Imports
+from .._label_map import flatten_label_map
+from ._build_extension import load_segment_extension
+
+__all__ = ['get_region_labels', 'get_region_edges', 'get_region_mean_color',
+           'build_region_graph', 'cut_region_graph_threshold',
+           'merge_region_graph_hierarchical']
+
+# The 3x3 neighbourhood in the same order scikit-image visits
+# it when building a region adjacency graph with connectivity 2
+_NEIGHBOUR_OFFSETS = list(product((-1, 0, 1), (-1, 0, 1)))
+
+def get_region_labels(segment_image:np.ndarray) -> tuple:
+    """Compacts the labels of a segment image into indexes
+
+    Args:
+        segment_image (np.ndarray): Segment image mask
+
+    Returns:
+        tuple: Tuple of the sorted unique labels and an image of the
+        same shape holding the index of each pixels label
+    """
+    label_list, label_index = np.unique(segment_image, return_inverse=True)
+    return label_list, label_index.reshape(segment_image.shape)
+
+def get_region_edges(label_index:np.ndarray,
+                     label_count:int) -> np.ndarray:
+    """Finds every pair of adjacent regions using 8-connectivity,
+    the edges are ordered by when they are first encountered while
+    scanning the image the same way skimage.graph.RAG does
+
+    Args:
+        label_index (np.ndarray): Label index image from get_region_labels
+        label_count (int): The amount of unique labels
+
+    Returns:
+        np.ndarray: Array of shape (n, 2) of adjacent label index pairs,
+        each pair is ordered (center, neighbour) as it was first visited
+    """
+    height, width = label_index.shape
+    padded_index = np.pad(label_index, 1, mode='edge')
+    label_count = np.int64(label_count)
+
+    edge_key_list = []
+    edge_time_list = []
+    for offset_index, (y_offset, x_offset) in enumerate(_NEIGHBOUR_OFFSETS):
+        if y_offset == 0 and x_offset == 0:
+            continue
+        neighbour_index = padded_index[1 + y_offset:1 + y_offset + height,
+                                       1 + x_offset:1 + x_offset + width]
+        edge_mask = neighbour_index != label_index
+        edge_pixels = np.flatnonzero(edge_mask)
+        center_labels = label_index[edge_mask].astype(np.int64)
+        neighbour_labels = neighbour_index[edge_mask].astype(np.int64)
+
+        # Each edge is stored as a single key with the lower label first
+        # and the direction it was visited in as the sign
+        edge_key_list.append(np.where(center_labels < neighbour_labels,
+                                      center_labels * label_count + neighbour_labels + 1,
+                                      -(neighbour_labels * label_count + center_labels + 1)))
+        # The visit time of the edge, pixels in C order then offsets in order
+        edge_time_list.append(edge_pixels * len(_NEIGHBOUR_OFFSETS) + offset_index)
+
+    edge_keys = np.concatenate(edge_key_list)
+    if len(edge_keys) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    edge_keys = edge_keys[np.argsort(np.concatenate(edge_time_list))]
+
+    # Keeping the first time each edge was visited
+    first_index = np.unique(np.abs(edge_keys), return_index=True)[1]
+    edge_keys = edge_keys[np.sort(first_index)]
+    low_labels, high_labels = np.divmod(np.abs(edge_keys) - 1, label_count)
+
+    # Ordering each pair as (center, neighbour) of its first visit
+    return np.where((edge_keys > 0)[:, np.newaxis],
+                    np.column_stack((low_labels, high_labels)),
+                    np.column_stack((high_labels, low_labels)))
+
+def get_region_mean_color(input_image:np.ndarray,
+                          label_index:np.ndarray,
+                          label_count:int) -> tuple:
+    """Calculates the pixel count, total color and mean color of
+    every region, the color totals are accumulated in pixel order
+    so they match skimage.graph.rag_mean_color exactly
+
+    Args:
+        input_image (np.ndarray): The image to take the colors from
+        label_index (np.ndarray): Label index image from get_region_labels
+        label_count (int): The amount of unique labels
+
+    Returns:
+        tuple: Tuple of the pixel count, total color and mean color arrays
+    """
+    flat_index = label_index.ravel()
+    pixel_count = np.bincount(flat_index, minlength=label_count)
+
+    if input_image.ndim == 2:
+        input_image = input_image[..., np.newaxis]
+    total_color = np.column_stack([np.bincount(flat_index,
+                                               weights=input_image[..., channel].ravel(),
+                                               minlength=label_count)
+                                   for channel in range(input_image.shape[-1])])
+    mean_color = total_color / pixel_count[:, np.newaxis]
+    return pixel_count, total_color, mean_color
+
+def build_region_graph(segment_image:np.ndarray,
+                       input_image:np.ndarray) -> dict:
+    """Builds a mean color region adjacency graph stored in arrays,
+    the graph matches skimage.graph.rag_mean_color in distance mode
+
+    Args:
+        segment_image (np.ndarray): Segment image mask
+        input_image (np.ndarray): The image to take the colors from
+
+    Returns:
+        dict: The region graph with the keys
+        label_list: the sorted unique labels,
+        label_index: the label index image,
+        node_rank: the order each label was added to the graph,
+        edges: (n, 2) label index pairs ordered by node rank,
+        weights: the mean color distance of each edge,
+        indptr/indices: the CSR adjacency of the labels,
+        pixel_count/total_color/mean_color: the color of each label
+    """
+    label_list, label_index = get_region_labels(segment_image)
+    label_count = len(label_list)
+    edge_array = get_region_edges(label_index, label_count)
+
+    # Labels are added to the graph in the order they first appear in an edge
+    flat_edges = edge_array.ravel()
+    first_index = np.unique(flat_edges, return_index=True)[1]
+    node_rank = np.full(label_count, label_count, dtype=np.int64)
+    node_rank[flat_edges[np.sort(first_index)]] = np.arange(len(first_index))
+
+    # Each edge starts at the label that was added to the graph first
+    swap_check = node_rank[edge_array[:, 0]] > node_rank[edge_array[:, 1]]
+    edge_array[swap_check] = edge_array[swap_check][:, ::-1]
+
+    pixel_count, total_color, mean_color = get_region_mean_color(input_image,
+                                                                 label_index,
+                                                                 label_count)
+    color_difference = mean_color[edge_array[:, 0]] - mean_color[edge_array[:, 1]]
+    edge_weights = np.sqrt(np.einsum('ij,ij->i', color_difference, color_difference))
+
+    # Symmetric CSR adjacency of the label indexes
+    adjacency = csr_matrix((np.ones(2 * len(edge_array), dtype=np.int8),
+                            (np.concatenate((edge_array[:, 0], edge_array[:, 1])),
+                             np.concatenate((edge_array[:, 1], edge_array[:, 0])))),
+                           shape=(label_count, label_count))
+
+    return {'label_list': label_list,
+            'label_index': label_index,
+            'node_rank': node_rank,
+            'edges': edge_array,
+            'weights': edge_weights,
+            'indptr': adjacency.indptr,
+            'indices': adjacency.indices,
+            'pixel_count': pixel_count,
+            'total_color': total_color,
+            'mean_color': mean_color}
+
+def cut_region_graph_threshold(region_graph:dict,
+                               threshold:float) -> np.ndarray:
+    """Combines all regions connected by edges with a weight below
+    the threshold, matches skimage.graph.cut_threshold
+
+    Args:
+        region_graph (dict): Graph from build_region_graph
+        threshold (float): Edges with a weight at or above this are cut
+
+    Returns:
+        np.ndarray: The new segment image
+    """
+    label_list = region_graph['label_list']
+    label_count = len(label_list)
+    if len(region_graph['edges']) == 0:
+        return label_list[region_graph['label_index']]
+
+    kept_edges = region_graph['edges'][region_graph['weights'] < threshold]
+    component_count, component_index = connected_components(
+        csr_matrix((np.ones(len(kept_edges), dtype=np.int8),
+                    (kept_edges[:, 0], kept_edges[:, 1])),
+                   shape=(label_count, label_count)),
+        directed=False)
+
+    # Components are numbered in the order their first label was added to the graph
+    component_rank = np.full(component_count, label_count, dtype=np.int64)
+    np.minimum.at(component_rank, component_index, region_graph['node_rank'])
+    component_label = np.argsort(np.argsort(component_rank, kind='stable'), kind='stable')
+
+    label_map = component_label[component_index].astype(label_list.dtype)
+    return label_map[region_graph['label_index']]
+
+def merge_region_graph_hierarchical(region_graph:dict,
+                                    threshold:float) -> np.ndarray:
+    """Greedily merges the most similar pair of adjacent regions
+    until no pair is closer than the threshold, the mean color of
+    merged regions is recomputed after every merge. Matches
+    skimage.graph.merge_hierarchical with mean color callbacks.
+
+    Args:
+        region_graph (dict): Graph from build_region_graph
+        threshold (float): Regions closer than this are merged
+
+    Returns:
+        np.ndarray: The new segment image
+    """
+    label_list = region_graph['label_list']
+    if len(region_graph['edges']) == 0:
+        return label_list[region_graph['label_index']].astype(np.int64)
+
+    # Using the compiled merge loop when it's available
+    region_merge = _get_region_merge_extension()
+    if region_merge is not None:
+        parent_map = region_merge.merge_hierarchical_graph(
+            np.ascontiguousarray(region_graph['edges'], dtype=np.int64),
+            np.ascontiguousarray(region_graph['weights'], dtype=np.float64),
+            np.ascontiguousarray(region_graph['indptr'], dtype=np.int64),
+            np.ascontiguousarray(region_graph['indices'], dtype=np.int64),
+            np.array(region_graph['total_color'], dtype=np.float64),
+            np.array(region_graph['pixel_count'], dtype=np.float64),
+            float(threshold))
+    else:
+        parent_map = _merge_hierarchical(region_graph, threshold)
+
+    # The remaining regions are numbered in the order they were added to the graph
+    root_map = flatten_label_map(parent_map)
+    root_list = np.unique(root_map)
+    root_label = np.zeros(len(label_list), dtype=np.int64)
+    root_label[root_list] = np.argsort(np.argsort(region_graph['node_rank'][root_list],
+                                                  kind='stable'), kind='stable')
+    return root_label[root_map][region_graph['label_index']]
+
+def _merge_hierarchical(region_graph:dict,
+                        threshold:float) -> np.ndarray:
+    """Runs the hierarchical merge loop with a heap of edges that
+    are invalidated lazily using a version count for each region
+
+    Args:
+        region_graph (dict): Graph from build_region_graph
+        threshold (float): Regions closer than this are merged
+
+    Returns:
+        np.ndarray: Union-find parent map of the label indexes
+    """
+    label_count = len(region_graph['label_list'])
+    total_color = np.array(region_graph['total_color'], dtype=np.float64)
+    pixel_count = np.array(region_graph['pixel_count'], dtype=np.float64)
+    mean_color = total_color / pixel_count[:, np.newaxis]
+    indptr, indices = region_graph['indptr'], region_graph['indices']
+
+    neighbour_list = [set(indices[indptr[node]:indptr[node + 1]].tolist())
+                      for node in range(label_count)]
+    node_version = [0] * label_count
+    parent_map = np.arange(label_count)
+
+    # Heap items are (weight, src, dst, src version, dst version)
+    edge_heap = [(weight, src, dst, 0, 0) for (src, dst), weight in
+                 zip(region_graph['edges'].tolist(), region_graph['weights'].tolist())]
+    heapq.heapify(edge_heap)
+
+    while edge_heap and edge_heap[0][0] < threshold:
+        _, src, dst, src_version, dst_version = heapq.heappop(edge_heap)
+
+        # Edges touching a region that merged after they were pushed are stale
+        if node_version[src] != src_version or node_version[dst] != dst_version:
+            continue
+        node_version[dst] += 1
+
+        # Merging the color of src into dst
+        total_color[dst] += total_color[src]
+        pixel_count[dst] += pixel_count[src]
+        mean_color[dst] = total_color[dst] / pixel_count[dst]
+        parent_map[src] = dst
+
+        # Moving the neighbours of src onto dst
+        neighbours = (neighbour_list[src] | neighbour_list[dst]) - {src, dst}
+        for neighbour in neighbours:
+            neighbour_list[neighbour].discard(src)
+            neighbour_list[neighbour].add(dst)
+        neighbour_list[dst] = neighbours
+        neighbour_list[src] = set()
+        node_version[src] = -1
+
+        # Pushing the updated edges of dst
+        if neighbours:
+            neighbour_array = np.fromiter(neighbours, dtype=np.int64, count=len(neighbours))
+            color_difference = mean_color[dst] - mean_color[neighbour_array]
+            weights = np.sqrt(np.einsum('ij,ij->i', color_difference, color_difference))
+            for neighbour, weight in zip(neighbour_array.tolist(), weights.tolist()):
+                heapq.heappush(edge_heap, (weight, dst, neighbour,
+                                           node_version[dst], node_version[neighbour]))
+    return parent_map
+
+def _get_region_merge_extension():
+    """Imports the optional compiled region merge extension
+
+    Returns:
+        module: The region_merge extension or None if it's not built
+    """
+    return load_segment_extension('region_merge')
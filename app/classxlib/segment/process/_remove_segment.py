@@ -5,9 +5,13 @@ import traceback
 
 # Python Third Party Imports
 import numpy as np
-from skimage.graph import rag_mean_color
 from skimage.segmentation import relabel_sequential
 
+# Local Library Imports
+from .._label_map import flatten_label_map
+from ._region_graph import (get_region_labels, get_region_edges,
+                            get_region_mean_color)
+
 __all__ = ['remove_small_segments']
 
 def remove_small_segments(segment_image:np.ndarray,
@@ -28,34 +32,62 @@ def remove_small_segments(segment_image:np.ndarray,
     try:
         print("SMALL FEATURE REMOVAL USED")
         size_removal_threshold = size_removal_threshold*5
-        removal_list = _get_remove_list(segment_image,size_removal_threshold)
-        # create region adjacency graph
-        mean_color_rag = rag_mean_color(preprocessed_image, segment_image)
-        for node, data in mean_color_rag.nodes(data=True):
-            data['labels'] = node
-
-        # merge selected segments
-        for segment in removal_list:
-            # check if the segment is still below the threshold
-            if np.count_nonzero(segment_image == segment) > size_removal_threshold:
-                continue
-            # store adjacent segments
-            adj_segments = mean_color_rag.adj[segment]  # {segment_num: {'weight': value}, ... }
-            # find the segmenent with minimum color difference
-            min_segment = next(iter(adj_segments.keys()))
-
-            for adj in adj_segments:
-                weight = adj_segments[adj]['weight']
-                if weight < adj_segments[min_segment]['weight']:
-                    min_segment = adj
-
-            # merge segment with minimum segment
-            segment_image[segment_image == segment] = min_segment
-            # update RAG
-            mean_color_rag.merge_nodes(segment, min_segment)
-
-        # re-sequentialize segment labels
-        segment_image = relabel_sequential(segment_image)[0]
+
+        # Compacting the labels and counting the area of each segment
+        label_list, label_index = get_region_labels(segment_image)
+        label_count = len(label_list)
+        segment_areas = np.bincount(label_index.ravel(), minlength=label_count)
+        removal_list = _get_remove_list(segment_areas, size_removal_threshold)
+
+        # Union-find parent of each label index, merges only
+        # update this map and the image is relabeled once at the end
+        parent_map = np.arange(label_count)
+
+        if len(removal_list) > 0:
+            # create region adjacency graph
+            mean_color = get_region_mean_color(preprocessed_image,
+                                               label_index,
+                                               label_count)[2]
+            region_graph = _build_region_graph(label_list=label_list,
+                                               edge_array=get_region_edges(label_index,
+                                                                           label_count))
+            # Index of each label in the compacted label arrays
+            label_position = dict(zip(label_list.tolist(), range(label_count)))
+
+            # merge selected segments
+            for segment_index in removal_list:
+                # check if the segment is still below the threshold
+                if segment_areas[segment_index] > size_removal_threshold:
+                    continue
+                segment = int(label_list[segment_index])
+                # store adjacent segments
+                adj_segments = region_graph[segment]  # {segment_num: weight, ... }
+                # segments without neighbours have nothing to merge into
+                if not adj_segments:
+                    continue
+                # find the segmenent with minimum color difference
+                min_segment = next(iter(adj_segments.keys()))
+                min_weight = _get_edge_weight(region_graph, mean_color, label_position,
+                                              segment, min_segment)
+                for adj in adj_segments:
+                    weight = _get_edge_weight(region_graph, mean_color, label_position,
+                                              segment, adj)
+                    if weight < min_weight:
+                        min_segment, min_weight = adj, weight
+
+                # merge segment with minimum segment
+                min_segment_index = label_position[min_segment]
+                parent_map[segment_index] = min_segment_index
+                segment_areas[min_segment_index] += segment_areas[segment_index]
+                segment_areas[segment_index] = 0
+                # update RAG
+                _merge_region_nodes(region_graph, mean_color, label_position,
+                                    segment, min_segment)
+
+        # Resolving every merge into one lookup table and
+        # re-sequentializing the segment labels
+        label_map = relabel_sequential(label_list[flatten_label_map(parent_map)])[0]
+        segment_image = label_map[label_index]
 
     except (ValueError, IndexError,
             TypeError, RuntimeError,
@@ -65,24 +97,95 @@ def remove_small_segments(segment_image:np.ndarray,
         return segment_image
     return segment_image
 
-def _get_remove_list(segment_image:np.ndarray, removal_threshold:int) -> list:
+def _get_remove_list(segment_areas:np.ndarray, removal_threshold:int) -> np.ndarray:
     """Helper function to find all segments
     that fall under the threshold
 
     Args:
-        segment_image (np.ndarray): Segment image array
+        segment_areas (np.ndarray): Pixel count of each label index
         removal_threshold (int): The size threshold for removal
 
     Returns:
-        list: List of segment IDs to remove
+        np.ndarray: Array of label indexes to remove
     """
-
     # find segments that meet pixel threshold
-    segment_list, segment_lengths = np.unique(segment_image, return_counts=True)
-    removal_list = []
-
-    for i in range(segment_list.size):
-        if segment_lengths[i] <= removal_threshold:
-            removal_list.append(segment_list[i])
+    removal_list = np.flatnonzero(segment_areas <= removal_threshold)
     print(f"{len(removal_list)} segments to be removed")
     return removal_list
+
+def _build_region_graph(label_list:np.ndarray,
+                        edge_array:np.ndarray) -> dict:
+    """Builds the adjacency of each segment, the neighbours of each
+    segment are in the same order as skimage.graph.rag_mean_color
+
+    Args:
+        label_list (np.ndarray): The sorted unique labels
+        edge_array (np.ndarray): Label index pairs from get_region_edges
+
+    Returns:
+        dict: Dict of {segment: {neighbour: weight}}, the weights are
+        None until they are first used
+    """
+    region_graph = {}
+    for first_segment, second_segment in label_list[edge_array].tolist():
+        region_graph.setdefault(first_segment, {})[second_segment] = None
+        region_graph.setdefault(second_segment, {})[first_segment] = None
+    for segment in label_list.tolist():
+        region_graph.setdefault(segment, {})
+    return region_graph
+
+def _get_edge_weight(region_graph:dict,
+                     mean_color:np.ndarray,
+                     label_position:dict,
+                     segment:int,
+                     neighbour:int) -> float:
+    """Gets the weight of an edge, calculating the mean color
+    distance the first time the edge is used
+
+    Args:
+        region_graph (dict): Graph from _build_region_graph
+        mean_color (np.ndarray): Mean color of each label index
+        label_position (dict): Label index of each segment
+        segment (int): The first segment of the edge
+        neighbour (int): The second segment of the edge
+
+    Returns:
+        float: The weight of the edge
+    """
+    weight = region_graph[segment][neighbour]
+    if weight is None:
+        weight = np.linalg.norm(mean_color[label_position[segment]] -
+                                mean_color[label_position[neighbour]])
+        region_graph[segment][neighbour] = weight
+        region_graph[neighbour][segment] = weight
+    return weight
+
+def _merge_region_nodes(region_graph:dict,
+                        mean_color:np.ndarray,
+                        label_position:dict,
+                        src:int,
+                        dst:int) -> None:
+    """Merges the node src into dst, every neighbour of either node is
+    connected to dst with the minimum weight of its old edges
+
+    Args:
+        region_graph (dict): Graph from _build_region_graph
+        mean_color (np.ndarray): Mean color of each label index
+        label_position (dict): Label index of each segment
+        src (int): The segment being merged
+        dst (int): The segment merged into
+    """
+    # Neighbour order follows skimage.graph.RAG.merge_nodes
+    neighbors = (set(region_graph[src]) | set(region_graph[dst])) - {src, dst}
+    for neighbor in neighbors:
+        src_weight = _get_edge_weight(region_graph, mean_color, label_position, neighbor, src) \
+                     if src in region_graph[neighbor] else np.inf
+        dst_weight = _get_edge_weight(region_graph, mean_color, label_position, neighbor, dst) \
+                     if dst in region_graph[neighbor] else np.inf
+        weight = min(src_weight, dst_weight)
+        region_graph[neighbor][dst] = weight
+        region_graph[dst][neighbor] = weight
+
+    # Removing src from the graph
+    for neighbor in region_graph.pop(src):
+        del region_graph[neighbor][src]
@@ -0,0 +1,158 @@
+# distutils: language = c++
+# cython: cdivision=True
+# cython: boundscheck=False
+# cython: wraparound=False
+cimport cython
+import numpy as np
+from libc.math cimport sqrt
+from libcpp.vector cimport vector
+
+
+cdef struct HeapItem:
+    double weight
+    long long src
+    long long dst
+    long long src_version
+    long long dst_version
+
+
+def merge_hierarchical_graph(long long [:, :] edges, double [:] weights,
+                             long long [:] indptr, long long [:] indices,
+                             double [:, :] total_color, double [:] pixel_count,
+                             double threshold):
+    '''
+    Greedily merges the closest pair of adjacent regions until no pair
+    is closer than the threshold. Edges are kept in a heap ordered by
+    (weight, src, dst) and invalidated lazily with a version count per
+    region. Returns the union-find parent map of the regions.
+    '''
+    cdef long long node_count = total_color.shape[0]
+    cdef long long band_count = total_color.shape[1]
+    cdef long long i, b, node, neighbour, src, dst, stamp
+    cdef double difference, distance
+    cdef HeapItem item
+    cdef vector[HeapItem] edge_heap
+    cdef vector[vector[long long]] neighbour_list
+    cdef vector[long long] merged_neighbours
+
+    parent_map = np.arange(node_count, dtype=np.int64)
+    cdef long long [:] parent_view = parent_map
+    node_version = np.zeros(node_count, dtype=np.int64)
+    cdef long long [:] version_view = node_version
+    neighbour_stamp = np.full(node_count, -1, dtype=np.int64)
+    cdef long long [:] stamp_view = neighbour_stamp
+    mean_color = np.zeros((node_count, band_count), dtype=np.float64)
+    cdef double [:, :] mean_view = mean_color
+
+    for node in range(node_count):
+        for b in range(band_count):
+            mean_view[node, b] = total_color[node, b] / pixel_count[node]
+
+    # Copying the CSR adjacency into growable neighbour lists
+    neighbour_list.resize(node_count)
+    for node in range(node_count):
+        for i in range(indptr[node], indptr[node + 1]):
+            neighbour_list[node].push_back(indices[i])
+
+    for i in range(edges.shape[0]):
+        item.weight = weights[i]
+        item.src = edges[i, 0]
+        item.dst = edges[i, 1]
+        item.src_version = 0
+        item.dst_version = 0
+        _heap_push(edge_heap, item)
+
+    stamp = 0
+    while edge_heap.size() > 0 and edge_heap[0].weight < threshold:
+        item = _heap_pop(edge_heap)
+        src = item.src
+        dst = item.dst
+
+        # Edges touching a region that merged after they were pushed are stale
+        if version_view[src] != item.src_version or version_view[dst] != item.dst_version:
+            continue
+        version_view[src] = -1
+        version_view[dst] += 1
+
+        # Merging the color of src into dst
+        pixel_count[dst] += pixel_count[src]
+        for b in range(band_count):
+            total_color[dst, b] += total_color[src, b]
+            mean_view[dst, b] = total_color[dst, b] / pixel_count[dst]
+        parent_view[src] = dst
+
+        # The live neighbours of src and dst without duplicates
+        stamp += 1
+        stamp_view[src] = stamp
+        stamp_view[dst] = stamp
+        merged_neighbours.clear()
+        for node in (src, dst):
+            for i in range(neighbour_list[node].size()):
+                neighbour = neighbour_list[node][i]
+                if version_view[neighbour] < 0 or stamp_view[neighbour] == stamp:
+                    continue
+                stamp_view[neighbour] = stamp
+                merged_neighbours.push_back(neighbour)
+        neighbour_list[dst] = merged_neighbours
+        neighbour_list[src].clear()
+
+        # Pushing the updated edges of dst
+        for i in range(merged_neighbours.size()):
+            neighbour = merged_neighbours[i]
+            neighbour_list[neighbour].push_back(dst)
+            distance = 0
+            for b in range(band_count):
+                difference = mean_view[dst, b] - mean_view[neighbour, b]
+                distance += difference * difference
+            item.weight = sqrt(distance)
+            item.src = dst
+            item.dst = neighbour
+            item.src_version = version_view[dst]
+            item.dst_version = version_view[neighbour]
+            _heap_push(edge_heap, item)
+
+    return parent_map
+
+
+cdef inline bint _item_less(HeapItem a, HeapItem b):
+    if a.weight != b.weight:
+        return a.weight < b.weight
+    if a.src != b.src:
+        return a.src < b.src
+    if a.dst != b.dst:
+        return a.dst < b.dst
+    if a.src_version != b.src_version:
+        return a.src_version < b.src_version
+    return a.dst_version < b.dst_version
+
+
+cdef void _heap_push(vector[HeapItem] &heap, HeapItem item):
+    cdef size_t index, parent
+    heap.push_back(item)
+    index = heap.size() - 1
+    while index > 0:
+        parent = (index - 1) // 2
+        if not _item_less(heap[index], heap[parent]):
+            break
+        heap[index], heap[parent] = heap[parent], heap[index]
+        index = parent
+
+
+cdef HeapItem _heap_pop(vector[HeapItem] &heap):
+    cdef HeapItem top = heap[0]
+    cdef size_t index, child, size
+    heap[0] = heap.back()
+    heap.pop_back()
+    size = heap.size()
+    index = 0
+    while True:
+        child = 2 * index + 1
+        if child >= size:
+            break
+        if child + 1 < size and _item_less(heap[child + 1], heap[child]):
+            child += 1
+        if not _item_less(heap[child], heap[index]):
+            break
+        heap[index], heap[child] = heap[child], heap[index]
+        index = child
+    return top
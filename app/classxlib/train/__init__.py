@@ -9,11 +9,19 @@ from ._export import (
                     extract_label_mask_from_image,
 )
 from ._get import get_unique_parent_ids_from_link
+from ._model_registry import (configure_model_registry, get_model_name,
+                              get_training_fingerprint, get_model_file_path,
+                              load_classifier, load_ready_classifier,
+                              request_model_training, train_classifiers,
+                              clear_model_cache)
 from ._read import read_training_file
 from ._write import write_training_file
 
 __all__ = ['write_training_file','analysis',
            'read_training_file','classify_image',
+           'configure_model_registry','get_model_name','get_training_fingerprint',
+           'get_model_file_path','load_classifier','load_ready_classifier',
+           'request_model_training','train_classifiers','clear_model_cache',
            'delete_image_from_file', 'get_unique_parent_ids_from_link'
            'extract_label_mask_from_image', 'export_image_file_type'
            'export_mask_file_type', 'export_as_coco'
@@ -0,0 +1,167 @@
+"""Submodule for extracting the features of every segment of an image.
+Small images are analyzed in a single sweep, large images are split into
+row bands analyzed by the shared process pool. The image and segment mask
+are placed in shared memory once so the workers read them without copies
+and only the partial accumulators of each band are sent back and merged."""
+
+# Python Standard Library Imports
+import traceback
+from ctypes import c_uint32
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+# Python Third Party Imports
+import numpy as np
+
+# Local Library Imports
+from ..utils import submit_task, gather_tasks, get_max_workers
+from .analysis import attr_calc
+
+__all__ = ['FEATURE_VERSION', 'calculate_segment_features']
+
+# Version of the feature definition stored with training files, rows of
+# different versions are never mixed in one file. Version 2 no longer
+# counts a segment's own pixels as its neighbours.
+FEATURE_VERSION = 2
+
+# Images with fewer pixels are analyzed in a single sweep since starting
+# the band tasks takes longer than the sweep itself
+PARALLEL_MIN_PIXELS = 1 << 22
+
+# The least amount of rows in a band
+MIN_BAND_ROWS = 64
+
+def calculate_segment_features(input_image:np.ndarray,
+                               segment_image:np.ndarray,
+                               segment_numbers:np.ndarray) -> np.ndarray:
+    """Calculates the srgb features of segments of an image
+
+    Args:
+        input_image (np.ndarray): The image as a (bands, rows, columns) uint8 array
+        segment_image (np.ndarray): The segment image mask
+        segment_numbers (np.ndarray): The segment numbers to get the features of
+
+    Returns:
+        np.ndarray: One row of 16 features per segment number in order
+    """
+    segment_image = segment_image.astype(c_uint32, copy=False)
+    band_count = min(get_max_workers(), segment_image.shape[0] // MIN_BAND_ROWS)
+    if segment_image.size >= PARALLEL_MIN_PIXELS and band_count > 1:
+        try:
+            return _calculate_parallel(input_image, segment_image,
+                                       segment_numbers, band_count)
+        except (OSError, RuntimeError, TimeoutError,
+                BrokenProcessPool) as error:
+            # Falling back to a single sweep in this process
+            print("Error:", error)
+            traceback.print_tb(error.__traceback__)
+    # pylint: disable=c-extension-no-member
+    return attr_calc.analyze_srgb_segments(input_image, segment_image,
+                                           segment_numbers=segment_numbers)
+
+def _calculate_parallel(input_image:np.ndarray,
+                        segment_image:np.ndarray,
+                        segment_numbers:np.ndarray,
+                        band_count:int) -> np.ndarray:
+    """Calculates the features with one row band of the image per task
+    and merges the partial accumulators of the bands
+
+    Returns:
+        np.ndarray: One row of 16 features per segment number in order
+    """
+    # pylint: disable=c-extension-no-member
+    num_ws = int(np.amax(segment_image)) + 1
+    num_bands = input_image.shape[0]
+    shared_list = []
+    try:
+        image_spec = _share_array(input_image, shared_list)
+        segment_spec = _share_array(segment_image, shared_list)
+        band_edges = np.linspace(0, segment_image.shape[0], band_count + 1).astype(int)
+        process_list = [submit_task(_sort_band_pixels, image_spec, segment_spec,
+                                    int(x_start), int(x_stop), num_ws)
+                        for x_start, x_stop in zip(band_edges[:-1], band_edges[1:])]
+        band_results = gather_tasks(process_list)
+    finally:
+        for shared_buffer in shared_list:
+            shared_buffer.close()
+            shared_buffer.unlink()
+
+    # Merging the accumulators of the segments found in each band
+    internal = np.zeros((num_ws, num_bands, 3), dtype=np.float32)
+    external = np.zeros((num_ws, num_bands, 3), dtype=np.float32)
+    internal_ext = np.zeros((num_ws, 256), dtype=np.int32)
+    external_ext = np.zeros((num_ws, 256), dtype=np.int32)
+    for band_segments, band_internal, band_external, band_internal_ext, \
+        band_external_ext in band_results:
+        internal[band_segments] = attr_calc.merge_accumulators(internal[band_segments],
+                                                               band_internal)
+        external[band_segments] = attr_calc.merge_accumulators(external[band_segments],
+                                                               band_external)
+        internal_ext[band_segments] += band_internal_ext
+        external_ext[band_segments] += band_external_ext
+
+    feature_matrix = attr_calc.features_from_accumulators(internal, external,
+                                                          internal_ext, external_ext)
+    return attr_calc.select_segment_rows(feature_matrix, segment_numbers)
+
+def _sort_band_pixels(image_spec:tuple,
+                      segment_spec:tuple,
+                      x_start:int,
+                      x_stop:int,
+                      num_ws:int) -> tuple:
+    """Sorts the pixels of one row band in a worker process
+
+    Args:
+        image_spec (tuple): Shared memory name, shape and dtype of the image
+        segment_spec (tuple): Shared memory name, shape and dtype of the segment mask
+        x_start (int): First row of the band
+        x_stop (int): Row after the last row of the band
+        num_ws (int): Amount of rows of the accumulators
+
+    Returns:
+        tuple: The segment numbers with pixels in the band and their
+        internal, external, internal histogram and external histogram
+        results from pixel_sort_extended
+    """
+    # pylint: disable=c-extension-no-member
+    image_buffer = shared_memory.SharedMemory(name=image_spec[0])
+    segment_buffer = shared_memory.SharedMemory(name=segment_spec[0])
+    try:
+        input_image = np.ndarray(image_spec[1], dtype=image_spec[2], buffer=image_buffer.buf)
+        segment_image = np.ndarray(segment_spec[1], dtype=segment_spec[2],
+                                   buffer=segment_buffer.buf)
+        num_bands, x_dim, y_dim = input_image.shape
+        internal, external, internal_ext, external_ext = \
+            attr_calc.pixel_sort_extended(input_image, segment_image, 0,
+                                          x_dim, y_dim, num_ws, num_bands,
+                                          x_start, x_stop)
+        # Only the segments in the band are sent back
+        band_segments = np.unique(segment_image[x_start:x_stop])
+        band_result = (band_segments, internal[band_segments], external[band_segments],
+                       internal_ext[band_segments], external_ext[band_segments])
+        # Releasing the views before the shared memory is closed
+        del input_image, segment_image
+    finally:
+        image_buffer.close()
+        segment_buffer.close()
+    return band_result
+
+def _share_array(input_array:np.ndarray,
+                 shared_list:list) -> tuple:
+    """Copies an array into a new shared memory block
+
+    Args:
+        input_array (np.ndarray): The array to share
+        shared_list (list): List the shared memory block is added to
+        so the caller can release it
+
+    Returns:
+        tuple: The shared memory name, shape and dtype of the array
+    """
+    shared_buffer = shared_memory.SharedMemory(create=True, size=max(input_array.nbytes, 1))
+    shared_list.append(shared_buffer)
+    shared_array = np.ndarray(input_array.shape, dtype=input_array.dtype,
+                              buffer=shared_buffer.buf)
+    shared_array[...] = input_array
+    del shared_array
+    return shared_buffer.name, input_array.shape, input_array.dtype.str
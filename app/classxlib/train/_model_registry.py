@@ -0,0 +1,586 @@
+"""Submodule for the trained classifiers of training files. A classifier
+is keyed by a fingerprint of the training data it was fit on together with
+its algorithm and hyperparameters, so it is only refit when the training
+data changes. Fitted classifiers are saved next to the training file's
+models and recently used ones are kept in memory by each worker process.
+Classifiers can be trained in the background whenever a training file
+changes, requests are then served by the latest classifier saved.
+Training data a classifier can't be fit on is recorded next to the
+models so requests report the error instead of waiting on training, and
+requested training is marked next to them so it is only requested once
+across the worker processes."""
+
+# Python Standard Library Imports
+import os
+import time
+import glob
+import hashlib
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+
+# Python Third Party Imports
+import numpy as np
+import joblib
+from sklearn.ensemble import RandomForestClassifier
+from sklearn import svm
+import xgboost as xgb
+from sklearn.neighbors import KNeighborsClassifier
+
+# Local Library Imports
+from ._read import read_training_file
+
+__all__ = ['configure_model_registry', 'get_model_name', 'get_training_fingerprint',
+           'get_model_file_path', 'load_classifier', 'load_ready_classifier',
+           'request_model_training', 'train_classifiers', 'clear_model_cache']
+
+# Bumped when the saved model format changes so older files are refit
+MODEL_FORMAT_VERSION = 1
+
+# Algorithm id: (file name suffix, estimator class, hyperparameters)
+MODEL_ALGORITHMS = {
+    0: ('svm', svm.SVC, {'probability': True, 'C': 100, 'kernel': 'rbf'}),
+    1: ('rf', RandomForestClassifier, {'min_samples_split': 2, 'n_estimators': 100}),
+    2: ('xgb', xgb.XGBClassifier, {'max_depth': 5, 'learning_rate': 0.1,
+                                   'n_estimators': 1000, 'subsample': 0.8,
+                                   'colsample_bytree': 0.8, 'reg_alpha': 0.1,
+                                   'reg_lambda': 0.1}),
+    3: ('knn', KNeighborsClassifier, {'n_neighbors': 3}),
+}
+
+_MODEL_CACHE = OrderedDict()
+_MODEL_CACHE_LOCK = threading.Lock()
+_MODEL_SETTINGS = {'cache_size': 4,
+                   'pretrain_algorithms': tuple(MODEL_ALGORITHMS),
+                   'train_callback': None,
+                   'training_timeout': 600}
+
+# Fingerprints of training files keyed by their path, modification time
+# and size so an unchanged file isn't read again to fingerprint it
+_FINGERPRINT_CACHE = OrderedDict()
+_FINGERPRINT_CACHE_SIZE = 64
+
+# One lock per model file so concurrent requests fit a model only once
+_TRAIN_LOCKS = {}
+_TRAIN_LOCKS_LOCK = threading.Lock()
+
+def configure_model_registry(cache_size:int=None,
+                             pretrain_algorithms:list=None,
+                             train_callback=None,
+                             training_timeout:int=None) -> None:
+    """Sets how many classifiers each process keeps loaded and how
+    classifiers are trained when a training file changes
+
+    Args:
+        cache_size (int, optional): The amount of loaded classifiers.
+        A size of 0 disables the cache. Defaults to 4.
+        pretrain_algorithms (list, optional): Algorithm ids trained when a
+        training file changes. Defaults to every algorithm.
+        train_callback (callable, optional): Called with the arguments of
+        train_classifiers to train them in the background. Defaults to None
+        which fits a classifier in the request that first needs it.
+        training_timeout (int, optional): Seconds a request waits on requested
+        training before fitting the classifier itself, such as when no worker
+        runs the train callback. Defaults to 600.
+    """
+    with _MODEL_CACHE_LOCK:
+        if cache_size is not None:
+            _MODEL_SETTINGS['cache_size'] = max(int(cache_size), 0)
+            _trim_cache_locked()
+        if pretrain_algorithms is not None:
+            _MODEL_SETTINGS['pretrain_algorithms'] = tuple(int(algorithm_id)
+                                                           for algorithm_id in pretrain_algorithms
+                                                           if int(algorithm_id) in MODEL_ALGORITHMS)
+        _MODEL_SETTINGS['train_callback'] = train_callback
+        if training_timeout is not None:
+            _MODEL_SETTINGS['training_timeout'] = max(int(training_timeout), 0)
+
+def get_model_name(training_file_obj) -> str:
+    """Gets the name the classifiers of a training file are saved under,
+    {training_file_id}_{file_name} without the file extension
+
+    Args:
+        training_file_obj (TrainingFile): The training file
+
+    Returns:
+        str: The model name
+    """
+    return str(training_file_obj.id) + "_" + training_file_obj.file_name.split(".")[0]
+
+def get_training_fingerprint(training_file_path:str,
+                             image_type:str,
+                             unknown_label_id:int,
+                             algorithm_id:int) -> str:
+    """Fingerprints the training data a classifier is fit on along with
+    the algorithm and its hyperparameters
+
+    Args:
+        training_file_path (str): File path of the training file
+        image_type (str): Name of the label vector dataset
+        unknown_label_id (int): Label id left out of training
+        algorithm_id (int): The model algorithm id
+
+    Returns:
+        str: The hex digest of the fingerprint
+    """
+    file_stat = os.stat(training_file_path)
+    cache_key = (training_file_path, file_stat.st_mtime_ns, file_stat.st_size,
+                 image_type, unknown_label_id, algorithm_id)
+    with _MODEL_CACHE_LOCK:
+        fingerprint = _FINGERPRINT_CACHE.get(cache_key)
+        if fingerprint is not None:
+            _FINGERPRINT_CACHE.move_to_end(cache_key)
+            return fingerprint
+
+    label_vector, feature_matrix = read_training_file(training_file_path, image_type,
+                                                      unknown_label_id)
+    fingerprint = _fingerprint_dataset(label_vector, feature_matrix, algorithm_id)
+
+    with _MODEL_CACHE_LOCK:
+        _FINGERPRINT_CACHE[cache_key] = fingerprint
+        while len(_FINGERPRINT_CACHE) > _FINGERPRINT_CACHE_SIZE:
+            _FINGERPRINT_CACHE.popitem(last=False)
+    return fingerprint
+
+def get_model_file_path(model_directory:str,
+                        model_name:str,
+                        algorithm_id:int,
+                        fingerprint:str) -> str:
+    """Gets the file path of a saved classifier
+
+    Args:
+        model_directory (str): Directory of the training file's models
+        model_name (str): Name of the training file's models
+        algorithm_id (int): The model algorithm id
+        fingerprint (str): Fingerprint from get_training_fingerprint
+
+    Returns:
+        str: File path of the classifier
+    """
+    algorithm_name = MODEL_ALGORITHMS[algorithm_id][0]
+    return os.path.join(model_directory,
+                        f"{model_name}_{algorithm_name}_{fingerprint[:16]}.pkl")
+
+def load_classifier(training_file_path:str,
+                    image_type:str,
+                    unknown_label_id:int,
+                    algorithm_id:int,
+                    model_directory:str,
+                    model_name:str) -> dict:
+    """Gets the classifier of a training file, from memory, from its
+    saved file or by fitting it if the training data changed
+
+    Args:
+        training_file_path (str): File path of the training file
+        image_type (str): Name of the label vector dataset
+        unknown_label_id (int): Label id left out of training
+        algorithm_id (int): The model algorithm id
+        0: svm, 1: random forest, 2: xgboost, 3: knn
+        model_directory (str): Directory of the training file's models
+        model_name (str): Name of the training file's models
+
+    Returns:
+        dict: The model with keys
+            -classifier: The fitted classifier
+            -class_labels(np.ndarray): Label id of each predict_proba column
+            -fingerprint(str): Fingerprint of the training data
+
+    Raises:
+        ValueError: If the classifier can't be fit on the training data,
+        such as training data with a single label
+    """
+    fingerprint = get_training_fingerprint(training_file_path, image_type,
+                                           unknown_label_id, algorithm_id)
+    model_file_path = get_model_file_path(model_directory, model_name,
+                                          algorithm_id, fingerprint)
+
+    model_entry = _get_cached_model(model_file_path)
+    if model_entry is not None:
+        return model_entry
+
+    with _get_train_lock(model_file_path):
+        # Another request may have fit the model while waiting
+        model_entry = _get_cached_model(model_file_path)
+        if model_entry is None:
+            model_entry = _read_model_file(model_file_path, fingerprint)
+        if model_entry is None:
+            # Fitting on the same training data would fail again
+            training_failure = _read_training_failure(model_file_path)
+            if training_failure is not None:
+                raise ValueError(training_failure)
+            label_vector, feature_matrix = read_training_file(training_file_path, image_type,
+                                                              unknown_label_id)
+            try:
+                classifier, class_labels = _fit_classifier(algorithm_id, label_vector,
+                                                           feature_matrix)
+            except ValueError as error:
+                _write_training_failure(model_file_path, error)
+                raise
+            model_entry = {'classifier': classifier,
+                           'class_labels': class_labels,
+                           'fingerprint': fingerprint}
+            _write_model_file(model_file_path, model_entry)
+            _remove_old_model_files(model_directory, model_name,
+                                    algorithm_id, model_file_path)
+        _set_cached_model(model_file_path, model_entry)
+    return model_entry
+
+def load_ready_classifier(training_file_path:str,
+                          image_type:str,
+                          unknown_label_id:int,
+                          algorithm_id:int,
+                          model_directory:str,
+                          model_name:str) -> tuple:
+    """Gets the classifier of a training file without waiting on training.
+    If the classifier of the current training data isn't saved yet its
+    training is requested and the latest saved classifier is used instead.
+    Without a train callback the classifier is fit in place.
+
+    Args:
+        training_file_path (str): File path of the training file
+        image_type (str): Name of the label vector dataset
+        unknown_label_id (int): Label id left out of training
+        algorithm_id (int): The model algorithm id
+        model_directory (str): Directory of the training file's models
+        model_name (str): Name of the training file's models
+
+    Returns:
+        tuple: The model from load_classifier or None if no classifier is
+        ready yet, and whether the model is stale, fit on older training data
+
+    Raises:
+        ValueError: If the classifier can't be fit on the current training data
+    """
+    fingerprint = get_training_fingerprint(training_file_path, image_type,
+                                           unknown_label_id, algorithm_id)
+    model_file_path = get_model_file_path(model_directory, model_name,
+                                          algorithm_id, fingerprint)
+    model_entry = _get_cached_model(model_file_path)
+    if model_entry is None:
+        model_entry = _read_model_file(model_file_path, fingerprint)
+        if model_entry is not None:
+            _set_cached_model(model_file_path, model_entry)
+    if model_entry is not None:
+        return model_entry, False
+
+    # Training already failed on the current training data
+    training_failure = _read_training_failure(model_file_path)
+    if training_failure is not None:
+        raise ValueError(training_failure)
+
+    # The classifier is fit in place when training can't be requested
+    # or the requested training didn't finish in time
+    if not request_model_training(training_file_path, unknown_label_id,
+                                  model_directory, model_name, image_type) or \
+       _is_training_overdue(training_file_path, image_type, unknown_label_id,
+                            model_directory, model_name):
+        return load_classifier(training_file_path, image_type, unknown_label_id,
+                               algorithm_id, model_directory, model_name), False
+
+    # Serving the newest classifier saved for older training data
+    algorithm_name = MODEL_ALGORITHMS[algorithm_id][0]
+    model_files = glob.glob(os.path.join(glob.escape(model_directory),
+                                         glob.escape(f"{model_name}_{algorithm_name}") + "_*.pkl"))
+    for model_file in sorted(model_files, key=_get_modified_time, reverse=True):
+        model_entry = _get_cached_model(model_file)
+        if model_entry is None:
+            model_entry = _read_model_file(model_file)
+            if model_entry is None:
+                continue
+            _set_cached_model(model_file, model_entry)
+        return model_entry, True
+    return None, True
+
+def request_model_training(training_file_path:str,
+                           unknown_label_id:int,
+                           model_directory:str,
+                           model_name:str,
+                           image_type:str='srgb') -> bool:
+    """Requests the classifiers of a changed training file to be trained
+    through the train callback, once per version of the training file
+    across processes by creating a .training marker next to its models
+
+    Args:
+        training_file_path (str): File path of the training file
+        unknown_label_id (int): Label id left out of training
+        model_directory (str): Directory of the training file's models
+        model_name (str): Name of the training file's models
+        image_type (str, optional): Name of the label vector dataset. Defaults to 'srgb'.
+
+    Returns:
+        bool: True if training was requested now or before, False if
+        there is no train callback or the request failed
+    """
+    train_callback = _MODEL_SETTINGS['train_callback']
+    if train_callback is None:
+        return False
+    try:
+        marker_path = _get_training_marker_path(training_file_path, image_type,
+                                                unknown_label_id, model_directory,
+                                                model_name)
+        # Only the process that creates the marker requests the training
+        os.close(os.open(marker_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return True
+    except OSError as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return False
+    _remove_old_training_markers(model_directory, model_name, marker_path)
+
+    try:
+        train_callback(training_file_path, image_type, unknown_label_id,
+                       model_directory, model_name)
+    except Exception as error: # pylint: disable=broad-except
+        # The broker may be down, the caller fits the classifier itself
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        _remove_file(marker_path)
+        return False
+    return True
+
+def train_classifiers(training_file_path:str,
+                      image_type:str,
+                      unknown_label_id:int,
+                      model_directory:str,
+                      model_name:str,
+                      algorithm_list:list=None) -> dict:
+    """Trains and saves the classifiers of a training file that aren't
+    saved for its current training data yet
+
+    Args:
+        training_file_path (str): File path of the training file
+        image_type (str): Name of the label vector dataset
+        unknown_label_id (int): Label id left out of training
+        model_directory (str): Directory of the training file's models
+        model_name (str): Name of the training file's models
+        algorithm_list (list, optional): The algorithm ids to train.
+        Defaults to the configured pretrain algorithms.
+
+    Returns:
+        dict: The fingerprint of each trained algorithm id, None if it failed
+    """
+    if algorithm_list is None:
+        algorithm_list = _MODEL_SETTINGS['pretrain_algorithms']
+    trained_models = {}
+    for algorithm_id in algorithm_list:
+        try:
+            model_entry = load_classifier(training_file_path, image_type, unknown_label_id,
+                                          algorithm_id, model_directory, model_name)
+            trained_models[algorithm_id] = model_entry['fingerprint']
+        except (OSError, KeyError, ValueError) as error:
+            # Such as a training file with a single label
+            print("Error:", error)
+            traceback.print_tb(error.__traceback__)
+            trained_models[algorithm_id] = None
+    return trained_models
+
+def clear_model_cache() -> None:
+    """Removes every loaded classifier and fingerprint from memory"""
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE.clear()
+        _FINGERPRINT_CACHE.clear()
+
+def _fingerprint_dataset(label_vector:np.ndarray,
+                         feature_matrix:np.ndarray,
+                         algorithm_id:int) -> str:
+    """Hashes the training data, algorithm and hyperparameters
+
+    Returns:
+        str: The hex digest of the fingerprint
+    """
+    algorithm_name, _, parameters = MODEL_ALGORITHMS[algorithm_id]
+    fingerprint = hashlib.blake2b(digest_size=20)
+    fingerprint.update(repr((MODEL_FORMAT_VERSION, algorithm_name,
+                             sorted(parameters.items()))).encode())
+    for dataset in (label_vector, feature_matrix):
+        dataset = np.ascontiguousarray(dataset)
+        fingerprint.update(repr((dataset.dtype.str, dataset.shape)).encode())
+        fingerprint.update(dataset.data)
+    return fingerprint.hexdigest()
+
+def _fit_classifier(algorithm_id:int,
+                    label_vector:np.ndarray,
+                    feature_matrix:np.ndarray) -> tuple:
+    """Fits a new classifier on the training data
+
+    Returns:
+        tuple: The classifier and the label id of each predict_proba column
+    """
+    _, estimator_class, parameters = MODEL_ALGORITHMS[algorithm_id]
+    classifier = estimator_class(**parameters)
+    # The classes are fit as their index in the sorted label ids since
+    # xgboost requires classes to be 0,1,2,3... and the others sort them too
+    class_labels, label_index = np.unique(label_vector, return_inverse=True)
+    classifier.fit(feature_matrix, label_index.ravel())
+    return classifier, class_labels
+
+def _is_training_overdue(training_file_path:str,
+                         image_type:str,
+                         unknown_label_id:int,
+                         model_directory:str,
+                         model_name:str) -> bool:
+    """Checks whether the requested training of a training file has taken
+    longer than the training timeout, by the age of its .training marker"""
+    try:
+        marker_path = _get_training_marker_path(training_file_path, image_type,
+                                                unknown_label_id, model_directory,
+                                                model_name)
+        requested_time = os.path.getmtime(marker_path)
+    except OSError:
+        return False
+    return time.time() - requested_time > _MODEL_SETTINGS['training_timeout']
+
+def _get_training_marker_path(training_file_path:str,
+                              image_type:str,
+                              unknown_label_id:int,
+                              model_directory:str,
+                              model_name:str) -> str:
+    """Gets the file path marking that training was requested for the
+    current version of a training file
+
+    Raises:
+        OSError: If the training file can't be read
+    """
+    file_stat = os.stat(training_file_path)
+    file_version = hashlib.blake2b(repr((file_stat.st_mtime_ns, file_stat.st_size,
+                                         image_type, unknown_label_id)).encode(),
+                                   digest_size=8).hexdigest()
+    return os.path.join(model_directory, f"{model_name}_{file_version}.training")
+
+def _remove_old_training_markers(model_directory:str,
+                                 model_name:str,
+                                 marker_path:str) -> None:
+    """Removes the .training markers of older versions of a training file"""
+    old_markers = glob.glob(os.path.join(glob.escape(model_directory),
+                                         glob.escape(model_name) + "_*.training"))
+    for old_marker in old_markers:
+        if old_marker != marker_path:
+            _remove_file(old_marker)
+
+def _remove_file(file_path:str) -> None:
+    """Removes a file that may already have been removed"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def _get_failure_file_path(model_file_path:str) -> str:
+    """Gets the file path training failures of a classifier are recorded in"""
+    return os.path.splitext(model_file_path)[0] + ".failed"
+
+def _read_training_failure(model_file_path:str) -> str:
+    """Reads the recorded training failure of a classifier
+
+    Returns:
+        str: The error message or None if no failure was recorded
+    """
+    try:
+        with open(_get_failure_file_path(model_file_path), 'r', encoding='utf-8') as failure_file:
+            return failure_file.read().strip() or "The classifier couldn't be trained"
+    except OSError:
+        return None
+
+def _write_training_failure(model_file_path:str,
+                            error:Exception) -> None:
+    """Records that a classifier can't be fit on its training data"""
+    try:
+        with open(_get_failure_file_path(model_file_path), 'w', encoding='utf-8') as failure_file:
+            failure_file.write(str(error))
+    except OSError as write_error:
+        print("Error:", write_error)
+        traceback.print_tb(write_error.__traceback__)
+
+def _read_model_file(model_file_path:str,
+                     fingerprint:str=None) -> dict:
+    """Reads a saved classifier, of a given fingerprint or of any
+
+    Returns:
+        dict: The model or None if it doesn't exist or can't be read
+    """
+    if not os.path.exists(model_file_path):
+        return None
+    try:
+        model_entry = joblib.load(model_file_path)
+        if isinstance(model_entry, dict) and 'classifier' in model_entry and \
+           fingerprint in (None, model_entry.get('fingerprint')):
+            return model_entry
+    except FileNotFoundError:
+        # Removed by a newer version of the classifier
+        return None
+    except (OSError, EOFError, ValueError,
+            KeyError, AttributeError, ImportError) as error:
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+    return None
+
+def _write_model_file(model_file_path:str,
+                      model_entry:dict) -> None:
+    """Saves a classifier through a temporary file so readers never see
+    a partly written model"""
+    temp_path = None
+    try:
+        file_handle, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                                  dir=os.path.dirname(model_file_path))
+        os.close(file_handle)
+        joblib.dump(model_entry, temp_path)
+        os.replace(temp_path, model_file_path)
+    except OSError as error:
+        # The classifier is still used from memory
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _remove_old_model_files(model_directory:str,
+                            model_name:str,
+                            algorithm_id:int,
+                            model_file_path:str) -> None:
+    """Removes the classifiers and recorded training failures of older training
+    data of the same algorithm, including files saved before models were
+    fingerprinted"""
+    algorithm_name = MODEL_ALGORITHMS[algorithm_id][0]
+    old_files = glob.glob(os.path.join(glob.escape(model_directory),
+                                       glob.escape(f"{model_name}_{algorithm_name}") + "_*.pkl"))
+    old_files += glob.glob(os.path.join(glob.escape(model_directory),
+                                        glob.escape(f"{model_name}_{algorithm_name}") + "_*.failed"))
+    old_files.append(os.path.join(model_directory, f"{model_name}_{algorithm_name}.pkl"))
+    for old_file in old_files:
+        if old_file == model_file_path:
+            continue
+        _remove_file(old_file)
+
+def _get_modified_time(model_file_path:str) -> float:
+    """Gets the modification time of a model file, 0 if it was removed"""
+    try:
+        return os.path.getmtime(model_file_path)
+    except OSError:
+        return 0
+
+def _get_train_lock(model_file_path:str) -> threading.Lock:
+    """Gets the lock fitting a model file is guarded by"""
+    with _TRAIN_LOCKS_LOCK:
+        return _TRAIN_LOCKS.setdefault(model_file_path, threading.Lock())
+
+def _get_cached_model(model_file_path:str) -> dict:
+    """Gets a loaded classifier and marks it as recently used"""
+    with _MODEL_CACHE_LOCK:
+        model_entry = _MODEL_CACHE.get(model_file_path)
+        if model_entry is not None:
+            _MODEL_CACHE.move_to_end(model_file_path)
+        return model_entry
+
+def _set_cached_model(model_file_path:str,
+                      model_entry:dict) -> None:
+    """Keeps a loaded classifier in memory"""
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE[model_file_path] = model_entry
+        _MODEL_CACHE.move_to_end(model_file_path)
+        _trim_cache_locked()
+
+def _trim_cache_locked() -> None:
+    """Removes the least recently used classifiers over the cache size,
+    the cache lock must be held by the caller"""
+    while len(_MODEL_CACHE) > _MODEL_SETTINGS['cache_size']:
+        _MODEL_CACHE.popitem(last=False)
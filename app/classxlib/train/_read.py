@@ -2,7 +2,21 @@
 import h5py
 import numpy as np
 
-__all__ = ['read_training_file']
+__all__ = ['read_training_file', 'read_feature_version']
+
+# Training files written before the version was stored have version 1
+FEATURE_VERSION_ATTRIBUTE = 'feature_version'
+
+def read_feature_version(training_file:h5py.File) -> int:
+    """Gets the version of the features stored in a training file
+
+    Args:
+        training_file (h5py.File): The open training file
+
+    Returns:
+        int: The feature version
+    """
+    return int(training_file.attrs.get(FEATURE_VERSION_ATTRIBUTE, 1))
 
 #### Load Training Dataset (TDS) (Label Vector and Feature Matrix)
 def read_training_file(path:str, image_type:str, unknown_label_id:int=None, return_id_link:bool=False):
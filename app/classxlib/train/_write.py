@@ -1,8 +1,3 @@
-# Python Standard Library Imports
-from multiprocessing import Pool
-import os
-from functools import partial
-
 # Python Third Party Imports
 import numpy as np
 import h5py
@@ -14,8 +9,8 @@ from ..segment import read_segment_image
 from ..file import merge_directory
 from ..image import read_hdf5_image, read_cv_image
 
-
-from .analysis import attr_calc
+from ._features import FEATURE_VERSION, calculate_segment_features
+from ._read import FEATURE_VERSION_ATTRIBUTE, read_feature_version
 
 __all__ = ['write_training_file']
 
@@ -24,8 +19,11 @@ def write_training_file(save_path:str,
                         segment_image_obj:SegmentImage,
                         crop_image_obj:CropImage,
                         original_image_obj:OriginalImage,
-                        overwrite:bool):
-
+                        overwrite:bool,
+                        image_lookup=None):
+    # image_lookup is called with a segment image id already in the file
+    # and returns its (SegmentImage, CropImage) or None, it's used to
+    # recompute the features of a file written with an older feature version
     label_vector, feature_matrix, segment_id_link = \
                 _prepare_dataset(base_directory=base_directory,
                                  segment_image_obj=segment_image_obj,
@@ -38,21 +36,17 @@ def write_training_file(save_path:str,
                                     feature_matrix=feature_matrix,
                                     segment_id_link=segment_id_link)
     else:
+        # Rows of older feature versions would be mixed with the new rows
+        _upgrade_training_features(save_path=save_path,
+                                   base_directory=base_directory,
+                                   segment_image_id=segment_image_obj.id,
+                                   image_lookup=image_lookup)
         _write_append_training_dataset(save_path=save_path,
                                        segment_image_id=segment_image_obj.id,
                                        new_label_vector=label_vector,
                                        new_feature_matrix=feature_matrix,
                                        new_segment_id_link=segment_id_link)
 
-def _calc_attributes(original_image, secondary_image, segment_id):
-    feature_array = []
-    # pylint: disable=c-extension-no-member
-    feature_array = attr_calc.analyze_srgb_image(original_image,
-                                                secondary_image,
-                                                segment_id=segment_id)
-    feature_array = feature_array[0]
-    return feature_array
-
 def _prepare_dataset(base_directory:str,
                      segment_image_obj:SegmentImage,
                      crop_image_obj:CropImage,
@@ -64,14 +58,7 @@ def _prepare_dataset(base_directory:str,
     # Reading segment image into memory
     segment_image, segment_info = read_segment_image(segment_image_path)
 
-    # Formatting path to HDF5 crop image
-    if crop_image_obj.h5_path is not None:
-        crop_image_path = merge_directory(base_directory,crop_image_obj.h5_path)
-        # Reading original crop image into memory
-        crop_image = read_hdf5_image(crop_image_path, mode="training")
-    else:
-        crop_image_path = merge_directory(base_directory,crop_image_obj.visualization_path)
-        crop_image = read_cv_image(crop_image_path)
+    crop_image = _read_crop_image(base_directory, crop_image_obj)
 
     segment_count = len(segment_info)
     # Creating a array to store the link between segments using database
@@ -96,25 +83,67 @@ def _prepare_dataset(base_directory:str,
 
     return label_vector, feature_matrix, segment_id_link
 
+def _read_crop_image(base_directory:str,
+                     crop_image_obj:CropImage):
+    # Formatting path to HDF5 crop image
+    if crop_image_obj.h5_path is not None:
+        crop_image_path = merge_directory(base_directory,crop_image_obj.h5_path)
+        # Reading original crop image into memory
+        return read_hdf5_image(crop_image_path, mode="training")
+    crop_image_path = merge_directory(base_directory,crop_image_obj.visualization_path)
+    return read_cv_image(crop_image_path)
+
+def _upgrade_training_features(save_path:str,
+                               base_directory:str,
+                               segment_image_id:int,
+                               image_lookup):
+    # Recomputes the stored features of a training file written with an
+    # older feature version. The rows of the segment image being written
+    # are replaced by the append so they are left as they are.
+    with h5py.File(save_path, 'r') as training_file:
+        feature_version = read_feature_version(training_file)
+        if feature_version == FEATURE_VERSION:
+            return
+        segment_id_link = training_file['segment_id_link'][:]
+
+    print(f"Recomputing the version {feature_version} features of {save_path}")
+    new_feature_matrix = None
+    for stored_image_id in np.unique(segment_id_link[:,1]):
+        if stored_image_id == segment_image_id:
+            continue
+        image_objs = None if image_lookup is None else image_lookup(int(stored_image_id))
+        if image_objs is None:
+            raise ValueError(f"Training file has version {feature_version} features "
+                             f"of segment image {stored_image_id} that can't be recomputed")
+        stored_segment_image_obj, stored_crop_image_obj = image_objs
+        segment_image = read_segment_image(merge_directory(base_directory,
+                                                           stored_segment_image_obj.segment_path))[0]
+        crop_image = _read_crop_image(base_directory, stored_crop_image_obj)
+        stored_rows = np.flatnonzero(segment_id_link[:,1] == stored_image_id)
+        stored_features = calculate_segment_features(crop_image, segment_image,
+                                                     segment_numbers=segment_id_link[stored_rows,0])
+        if new_feature_matrix is None:
+            new_feature_matrix = np.zeros((len(segment_id_link), stored_features.shape[1]),
+                                          dtype=stored_features.dtype)
+        new_feature_matrix[stored_rows] = stored_features
+
+    with h5py.File(save_path, 'a') as training_file:
+        if new_feature_matrix is not None:
+            del training_file['feature_matrix']
+            training_file.create_dataset('feature_matrix',
+                                         data=new_feature_matrix,
+                                         chunks=True,
+                                         maxshape=(None,None))
+        training_file.attrs[FEATURE_VERSION_ATTRIBUTE] = FEATURE_VERSION
+
 def _get_feature_matrix(crop_image, segment_image, segment_info, segment_count):
     # This holds the feature analysis matrix for all the segments
-    # We check for 1000+ segments because the initialization of multiprocessing
-    # can take longer than it takes to loop normally.
-    if segment_count > 1000:
-        with Pool(int(os.cpu_count()/2)) as pool:
-            func = partial(_calc_attributes,
-                           crop_image,
-                           segment_image)
-            # pylint: disable=no-member
-            feature_matrix = pool.map(func, segment_info[:,0].tolist())
-    else:
-        feature_matrix = []
-        # Creating the dataset
-        for segment in segment_info[:,0].tolist():
-            feature_matrix.append(_calc_attributes(crop_image,
-                                                   segment_image,
-                                                   segment_id = segment))
-    feature_matrix = np.array(feature_matrix)
+    # Every segment is analyzed in a single sweep of the crop image, large
+    # crops are swept in row bands by the shared process pool.
+    # Rows follow the segment info order.
+    feature_matrix = calculate_segment_features(crop_image,
+                                                segment_image,
+                                                segment_numbers=segment_info[:,0])
     return feature_matrix
 
 def _write_new_training_dataset(save_path:str,
@@ -136,6 +165,7 @@ def _write_new_training_dataset(save_path:str,
                                      data=segment_id_link,
                                      chunks=True,
                                      maxshape=(None,None))
+        training_file.attrs[FEATURE_VERSION_ATTRIBUTE] = FEATURE_VERSION
         # Closing the file after finished
         training_file.close()
 
@@ -17,6 +17,10 @@ def analyze_srgb_image(input_image, watershed_image, segment_id=False):
     cdef int x_dim, y_dim, num_bands
     cdef int ws, b, i, sid
     cdef int ws_size
+
+    # Every segment is analyzed in a single sweep of the image
+    if segment_id == False:
+        return analyze_srgb_segments(input_image, watershed_image)
    
     # If no segment id is provided, analyze the features for every watershed
     # in the input image. If a segment id is provided, just analyze the features
@@ -103,6 +107,136 @@ def analyze_srgb_image(input_image, watershed_image, segment_id=False):
     return np.copy(fm_view)
 
 
+def analyze_srgb_segments(input_image, watershed_image, segment_numbers=None):
+    '''
+    Cacluate the attributes of every segment given in watershed_image
+    in a single sweep of input image. The accumulators and histograms of
+    all segments are filled in one pass and the features are computed
+    for all segments at once. Attributes calculated for srgb type images.
+    Returns the feature rows of the given segment numbers in order, or
+    one row per watershed number if no segment numbers are given.
+    '''
+    cdef int num_ws, x_dim, y_dim, num_bands
+
+    num_ws = int(np.amax(watershed_image) + 1)
+    num_bands, x_dim, y_dim = np.shape(input_image)
+
+    internal, external, internal_ext, external_ext = pixel_sort_extended(input_image, watershed_image,
+                                                                         0, x_dim, y_dim,
+                                                                         num_ws, num_bands)
+    feature_matrix = features_from_accumulators(internal, external, internal_ext, external_ext)
+
+    if segment_numbers is None:
+        return feature_matrix
+    return select_segment_rows(feature_matrix, segment_numbers)
+
+
+def select_segment_rows(feature_matrix, segment_numbers):
+    '''
+    Select the feature rows of the given segment numbers in order from
+    a matrix with one row per watershed number. Segment numbers without
+    pixels in the image get an empty row.
+    '''
+    num_ws, num_features = np.shape(feature_matrix)
+    segment_numbers = np.asarray(segment_numbers, dtype=np.int64)
+    segment_rows = np.zeros((len(segment_numbers), num_features), dtype=c_float)
+    in_range = (segment_numbers >= 0) & (segment_numbers < num_ws)
+    segment_rows[in_range] = feature_matrix[segment_numbers[in_range]]
+    return segment_rows
+
+
+def merge_accumulators(first, second):
+    '''
+    Merge two arrays of (count, mean, M2) Welford accumulators of the
+    same pixels split in two parts, such as the internal or external
+    results of pixel_sort_extended for two row bands of an image.
+    Uses the parallel update of Chan et al.
+    '''
+    first = np.asarray(first, dtype=np.float64)
+    second = np.asarray(second, dtype=np.float64)
+    merged = np.zeros(np.shape(first), dtype=c_float)
+    count = first[..., 0] + second[..., 0]
+    safe_count = np.where(count > 0, count, 1)
+    delta = second[..., 1] - first[..., 1]
+    merged[..., 0] = count
+    merged[..., 1] = first[..., 1] + delta * second[..., 0] / safe_count
+    merged[..., 2] = (first[..., 2] + second[..., 2] +
+                      delta * delta * first[..., 0] * second[..., 0] / safe_count)
+    return merged
+
+
+def features_from_accumulators(internal, external, internal_ext, external_ext):
+    '''
+    Calculate the srgb attributes of every segment from the accumulators
+    and histograms of pixel_sort_extended, one row per watershed number.
+    Rows of watersheds without pixels are left as zeros.
+    '''
+    num_ws = np.shape(internal)[0]
+    feature_matrix = np.zeros((num_ws, 16), dtype=c_float)
+    has_pixels = internal[:, 0, 0] >= 1
+    count = np.where(has_pixels, internal[:, 0, 0], 1).astype(np.float64)
+
+    # Average and Variance of Pixel Intensity for each band
+    for b in range(3):
+        feature_matrix[:, b] = np.maximum(internal[:, b, 1], 1)
+        feature_matrix[:, b+3] = np.sqrt(internal[:, b, 2] / count)
+
+    # See Miao et al for band ratios
+    # Division by zero is not possible because the means have a forced min of 1
+    band_1 = feature_matrix[:, 0]
+    band_2 = feature_matrix[:, 1]
+    band_3 = feature_matrix[:, 2]
+    # Band Ratio 1
+    feature_matrix[:, 6] = (band_3 - band_1) / (band_3 + band_1)
+    # Band Ratio 2
+    feature_matrix[:, 7] = (band_3 - band_2) / (band_3 + band_2)
+    # Band Ratio 3
+    # Prevent division by 0
+    ratio_denominator = 2 * band_3 - band_2 - band_1
+    feature_matrix[:, 8] = np.where(ratio_denominator < 1, 0,
+                                    (band_2 - band_1) / np.maximum(ratio_denominator, 1))
+
+    # Size of Superpixel
+    feature_matrix[:, 9] = internal[:, 0, 0]
+
+    # Entropy
+    feature_matrix[:, 10] = histogram_entropy(internal_ext)
+
+    ## Neighborhood Values, only for segments with external pixels
+    has_external = has_pixels & (external[:, 0, 0] >= 1)
+    external_count = np.where(external[:, 1, 0] >= 1, external[:, 1, 0], 1).astype(np.float64)
+    # N. Average Intensity
+    feature_matrix[:, 11] = np.where(has_external, external[:, 1, 1], 0)
+    # N. Standard Deviation
+    feature_matrix[:, 12] = np.where(has_external,
+                                     np.sqrt(external[:, 1, 2] / external_count), 0)
+    # N. Maximum Single Value, the last histogram bin with pixels
+    is_filled = external_ext != 0
+    feature_matrix[:, 13] = np.where(has_external & is_filled.any(axis=1),
+                                     255 - np.argmax(is_filled[:, ::-1], axis=1), 0)
+    # N. Entropy
+    feature_matrix[:, 14] = np.where(has_external, histogram_entropy(external_ext), 0)
+
+    # Date of image acquisition (removed, but need placeholder)
+    feature_matrix[:, 15] = 0
+
+    feature_matrix[~has_pixels] = 0
+    return feature_matrix
+
+
+def histogram_entropy(histograms):
+    '''
+    Calculate the base 2 entropy of every row of a histogram matrix
+    the same as scipy.stats.entropy, empty rows give 0.
+    '''
+    histograms = np.asarray(histograms, dtype=np.float64)
+    totals = histograms.sum(axis=1, keepdims=True)
+    probabilities = histograms / np.where(totals > 0, totals, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        information = np.where(probabilities > 0,
+                               probabilities * np.log2(probabilities), 0)
+    return -information.sum(axis=1)
+
 def analyze_ms_image(input_image, watershed_image, wb_ref, bp_ref, segment_id=False):
     '''
     Cacluate the attributes for each segment given in watershed_image
@@ -403,11 +537,14 @@ def pixel_sort(const unsigned char[:,:,:] intensity_image_view,
 
 def pixel_sort_extended(const unsigned char[:,:,:] intensity_image_view,
                         const unsigned int[:,:] label_image_view,
-                        unsigned int segment_id, int x_dim, int y_dim, int num_ws, int num_bands):
+                        unsigned int segment_id, int x_dim, int y_dim, int num_ws, int num_bands,
+                        int x_start=0, int x_stop=-1):
     '''
     Given an intensity image and label image of the same dimension, sort
     pixels into a list of internal and external intensity pixels for every
-    label in the label image.
+    label in the label image. Only the pixels of rows x_start to x_stop
+    are sorted when given, their neighbors are read from the whole image
+    so the partial results of row bands can be merged.
     Returns:
         Internal: Array of length (number of labels), each element is a list
             of intensity values for that label number.
@@ -437,8 +574,11 @@ def pixel_sort_extended(const unsigned char[:,:,:] intensity_image_view,
     # Moving window that defines the neighboring region for each pixel
     window = [-4, -3, 3, 4]
 
+    if x_stop < 0 or x_stop > x_dim:
+        x_stop = x_dim
+
     for y in range(y_dim):
-        for x in range(x_dim):
+        for x in range(x_start, x_stop):
             # Ignore pixels whose value is 0 (no data)
             if intensity_image_view[0, x, y] == 0:
                 continue
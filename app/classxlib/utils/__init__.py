@@ -1,5 +1,9 @@
 # classxlib/utils/__init__.py
 
 from ._parse import (parse_int, parse_float)
+from ._executor import (configure_executor, get_executor, get_max_workers, submit_task,
+                        gather_tasks, cancel_tasks, shutdown_executor)
 
-__all__ = ['parse_int','parse_float']
\ No newline at end of file
+__all__ = ['parse_int','parse_float',
+           'configure_executor','get_executor','get_max_workers','submit_task',
+           'gather_tasks','cancel_tasks','shutdown_executor']
\ No newline at end of file
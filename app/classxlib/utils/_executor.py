@@ -0,0 +1,205 @@
+"""Utility Module for a persistent process pool shared
+by all requests running within the same process"""
+# Python Standard Library Imports
+import os
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+
+__all__ = ['configure_executor', 'get_executor', 'get_max_workers', 'submit_task',
+           'gather_tasks', 'cancel_tasks', 'shutdown_executor']
+
+# Default sizes of the worker pool and the amount of tasks
+# allowed to wait in the queue per worker
+DEFAULT_MAX_WORKERS = max(os.cpu_count() or 1, 1)
+DEFAULT_QUEUE_FACTOR = 4
+
+# The amount of seconds a submission waits for a queue slot
+DEFAULT_SUBMIT_TIMEOUT = 300
+
+_EXECUTOR = None
+_EXECUTOR_SLOTS = None
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR_SETTINGS = {'max_workers': DEFAULT_MAX_WORKERS,
+                      'max_queue': DEFAULT_MAX_WORKERS * DEFAULT_QUEUE_FACTOR}
+
+def configure_executor(max_workers:int=None,
+                       max_queue:int=None,
+                       process_count:int=None) -> None:
+    """Sets the size of the shared process pool, if the pool is
+    already running it is shut down and restarted on next use
+
+    Args:
+        max_workers (int, optional): The amount of worker processes.
+        Defaults to the CPU count shared by the processes of process_count.
+        max_queue (int, optional): The maximum amount of submitted tasks
+        that have not completed. Defaults to 4 times the worker count.
+        process_count (int, optional): The amount of processes that each
+        start a pool, such as the web server workers, so their pools
+        together don't use more processes than there are CPUs. Defaults to 1.
+    """
+    if max_workers:
+        max_workers = max(int(max_workers), 1)
+    else:
+        max_workers = max(DEFAULT_MAX_WORKERS // max(int(process_count or 1), 1), 1)
+    max_queue = max(int(max_queue), max_workers) if max_queue \
+                else max_workers * DEFAULT_QUEUE_FACTOR
+
+    with _EXECUTOR_LOCK:
+        _EXECUTOR_SETTINGS['max_workers'] = max_workers
+        _EXECUTOR_SETTINGS['max_queue'] = max_queue
+        _shutdown_locked(wait_for_tasks=False)
+
+def get_executor() -> ProcessPoolExecutor:
+    """Gets the shared process pool, creating it on first use
+    or if a worker process died and broke the pool
+
+    Returns:
+        ProcessPoolExecutor: The shared process pool
+    """
+    global _EXECUTOR, _EXECUTOR_SLOTS # pylint: disable=global-statement
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None or getattr(_EXECUTOR, '_broken', False):
+            # Forking a process that is running threads can copy held
+            # locks into the child so a forkserver is used where available
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+            else:
+                context = multiprocessing.get_context('spawn')
+            _EXECUTOR = ProcessPoolExecutor(max_workers=_EXECUTOR_SETTINGS['max_workers'],
+                                            mp_context=context)
+            _EXECUTOR_SLOTS = threading.BoundedSemaphore(_EXECUTOR_SETTINGS['max_queue'])
+        return _EXECUTOR
+
+def get_max_workers() -> int:
+    """Gets the amount of worker processes of the shared process pool
+
+    Returns:
+        int: The amount of worker processes, 1 in a daemonic process
+        where tasks run in the calling process
+    """
+    if _is_daemonic_process():
+        return 1
+    return _EXECUTOR_SETTINGS['max_workers']
+
+def submit_task(function,
+                *args,
+                timeout:float=DEFAULT_SUBMIT_TIMEOUT,
+                **kwargs) -> Future:
+    """Submits a task to the shared process pool, if the queue
+    is full this waits until a slot frees up
+
+    Args:
+        function (callable): A picklable module level function
+        timeout (float, optional): Seconds to wait for a queue slot.
+        Defaults to 300.
+
+    Raises:
+        RuntimeError: If no queue slot became available in time
+
+    Returns:
+        Future: The future of the submitted task
+    """
+    if _is_daemonic_process():
+        return _run_in_process(function, *args, **kwargs)
+    executor = get_executor()
+    slots = _EXECUTOR_SLOTS
+    if not slots.acquire(timeout=timeout):
+        raise RuntimeError("Process pool queue is full")
+    try:
+        future = executor.submit(function, *args, **kwargs)
+    except (RuntimeError, BrokenProcessPool):
+        slots.release()
+        raise
+    # Releasing the queue slot once the task is finished or cancelled
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+def gather_tasks(future_list:list,
+                 timeout:float=None) -> list:
+    """Waits for a list of futures and returns their results in
+    order, if any task fails or the timeout passes the remaining
+    tasks are cancelled
+
+    Args:
+        future_list (list): List of futures from submit_task
+        timeout (float, optional): Seconds to wait for all tasks.
+        Defaults to None.
+
+    Raises:
+        TimeoutError: If the tasks did not complete in time
+
+    Returns:
+        list: List of the task results
+    """
+    try:
+        _, not_done = wait(future_list, timeout=timeout)
+        if not_done:
+            raise TimeoutError("Process pool tasks did not complete in time")
+        return [future.result() for future in future_list]
+    except BaseException:
+        cancel_tasks(future_list)
+        raise
+
+def cancel_tasks(future_list:list) -> int:
+    """Cancels all tasks that have not started running yet
+
+    Args:
+        future_list (list): List of futures from submit_task
+
+    Returns:
+        int: The amount of tasks cancelled
+    """
+    return sum(future.cancel() for future in future_list)
+
+def shutdown_executor(wait_for_tasks:bool=True) -> None:
+    """Shuts down the shared process pool
+
+    Args:
+        wait_for_tasks (bool, optional): Wait for running tasks
+        to complete. Defaults to True.
+    """
+    with _EXECUTOR_LOCK:
+        _shutdown_locked(wait_for_tasks=wait_for_tasks)
+
+def _is_daemonic_process() -> bool:
+    """Checks if this is a daemonic process such as a prefork Celery worker,
+    these are not allowed to start the processes of a pool
+
+    Returns:
+        bool: True if child processes can't be started
+    """
+    return bool(multiprocessing.current_process().daemon)
+
+def _run_in_process(function,
+                    *args,
+                    **kwargs) -> Future:
+    """Runs a task in the calling process
+
+    Returns:
+        Future: The completed future of the task
+    """
+    future = Future()
+    try:
+        future.set_result(function(*args, **kwargs))
+    except Exception as error: # pylint: disable=broad-except
+        future.set_exception(error)
+    return future
+
+def _shutdown_locked(wait_for_tasks:bool) -> None:
+    """Shuts down the shared process pool, the executor lock
+    must be held by the caller
+
+    Args:
+        wait_for_tasks (bool): Wait for running tasks to complete
+    """
+    global _EXECUTOR # pylint: disable=global-statement
+    if _EXECUTOR is not None:
+        try:
+            _EXECUTOR.shutdown(wait=wait_for_tasks, cancel_futures=True)
+        except (RuntimeError, OSError) as error:
+            print("Error:", error)
+            traceback.print_tb(error.__traceback__)
+        _EXECUTOR = None
@@ -31,7 +31,6 @@ class Config:
     TEMPLATES_FOLDER = 'templates'
     ADDRESS = environ.get('ADDRESS')
     DB_PASSWORD = environ.get("DB_PASSWORD")
-    MODEL_RETRAIN_SPAN = 4
     # Database
     SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://'+environ.get('MYSQL_ROOT_USER')+':'+environ.get('MYSQL_ROOT_PASSWORD')+'@'+environ.get('HOST')+':'+environ.get('DB_PORT')+'/'+environ.get('DB')
     # Adding binds
@@ -77,3 +76,51 @@ class Config:
     OAUTH_API_SECRET = environ.get('ADMIN_CLIENT_SECRET')
 
     CELERY_URL = environ.get('CELERY_REDIS_URL')
+
+    # Shared process pool used for segmentation and feature extraction
+    # Every web worker process starts its own pool so when not set the
+    # pool size defaults to the CPU count divided by the web worker count.
+    # WEB_CONCURRENCY is also read by gunicorn as its worker count.
+    WEB_WORKERS = int(environ.get('WEB_CONCURRENCY', 1))
+    PROCESS_POOL_WORKERS = environ.get('PROCESS_POOL_WORKERS')
+    PROCESS_POOL_QUEUE_SIZE = environ.get('PROCESS_POOL_QUEUE_SIZE')
+
+    # Local disk cache of preprocessed crops used by segmentation previews
+    PREPROCESS_CACHE_FOLDER = environ.get('PREPROCESS_CACHE_FOLDER')
+    PREPROCESS_CACHE_SIZE_MB = int(environ.get('PREPROCESS_CACHE_SIZE_MB', 1024))
+
+    # Segmentation previews are kept on disk and referenced from the session
+    PREVIEW_ARTIFACT_FOLDER = 'static/images/preview_artifacts'
+    PREVIEW_ARTIFACT_TTL = int(environ.get('PREVIEW_ARTIFACT_TTL', 2 * 60 * 60))
+    PREVIEW_ARTIFACT_SIZE_MB = int(environ.get('PREVIEW_ARTIFACT_SIZE_MB', 1024))
+
+    # Memory budget of the segment images cached by each web worker process
+    SEGMENT_CACHE_SIZE_MB = int(environ.get('SEGMENT_CACHE_SIZE_MB', 256))
+
+    # Memory budget of the label overlays and segment pixel indexes
+    # kept by each web worker process
+    LABEL_OVERLAY_CACHE_SIZE_MB = int(environ.get('LABEL_OVERLAY_CACHE_SIZE_MB', 256))
+
+    # Size of a label edit journal that queues its compaction into the segment image file
+    LABEL_JOURNAL_COMPACT_KB = int(environ.get('LABEL_JOURNAL_COMPACT_KB', 256))
+
+    # Formats of the images sent to the front-end, labeling images have to be
+    # lossless (png or webp) while previews may also be jpeg
+    IMAGE_RESPONSE_FORMAT = environ.get('IMAGE_RESPONSE_FORMAT', 'png')
+    IMAGE_PREVIEW_FORMAT = environ.get('IMAGE_PREVIEW_FORMAT', 'png')
+    IMAGE_PNG_COMPRESSION = int(environ.get('IMAGE_PNG_COMPRESSION', 1))
+    IMAGE_JPEG_QUALITY = int(environ.get('IMAGE_JPEG_QUALITY', 90))
+    IMAGE_WEBP_METHOD = int(environ.get('IMAGE_WEBP_METHOD', 0))
+    # Memory budget of the encoded images cached by content, 0 disables the cache
+    IMAGE_ENCODE_CACHE_SIZE_MB = int(environ.get('IMAGE_ENCODE_CACHE_SIZE_MB', 0))
+
+    # Amount of trained classifiers kept loaded by each web worker process
+    MODEL_CACHE_SIZE = int(environ.get('MODEL_CACHE_SIZE', 4))
+    # Algorithm ids trained in the background when a training file changes
+    # 0: svm, 1: random forest, 2: xgboost, 3: knn
+    MODEL_PRETRAIN_ALGORITHMS = [int(algorithm_id) for algorithm_id in
+                                 environ.get('MODEL_PRETRAIN_ALGORITHMS', '0,1,2,3').split(',')
+                                 if algorithm_id.strip()]
+    # Seconds auto labeling waits on background training before it fits
+    # the classifier in the request, such as when no celery worker is running
+    MODEL_TRAINING_TIMEOUT = int(environ.get('MODEL_TRAINING_TIMEOUT', 600))
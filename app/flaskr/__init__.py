@@ -6,7 +6,9 @@ import os
 # Python Third Party Imports
 from celery import Celery
 # This has to be created here to avoid circular imports
-celery = Celery('tasks', broker=os.environ.get('CELERY_REDIS_URL'))
+# The result backend lets the web app poll the progress of tasks
+celery = Celery('tasks', broker=os.environ.get('CELERY_REDIS_URL'),
+                backend=os.environ.get('CELERY_REDIS_URL'))
 from flask import Flask
 from flask_session import Session
 
@@ -23,8 +25,15 @@ from .segment_image import SEGMENT_IMAGE
 from .label import LABEL
 from .user import USER
 from .error import ERROR
+from .celery import compact_segment_label_journal, train_training_file_models
 
 from classxlib.database import DatabaseService
+from classxlib.utils import configure_executor
+from classxlib.color import configure_label_overlay_cache
+from classxlib.image import configure_image_encoder
+from classxlib.segment import (configure_preprocess_cache, configure_preview_artifacts,
+                               configure_segment_cache, configure_label_journal)
+from classxlib.train import configure_model_registry
 
 
 def create_app():
@@ -49,6 +58,46 @@ def create_app():
     # Initializing the database
     database.init_app(app)
 
+    # Sizing the shared process pool, the pool itself is
+    # started the first time a task is submitted
+    configure_executor(max_workers=app.config['PROCESS_POOL_WORKERS'],
+                       max_queue=app.config['PROCESS_POOL_QUEUE_SIZE'],
+                       process_count=app.config['WEB_WORKERS'])
+
+    # Setting up the disk cache of preprocessed segmentation images
+    configure_preprocess_cache(cache_directory=app.config['PREPROCESS_CACHE_FOLDER'],
+                               max_size_mb=app.config['PREPROCESS_CACHE_SIZE_MB'])
+
+    # Setting up the disk store of segmentation previews
+    configure_preview_artifacts(artifact_directory=app.config['PREVIEW_ARTIFACT_FOLDER'],
+                                ttl_seconds=app.config['PREVIEW_ARTIFACT_TTL'],
+                                max_size_mb=app.config['PREVIEW_ARTIFACT_SIZE_MB'])
+
+    # Setting the memory budget of the segment images cached for labeling
+    configure_segment_cache(max_size_mb=app.config['SEGMENT_CACHE_SIZE_MB'])
+
+    # Setting the memory budget of the incrementally rendered label overlays
+    configure_label_overlay_cache(max_size_mb=app.config['LABEL_OVERLAY_CACHE_SIZE_MB'])
+
+    # Label edits are journaled and large journals are compacted by the worker
+    configure_label_journal(compact_size_kb=app.config['LABEL_JOURNAL_COMPACT_KB'],
+                            compact_callback=compact_segment_label_journal.delay)
+
+    # Setting the formats and compression of the images sent to the front-end
+    configure_image_encoder(response_format=app.config['IMAGE_RESPONSE_FORMAT'],
+                            preview_format=app.config['IMAGE_PREVIEW_FORMAT'],
+                            png_compression=app.config['IMAGE_PNG_COMPRESSION'],
+                            jpeg_quality=app.config['IMAGE_JPEG_QUALITY'],
+                            webp_method=app.config['IMAGE_WEBP_METHOD'],
+                            cache_size_mb=app.config['IMAGE_ENCODE_CACHE_SIZE_MB'])
+
+    # Keeping recently used classifiers loaded in each worker process,
+    # classifiers are trained by the worker whenever a training file changes
+    configure_model_registry(cache_size=app.config['MODEL_CACHE_SIZE'],
+                             pretrain_algorithms=app.config['MODEL_PRETRAIN_ALGORITHMS'],
+                             train_callback=train_training_file_models.delay,
+                             training_timeout=app.config['MODEL_TRAINING_TIMEOUT'])
+
     # Initalizing the OAuth App
     oauth.init_app(app)
 
@@ -1,5 +1,6 @@
 # Python standard imports
 import os
+import threading
 from typing import List, AnyStr
 from datetime import datetime, timezone
 
@@ -14,6 +15,9 @@ from classxlib.database import is_default_user, DatabaseService
 from classxlib.file import merge_directory, get_file_size, format_database_path
 from classxlib.image import write_cv_image, write_hdf5_image, read_cv_image, read_hdf5_image
 from classxlib.image.process import process_research_image, process_image_grid, crop_grid_square
+from classxlib.segment import (run_segmentation_preview, write_preview_artifact,
+                               compact_label_journal)
+from classxlib.train import train_classifiers
 from .globals import STATIC_FOLDER, IMAGE_FOLDER, USER_UPLOAD_FOLDER
 from .database import get_db
 
@@ -213,3 +217,87 @@ def auto_crop_image(original_image_id:int, crop_size:int = 512):
             # print(f'Saving cropped image')
             # Saving the object in the database
             crop_image_service.add_image(crop_image_obj)
+
+
+@celery.task(bind=True, name='tasks.preview_segment_image')
+def preview_segment_image(self, parameter_data: dict, crop_image_path: AnyStr, h5_crop_image_path: AnyStr, histogram_method_list: List[int]) -> dict:
+    """Segments a crop image once per histogram method for previewing.
+    The progress of every stage is published as the PROGRESS state and the
+    previews are written to the preview artifact store so only their tokens
+    are returned.
+
+    Args:
+        parameter_data (dict): Processed segment parameters.
+        crop_image_path (str): Path to the crop visualization image.
+        h5_crop_image_path (str): Path to the crop image data, None if it doesn't exist.
+        histogram_method_list (list): The histogram methods to segment with.
+
+    Returns:
+        dict: The preview token and seconds spent in each stage per histogram method.
+    """
+    # Seconds spent in each stage keyed by histogram method
+    stage_timings = {str(histogram_method): {} for histogram_method in histogram_method_list}
+    timing_lock = threading.Lock()
+
+    def report_progress(histogram_method, stage, seconds):
+        # Called from the segmentation branch threads
+        with timing_lock:
+            stage_timings[str(histogram_method)][stage] = round(seconds, 4)
+            self.update_state(state='PROGRESS', meta={'stage': stage,
+                                                      'hist_method': histogram_method,
+                                                      'timings': stage_timings})
+
+    segmentation_list = run_segmentation_preview(image_path=crop_image_path,
+                                                 h5_image_path=h5_crop_image_path,
+                                                 parameter_dict=parameter_data,
+                                                 histogram_method_list=histogram_method_list,
+                                                 progress_callback=report_progress)
+
+    # Writing the previews to the shared static folder for the web app to read
+    preview_list = []
+    for histogram_method, (marked_image, segment_image) in zip(histogram_method_list, segmentation_list):
+        artifact_token = write_preview_artifact(marked_image=marked_image,
+                                                segment_image=segment_image)
+        if artifact_token is None:
+            raise OSError("Failed writing the segmentation preview")
+        preview_list.append({'hist_method': histogram_method,
+                             'artifact_token': artifact_token})
+
+    return {'previews': preview_list,
+            'timings': stage_timings}
+
+
+@celery.task(name='tasks.compact_label_journal')
+def compact_segment_label_journal(segment_image_path: AnyStr) -> bool:
+    """Writes the journaled label edits of a segment image into its
+    segment info, queued by the web app once a journal grows large.
+
+    Args:
+        segment_image_path (str): File path of the segment image in the shared static folder
+
+    Returns:
+        bool: True if the journal was compacted
+    """
+    return compact_label_journal(segment_image_path)
+
+
+@celery.task(name='tasks.train_training_file_models')
+def train_training_file_models(training_file_path: AnyStr, image_type: AnyStr, unknown_label_id: int,
+                               model_directory: AnyStr, model_name: AnyStr) -> dict:
+    """Trains the configured classifiers of a training file after it changed,
+    queued by the web app so auto labeling never waits on training.
+
+    Args:
+        training_file_path (str): File path of the training file in the shared static folder
+        image_type (str): Name of the label vector dataset
+        unknown_label_id (int): Label id left out of training
+        model_directory (str): Directory of the training file's models
+        model_name (str): Name of the training file's models
+
+    Returns:
+        dict: The fingerprint of each trained algorithm id, None if it failed
+    """
+    trained_models = train_classifiers(training_file_path, image_type, unknown_label_id,
+                                       model_directory, model_name)
+    # Celery results are JSON so the algorithm ids are sent as strings
+    return {str(algorithm_id): fingerprint for algorithm_id, fingerprint in trained_models.items()}
@@ -17,6 +17,7 @@ from classxlib.file import *
 from classxlib.image import read_cv_image, read_hdf5_image, write_cv_image, write_hdf5_image
 from classxlib.image.process import create_crop
 from classxlib.image.analysis import is_image_black
+from classxlib.segment import delete_label_journal
 from classxlib.database import DatabaseService, is_default_user
 from classxlib.database.service import (CropImageService,OriginalImageService,
                                         UserService, SegmentImageService,
@@ -277,6 +278,7 @@ def delete_crop_image():
                     # Removing them
                     os.remove(segment_image_path)
                     os.remove(marked_image_path)
+                    delete_label_journal(segment_image_path)
 
                     # Removing entry from database
                     segment_image_service.remove_image(segment_image_obj)
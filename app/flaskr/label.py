@@ -1,4 +1,5 @@
 # Python Standard Library Imports
+import gzip
 import io
 import json
 import os
@@ -27,10 +28,9 @@ from flask import (
     session,
     url_for,
 )
-from flask import current_app as app
 from skimage.util import img_as_ubyte
 
-from classxlib.color import color_labeled_image
+from classxlib.color import color_labeled_image, hex2rgb, render_label_overlay
 from classxlib.database import DatabaseService, is_default_user
 from classxlib.database.model import (
     CropImage,
@@ -53,21 +53,45 @@ from classxlib.database.service import (
 
 # Local Library Imports
 from classxlib.file import *
-from classxlib.image import image_as_b64, read_cv_image, read_hdf5_image, write_cv_image
+from classxlib.image import (
+    get_image_mime_type,
+    image_as_b64,
+    read_cv_image,
+    read_hdf5_image,
+    write_cv_image,
+)
 from classxlib.image._write import write_hdf5_image
 from classxlib.image.transform import rescale_intensity
-from classxlib.label import get_unknown_label_from_research_field, remove_small_labels
+from classxlib.label import (
+    apply_label_edits,
+    get_unknown_label_from_research_field,
+    remove_small_labels,
+)
 from classxlib.security.keycloak import oAuthManager
 from classxlib.segment import (
-    get_labeled_segment_count,
+    compact_label_journal,
+    encode_segment_raster,
+    get_label_delta,
+    get_histogram_segment_count,
+    get_label_areas,
+    get_label_class_list,
+    get_next_unlabeled_segment,
+    get_segment_label_state,
+    read_cached_label_histogram,
+    read_cached_marked_image,
+    read_cached_segment_image,
+    read_cached_segment_index,
     read_segment_image,
-    update_segment_image_info,
+    update_cached_segment_info,
 )
 from classxlib.train import (
     classify_image,
     delete_image_from_file,
+    get_model_name,
     get_unique_parent_ids_from_link,
+    load_ready_classifier,
     read_training_file,
+    request_model_training,
     write_training_file,
 )
 from classxlib.train._export import (
@@ -206,6 +230,7 @@ def update_label_opacity():
     Request Args:
         segment_image_id(int): The id of the segmented image.
         new_opacity(float): The opacity value of the segmented image
+        mode(str): Optional, 'delta' only stores the opacity
 
     Returns:
         JSON:Formatted response dict object for front-end
@@ -214,6 +239,7 @@ def update_label_opacity():
             -error(str): Informational error message ONLY returned when status 404
                         is returned
             -image_string(String): Path to the image
+            -image_type(String): MIME type of the encoded image
     """
     # Retrieving Database
     db = get_db()
@@ -239,6 +265,10 @@ def update_label_opacity():
 
     session['label_opacity'] = new_opacity
 
+    # In delta mode the client re-blends the overlay itself
+    if request.args.get('mode') == 'delta':
+        return {'status': 200, 'label_opacity': new_opacity}
+
     # Retrieve segment image object from database
     segment_image_obj = segment_image_service.get_user_image(segment_image_id=segment_image_id,
                                                              user_id=user_obj.id,
@@ -255,36 +285,38 @@ def update_label_opacity():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Reading segment image file
-    segment_image, segment_info = read_segment_image(segment_image_path)
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
 
     research_field_label_map = {}
     for label in research_field_obj.label_map:
         research_field_label_map[label["id"]] = {"name":label["name"],"color":label["color"]}
 
     # Gettting the counts of labeled and unlabeled segments
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
 
     # Formatting path to marked image
     marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
     # Reading marked image
-    marked_image = read_cv_image(marked_image_path,noflag=True)
+    marked_image = read_cached_marked_image(marked_image_path)
 
     # Color the labeled segments in the image
     # Skips logic if there is no labeled segments to avoid unnecessary processing
     if unlabeled_segment_count == total_segment_count:
         color_image = marked_image
     else:
-        color_image = color_labeled_image(input_image=marked_image,
-                                          segment_image=segment_image,
-                                          segment_info=segment_info,
-                                          research_label_map=research_field_obj.label_map,
-                                          alpha=session['label_opacity'])
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
     #print('Color image is generated.')
 
     #Converting image to base 64 for front-end return
     base64_image = image_as_b64(color_image)
 
-    return {'status': 200,'image_string':base64_image}
+    return {'status': 200,'image_string':base64_image,'image_type':get_image_mime_type()}
 
 
 @LABEL.route("/getLabelImage/", methods = ['GET', 'POST'], endpoint="getLabelImage")
@@ -306,6 +338,7 @@ def get_label_image():
             -error(str): Informational error message ONLY returned when status 404
                         is returned
             - image_string(str): Base64 encoded string of the colored image.
+            - image_type(str): MIME type of the encoded image.
             - labeled_segments(int): Count of labeled segments.
             - total_segments(int): Total count of segments.
             - label_class_list(list): List of tuples containing label IDs and their respective counts.
@@ -347,31 +380,33 @@ def get_label_image():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Reading segment image file
-    segment_image, segment_info = read_segment_image(segment_image_path)
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
 
     research_label_map = {}
     for label in research_field_obj.label_map:
         research_label_map[label["id"]] = {"name":label["name"],"color":label["color"]}
 
     # Gettting the counts of labeled and unlabeled segments
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
 
     # Formatting path to marked image
     marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
 
     # Reading marked image
-    marked_image = read_cv_image(marked_image_path,noflag=True)
+    marked_image = read_cached_marked_image(marked_image_path)
 
     # Color the labeled segments in the image
     # Skips logic if there is no labeled segments to avoid unnecessary processing
     if unlabeled_segment_count == total_segment_count:
         color_image = marked_image
     else:
-        color_image = color_labeled_image(input_image=marked_image,
-                                          segment_image=segment_image,
-                                          segment_info=segment_info,
-                                          research_label_map=research_field_obj.label_map,
-                                          alpha=session['label_opacity'])
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
     #print('Color image is generated.')
 
     #Converting image to base 64 for front-end return
@@ -379,11 +414,175 @@ def get_label_image():
 
     return {'status': 200,
             'image_string':base64_image,
+            'image_type':get_image_mime_type(),
             'labeled_segments':labeled_segment_count,
             'total_segments': total_segment_count,
-            'label_class_list': np.column_stack(np.unique(segment_info[:,1], return_counts=True)).tolist(),
+            'label_class_list': get_label_class_list(label_histogram),
             'label_map':research_label_map}
 
+@LABEL.route("/getSegmentRaster/", methods = ['GET'], endpoint="getSegmentRaster")
+def get_segment_raster():
+    """
+    Retrieves the segment raster of a segment image so the client can
+    composite the label overlay, the raster never changes after
+    segmentation so it is cached by the client with an ETag
+
+    Session Args:
+        user_obj(User): User database object retrieved by
+        verifying session token against database.
+
+    Request Args:
+        segment_image_id(int): The id of the segmented image.
+
+    Returns:
+        Response: The gzip encoded little endian raster with the headers
+            -X-Raster-Dtype(str): uint16 or uint32
+            -X-Raster-Width(int): Columns of the raster
+            -X-Raster-Height(int): Rows of the raster
+        or 304 if the client ETag matches
+    """
+    # Retrieving Database
+    db = get_db()
+    oauth = get_oauth()
+
+    # Setting up services
+    user_service = db.user_service
+    segment_image_service = db.segment_image_service
+
+    # Verifying the session is valid and retrieving user object
+    valid_session = oauth.validate_user_session()
+
+    if not valid_session:
+        session['url'] = 'go-back'
+        return redirect(url_for('auth.login'))
+
+    user_obj : User = user_service.get_by_uuid(session['uuid'])
+
+    segment_image_id = request.args.get('segment_image_id', type = int)
+
+    # Retrieve segment image object from database
+    segment_image_obj = segment_image_service.get_user_image(segment_image_id=segment_image_id,
+                                                             user_id=user_obj.id,
+                                                             default_id=db.DEFAULT_ID)
+    if segment_image_obj is None:
+        return make_response(('',404, {'error': "segment image not found"}))
+
+    # Formatting path to segment image
+    segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
+
+    # Reading segment image file
+    segment_file = read_cached_segment_image(segment_image_path)
+    if segment_file is None:
+        return make_response(('',404, {'error': "segment image could not be read"}))
+
+    encoded_raster = encode_segment_raster(segment_image_path, segment_file[0])
+
+    # Clients that can't decode gzip get the raw raster
+    if 'gzip' in request.accept_encodings:
+        response = make_response(encoded_raster['data'])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(gzip.decompress(encoded_raster['data']))
+    response.headers['Content-Type'] = 'application/octet-stream'
+    response.headers['X-Raster-Dtype'] = encoded_raster['dtype']
+    response.headers['X-Raster-Width'] = str(encoded_raster['width'])
+    response.headers['X-Raster-Height'] = str(encoded_raster['height'])
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.set_etag(encoded_raster['etag'])
+    return response.make_conditional(request)
+
+
+@LABEL.route("/getLabelState/", methods = ['GET'], endpoint="getLabelState")
+def get_label_state():
+    """
+    Retrieves the label of every segment so the client can composite
+    the label overlay from the segment raster and the marked image
+
+    Session Args:
+        user_obj(User): User database object retrieved by
+        verifying session token against database.
+
+    Request Args:
+        segment_image_id(int): The id of the segmented image.
+
+    Returns:
+        JSON:Formatted response dict object for front-end
+            -status(int): HTTP Status code returns 200 if successful
+                          returns 404 if there are errors
+            -error(str): Informational error message ONLY returned when status 404
+                        is returned
+            - segment_labels(list): Label id of each segment number.
+            - label_colors(dict): Mapping of label IDs to their RGB colors.
+            - label_opacity(float): Opacity of the labels.
+            - marked_image_url(str): URL of the marked boundary image.
+            - raster_etag(str): ETag of the segment raster.
+            - labeled_segments(int): Count of labeled segments.
+            - total_segments(int): Total count of segments.
+            - label_class_list(list): List of tuples containing label IDs and their respective counts.
+    """
+    # Retrieving Database
+    db = get_db()
+    oauth = get_oauth()
+
+    # Setting up services
+    user_service = db.user_service
+    segment_image_service = db.segment_image_service
+    research_field_service = db.research_field_service
+
+    # Verifying the session is valid and retrieving user object
+    valid_session = oauth.validate_user_session()
+
+    if not valid_session:
+        session['url'] = 'go-back'
+        return redirect(url_for('auth.login'))
+
+    user_obj : User = user_service.get_by_uuid(session['uuid'])
+
+    segment_image_id = request.args.get('segment_image_id', type = int)
+
+    # Retrieve segment image object from database
+    segment_image_obj = segment_image_service.get_user_image(segment_image_id=segment_image_id,
+                                                             user_id=user_obj.id,
+                                                             default_id=db.DEFAULT_ID)
+    if segment_image_obj is None:
+        return {'status':404, 'error':"Segment image not found"}
+
+    # Getting research associated with the segment image object
+    research_field_obj = research_field_service.get_by_id(segment_image_obj.research_id)
+
+    # Verifying research field exsistence
+    if research_field_obj is None:
+        return {'status':404, 'error':"Research Field not found"}
+
+    # Formatting path to segment image
+    segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
+
+    # Reading segment image file
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # RGB color of every label, later labels with the same id take priority
+    label_colors = {}
+    for label in research_field_obj.label_map:
+        color = hex2rgb(label["color"])
+        if color is not None:
+            label_colors[label["id"]] = color
+
+    # Gettting the counts of labeled and unlabeled segments
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, _ = get_histogram_segment_count(label_histogram)
+
+    return {'status': 200,
+            'segment_labels': get_segment_label_state(segment_info),
+            'label_colors': label_colors,
+            'label_opacity': session['label_opacity'],
+            'marked_image_url': url_for('static', filename=segment_image_obj.marked_image_path),
+            'raster_etag': encode_segment_raster(segment_image_path, segment_image)['etag'],
+            'labeled_segments':labeled_segment_count,
+            'total_segments': total_segment_count,
+            'label_class_list': get_label_class_list(label_histogram)}
+
 ######################################################################
 # endpoint called when segmented image is clicked in labeling process
 ######################################################################
@@ -403,6 +602,7 @@ def label_segment():
         domain_label_id(int): The id of the domain label
         click_location_x(float): The position along the x-axis that was clicked
         click_location_y(float): The position along the y-axis that was clicked
+        mode(str): Optional, 'delta' returns label_delta instead of image_string
         
      Returns:
         JSON:Formatted response dict object for front-end
@@ -411,6 +611,7 @@ def label_segment():
             -error(str): Informational error message ONLY returned when status 404
                         is returned
             - image_string(str): Base64 encoded string of the colored image.
+            - image_type(str): MIME type of the encoded image.
             - labeled_segments(int): Count of labeled segments.
             - total_segments(int): Total count of segments.
             - label_class_list(list): List of tuples containing label IDs and their respective counts.
@@ -467,11 +668,17 @@ def label_segment():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Reading segment image file
-    segment_image, segment_info = read_segment_image(segment_image_path)
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # Labels before the edit for the delta response
+    previous_labels = segment_info[:,1].copy()
 
     # Retrieving the clicked segment number
     selected_segment_id = int(segment_image[adjusted_location_y, adjusted_location_x])
 
+    # Next segment navigation continues from the clicked segment
+    session['label_cursor'] = [segment_image_id, selected_segment_id]
+
     #print(f'clicked seg id {selected_segment_id}')
 
     # Updating the segment label map of the segment image object in database
@@ -479,28 +686,39 @@ def label_segment():
         # Updating segment label id on the segment info
         # The -1 is because the index starts from 0 in the array but segment numbers start from 1
         segment_info[selected_segment_id-1][1] = research_label_id
-        update_segment_image_info(segment_info, segment_image_path)
+        update_cached_segment_info(segment_info, segment_image_path, previous_labels)
 
 
     # Gettting the counts of labeled and unlabeled segments
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
+
+    # In delta mode only the changed segment labels are returned
+    # and the client composites the overlay from the segment raster
+    if request.args.get('mode') == 'delta':
+        return {'status': 200,
+                'label_delta': get_label_delta(previous_labels, segment_info),
+                'labeled_segments':labeled_segment_count,
+                'total_segments':total_segment_count,
+                'label_class_list':get_label_class_list(label_histogram)}
 
     # Formatting path to marked image
     marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
 
     # Reading marked image
-    marked_image = read_cv_image(marked_image_path,noflag=True)
+    marked_image = read_cached_marked_image(marked_image_path)
 
     # Color the labeled segments in the image
     # Skips logic if there is no labeled segments to avoid unnecessary processing
     if unlabeled_segment_count == total_segment_count:
         color_image = marked_image
     else:
-        color_image = color_labeled_image(input_image=marked_image,
-                                          segment_image=segment_image,
-                                          segment_info=segment_info,
-                                          research_label_map=research_field_obj.label_map,
-                                          alpha=session['label_opacity'])
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
     #print('Color image is generated.')
 
 
@@ -508,9 +726,152 @@ def label_segment():
     base64_image = image_as_b64(color_image)
     return {'status': 200,
             'image_string':base64_image,
+            'image_type':get_image_mime_type(),
+            'labeled_segments':labeled_segment_count,
+            'total_segments':total_segment_count,
+            'label_class_list':get_label_class_list(label_histogram)}
+
+######################################################################
+# endpoint called with a batch of label edits in labeling process
+######################################################################
+@LABEL.route("/labelSegments/", methods = ['POST'], endpoint="labelSegments")
+def label_segments():
+    """
+    Applies a batch of label edits to a segment image and saves
+    the segment info once
+
+    Session Args:
+        user_obj(User): User database object retrieved by
+        verifying session token against database.
+
+    Request JSON:
+        segment_image_id(int): The id of the segmented image.
+        actualSize(int): Display size the coordinates are relative to. Defaults to 512
+        mode(str): Optional, 'delta' returns label_delta instead of image_string
+        edits(list): The edits applied in order, each with a label_id and one of
+            -segment_id(int): A segment number
+            -x(float), y(float): A click location
+            -brush(list), radius(float): Points of a brush stroke
+            -polygon(list): Points of a lasso selection
+
+    Returns:
+        JSON:Formatted response dict object for front-end
+            -status(int): HTTP Status code returns 200 if successful
+                          returns 400/404 if there are errors
+            -error(str): Informational error message ONLY returned when status 400/404
+                        is returned
+            - changed_segments(int): Count of segments whose label changed.
+            - image_string(str): Base64 encoded string of the colored image.
+            - image_type(str): MIME type of the encoded image.
+            - label_delta(dict): The changed segments ONLY returned in delta mode.
+            - labeled_segments(int): Count of labeled segments.
+            - total_segments(int): Total count of segments.
+            - label_class_list(list): List of tuples containing label IDs and their respective counts.
+    """
+    # Retrieving Database
+    db = get_db()
+    oauth = get_oauth()
+
+    # Setting up services
+    user_service = db.user_service
+    segment_image_service = db.segment_image_service
+    research_field_service = db.research_field_service
+
+    # Verifying the session is valid and retrieving user object
+    valid_session = oauth.validate_user_session()
+
+    if not valid_session:
+        session['url'] = 'go-back'
+        return redirect(url_for('auth.login'))
+
+    user_obj : User = user_service.get_by_uuid(session['uuid'])
+
+    # Retrieving the batch of edits
+    request_data = request.get_json(silent=True) or {}
+    segment_image_id = request_data.get('segment_image_id')
+    label_edit_list = request_data.get('edits')
+    if not isinstance(label_edit_list, list):
+        return {'status': 400, 'error': "edits needs to be a list"}
+
+    # Retrieve segment image object from database
+    segment_image_obj = segment_image_service.get_user_image(segment_image_id=segment_image_id,
+                                                             user_id=user_obj.id,
+                                                             default_id=db.DEFAULT_ID)
+    if segment_image_obj is None:
+        return {'status':404, 'error':"Segment image not found"}
+
+    # Getting research associated with the segment image object
+    research_field_obj = research_field_service.get_by_id(segment_image_obj.research_id)
+
+    # Verifying research field exsistence
+    if research_field_obj is None:
+        return {'status':404, 'error':"Research Field not found"}
+
+    # scaling factor from the front-end display to the segment image
+    actualSize = request_data.get('actualSize') or 512
+    scale = segment_image_obj.crop_size/actualSize
+
+    # Formatting path to segment image
+    segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
+
+    # Reading segment image file
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # Labels before the edit for the delta response
+    previous_labels = segment_info[:,1].copy()
+
+    # Applying every edit in memory, 0 unlabels a segment
+    allowed_label_ids = {label["id"] for label in research_field_obj.label_map} | {0}
+    changed_segment_count = apply_label_edits(segment_image, segment_info, label_edit_list,
+                                              allowed_label_ids, scale)
+    if changed_segment_count is None:
+        return {'status': 400, 'error': "invalid label edit"}
+
+    # Saving the segment info once for the whole batch
+    if changed_segment_count:
+        update_cached_segment_info(segment_info, segment_image_path, previous_labels)
+
+    # Gettting the counts of labeled and unlabeled segments
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
+
+    # In delta mode only the changed segment labels are returned
+    # and the client composites the overlay from the segment raster
+    if request_data.get('mode') == 'delta':
+        return {'status': 200,
+                'changed_segments': changed_segment_count,
+                'label_delta': get_label_delta(previous_labels, segment_info),
+                'labeled_segments':labeled_segment_count,
+                'total_segments':total_segment_count,
+                'label_class_list':get_label_class_list(label_histogram)}
+
+    # Formatting path to marked image
+    marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
+
+    # Reading marked image
+    marked_image = read_cached_marked_image(marked_image_path)
+
+    # Color the labeled segments in the image
+    # Skips logic if there is no labeled segments to avoid unnecessary processing
+    if unlabeled_segment_count == total_segment_count:
+        color_image = marked_image
+    else:
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
+
+    # Converting image to base 64 for front-end return
+    base64_image = image_as_b64(color_image)
+    return {'status': 200,
+            'changed_segments': changed_segment_count,
+            'image_string':base64_image,
+            'image_type':get_image_mime_type(),
             'labeled_segments':labeled_segment_count,
             'total_segments':total_segment_count,
-            'label_class_list':np.column_stack(np.unique(segment_info[:,1], return_counts=True)).tolist()}
+            'label_class_list':get_label_class_list(label_histogram)}
 
 ######################################################################
 # endpoint called when next segment button is clicked in labeling process
@@ -529,6 +890,7 @@ def label_next_segment():
     Request Args:
         segment_image_id(int): The id of the segmented image.
         domain_label_id(int): The id of the domain label
+        mode(str): Optional, 'delta' returns label_delta instead of image_string
         
      Returns:
         JSON:Formatted response dict object for front-end
@@ -537,6 +899,7 @@ def label_next_segment():
             -error(str): Informational error message ONLY returned when status 404
                         is returned
             - image_string(str): Base64 encoded string of the colored image.
+            - image_type(str): MIME type of the encoded image.
             - labeled_segments(int): Count of labeled segments.
             - total_segments(int): Total count of segments.
             - label_class_list(list): List of tuples containing label IDs and their respective counts.
@@ -579,39 +942,64 @@ def label_next_segment():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Reading segment image file
-    segment_image, segment_info = read_segment_image(segment_image_path)
-
-    # Index list of all unlabeled segments
-    unlabeled_segment_indices = np.argwhere(segment_info[:,1] == 0)
-
-    if len(unlabeled_segment_indices) != 0:
-        #Getting the first unlabeled segment index
-        unlabeled_segment_index = unlabeled_segment_indices[0][0]
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # Labels before the edit for the delta response
+    previous_labels = segment_info[:,1].copy()
+
+    # The segment labeled last in this segment image, if any
+    label_cursor = session.get('label_cursor')
+    current_segment = None
+    if label_cursor is not None and label_cursor[0] == segment_image_id:
+        current_segment = label_cursor[1]
+
+    # Nearest unlabeled segment by the spatial index, so consecutive
+    # segments are neighbors instead of jumping around the crop
+    segment_index = read_cached_segment_index(segment_image_path)
+    if segment_index is None:
+        return {'status': 404, 'error': "Segment image index not found"}
+    unlabeled_segment = get_next_unlabeled_segment(segment_index, segment_info,
+                                                   current_segment=current_segment)
+
+    if unlabeled_segment is not None:
         #Updating the segment label map of the segment image object in database
         if research_label_id is not None and research_label_id != "None":
             #Updating segment label id on the segment info
-            segment_info[unlabeled_segment_index][1] = research_label_id
-            update_segment_image_info(segment_info, segment_image_path)
+            # The -1 is because the index starts from 0 in the array but segment numbers start from 1
+            segment_info[unlabeled_segment-1][1] = research_label_id
+            update_cached_segment_info(segment_info, segment_image_path, previous_labels)
+            session['label_cursor'] = [segment_image_id, unlabeled_segment]
 
     # Gettting the counts of labeled and unlabeled segments
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
+
+    # In delta mode only the changed segment labels are returned
+    # and the client composites the overlay from the segment raster
+    if request.args.get('mode') == 'delta':
+        return {'status': 200,
+                'label_delta': get_label_delta(previous_labels, segment_info),
+                'labeled_segments':labeled_segment_count,
+                'total_segments':total_segment_count,
+                'label_class_list':get_label_class_list(label_histogram)}
 
     # Formatting path to marked image
     marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
 
     # Reading marked image
-    marked_image = read_cv_image(marked_image_path,noflag=True)
+    marked_image = read_cached_marked_image(marked_image_path)
 
     # Color the labeled segments in the image
     # Skips logic if there is no labeled segments to avoid unnecessary processing
     if unlabeled_segment_count == total_segment_count:
         color_image = marked_image
     else:
-        color_image = color_labeled_image(input_image=marked_image,
-                                          segment_image=segment_image,
-                                          segment_info=segment_info,
-                                          research_label_map=research_field_obj.label_map,
-                                          alpha=session['label_opacity'])
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
     #print('Color image is generated.')
 
     # Converting image to base 64 for front-end return
@@ -619,9 +1007,10 @@ def label_next_segment():
 
     return {'status': 200,
             'image_string':base64_image,
+            'image_type':get_image_mime_type(),
             'labeled_segments':labeled_segment_count,
             'total_segments': total_segment_count,
-            'label_class_list': np.column_stack(np.unique(segment_info[:,1], return_counts=True)).tolist()}
+            'label_class_list': get_label_class_list(label_histogram)}
 
 ######################################################################
 # endpoint to fill all unlabeled segments to unknown
@@ -637,6 +1026,7 @@ def set_unlabeled_unknown():
         
     Request Args:
         segment_image_id(int): The id of the segmented image.
+        mode(str): Optional, 'delta' returns label_delta instead of image_string
         
     Returns:
         JSON:Formatted response dict object for front-end
@@ -645,6 +1035,7 @@ def set_unlabeled_unknown():
             -error(str): Informational error message ONLY returned when status 404
                         is returned
             - image_string(str): Base64 encoded string of the colored image.
+            - image_type(str): MIME type of the encoded image.
             - labeled_segments(int): Count of labeled segments.
             - total_segments(int): Total count of segments.
             - label_class_list(list): List of tuples containing label IDs and their respective counts.       
@@ -693,7 +1084,10 @@ def set_unlabeled_unknown():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Reading segment image file
-    segment_image, segment_info = read_segment_image(segment_image_path)
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # Labels before the edit for the delta response
+    previous_labels = segment_info[:,1].copy()
 
     # Retrieves the unknown label category id from the domain
     unknown_label_id = get_unknown_label_from_research_field(research_field_obj)
@@ -708,7 +1102,11 @@ def set_unlabeled_unknown():
         unique_label_id_list: np.ndarray = np.unique(segment_info[:,1])
         unique_label_id_list[np.where(unique_label_id_list == unknown_label_id)] = 0
         segment_info = remove_small_labels(segment_image, segment_info, unique_label_id_list, area_removal_percentage, unknown_label_id)
-        update_segment_image_info(segment_info, segment_image_path)
+        update_cached_segment_info(segment_info, segment_image_path, previous_labels)
+        # The next save is relative to the labels saved here
+        saved_labels = segment_info[:,1].copy()
+    else:
+        saved_labels = previous_labels
 
     # Updating all unlabeled segments to unknown
     segment_labels = np.where(segment_labels == 0, unknown_label_id, segment_labels)
@@ -717,27 +1115,38 @@ def set_unlabeled_unknown():
     segment_info = np.column_stack((segment_numbers, segment_labels, segment_area_count))
 
     # Updating segment info after changes
-    update_segment_image_info(segment_info, segment_image_path)
+    update_cached_segment_info(segment_info, segment_image_path, saved_labels)
 
     # Gettting the counts of labeled and unlabeled segments
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
+
+    # In delta mode only the changed segment labels are returned
+    # and the client composites the overlay from the segment raster
+    if request.args.get('mode') == 'delta':
+        return {'status': 200,
+                'label_delta': get_label_delta(previous_labels, segment_info),
+                'labeled_segments':labeled_segment_count,
+                'total_segments':total_segment_count,
+                'label_class_list':get_label_class_list(label_histogram)}
 
     # Formatting path to marked image
     marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
 
     # Reading marked image
-    marked_image = read_cv_image(marked_image_path,noflag=True)
+    marked_image = read_cached_marked_image(marked_image_path)
 
     # Color the labeled segments in the image
     # Skips logic if there is no labeled segments to avoid unnecessary processing
     if unlabeled_segment_count == total_segment_count:
         color_image = marked_image
     else:
-        color_image = color_labeled_image(input_image=marked_image,
-                                          segment_image=segment_image,
-                                          segment_info=segment_info,
-                                          research_label_map=research_field_obj.label_map,
-                                          alpha=session['label_opacity'])
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
     #print('Color image is generated.')
 
     # Converting image to base 64 for front-end return
@@ -745,9 +1154,10 @@ def set_unlabeled_unknown():
 
     return {'status': 200,
             'image_string':base64_image,
+            'image_type':get_image_mime_type(),
             'labeled_segments':labeled_segment_count,
             'total_segments': total_segment_count,
-            'label_class_list': np.column_stack(np.unique(segment_info[:,1], return_counts=True)).tolist()}
+            'label_class_list': get_label_class_list(label_histogram)}
 
 @LABEL.route("/getLabelArea/", methods = ['GET', 'POST'], endpoint="getLabelArea")
 def get_label_area():
@@ -802,19 +1212,8 @@ def get_label_area():
     # Formatting path to segment image
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
-    # Reading segment image file
-    segment_info = read_segment_image(segment_image_path)[1]
-
-    # List of all the different labels
-    unique_label_ids = np.unique(segment_info[:,1])
-
-    # Setting dict variable
-    label_area_dict = {}
-
-    for label_id in unique_label_ids.tolist():
-        # Gets the total area sum for each label
-        label_area_dict[label_id] = int(np.sum(np.where(segment_info[:,1] == label_id, segment_info[:,2], 0)))
-    print(label_area_dict)
+    # The total area of each label is kept up to date with every label edit
+    label_area_dict = get_label_areas(read_cached_label_histogram(segment_image_path))
     return {'status': 200,'segment_area':label_area_dict}
 
 @LABEL.route("/checkSegmentLabel/", methods = ['GET'], endpoint="checkSegmentLabel")
@@ -845,11 +1244,8 @@ def check_segment_label():
     # Formatting path to segment image
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
-    # Reading segment image file
-    segment_info = read_segment_image(segment_image_path)[1]
-
     # Gettting the counts of labeled and unlabeled segments
-    unlabeled_segment_count = get_labeled_segment_count(segment_info)[2]
+    unlabeled_segment_count = get_histogram_segment_count(read_cached_label_histogram(segment_image_path))[2]
 
     if unlabeled_segment_count != 0:
         print("NOT ALL SEGMENTS LABELED")
@@ -910,7 +1306,10 @@ def save_training_file():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Reading segment image into memory
-    segment_image, segment_info = read_segment_image(segment_image_path)
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # Labels as read so only the labels changed here are saved
+    read_labels = segment_info[:,1].copy()
 
     # Gettting cropped image object
     crop_image_obj = crop_image_service.get_image(crop_image_id=segment_image_obj.crop_image_id)
@@ -939,14 +1338,20 @@ def save_training_file():
         unique_label_id_list: np.ndarray = np.unique(segment_info[:,1])
         unique_label_id_list[np.where(unique_label_id_list == unknown_label_id)] = 0
         segment_info = remove_small_labels(segment_image, segment_info, unique_label_id_list, area_removal_percentage, unknown_label_id)
-        update_segment_image_info(segment_info, segment_image_path)
+        update_cached_segment_info(segment_info, segment_image_path, read_labels)
+    
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
     
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
 
     # Verifying all segments are labeled
     if unlabeled_segment_count > 0:
         return {'status': 400, 'error': "Not all segments are labeled"}
 
+    # Writing the journaled label edits into the segment image
+    # file before it is added to the training file
+    compact_label_journal(segment_image_path)
+
     # Setting OS file path for training dataset
     if is_default_user(user_obj):
         if file_type == 'HDF5':
@@ -1021,8 +1426,27 @@ def save_training_file():
 
                 training_file_path = merge_directory(file_path, training_dataset_filename)
 
+                # Looks up the images already in the file in case their features
+                # were written with an older feature version and are recomputed
+                def get_training_image_objs(training_segment_image_id):
+                    training_segment_image_obj = segment_image_service.get_image(training_segment_image_id)
+                    if training_segment_image_obj is None:
+                        return None
+                    training_crop_image_obj = crop_image_service.get_image(training_segment_image_obj.crop_image_id)
+                    if training_crop_image_obj is None:
+                        return None
+                    return training_segment_image_obj, training_crop_image_obj
+
                 #Creating the HDF5 file
-                write_training_file(training_file_path, STATIC_FOLDER, segment_image_obj, crop_image_obj, original_image_obj, overwrite=False)
+                write_training_file(training_file_path, STATIC_FOLDER, segment_image_obj, crop_image_obj, original_image_obj, overwrite=False,
+                                    image_lookup=get_training_image_objs)
+
+        # Training the classifiers of the changed training file in the background
+        if file_type == 'HDF5':
+            request_model_training(merge_directory(STATIC_FOLDER, training_file_obj.file_path),
+                                   get_unknown_label_from_research_field(research_field_obj),
+                                   merge_directory(STATIC_FOLDER, training_file_obj.model_path),
+                                   get_model_name(training_file_obj))
 
         # Getting the visual image
         visual_image_path = merge_directory(STATIC_FOLDER,crop_image_obj.visualization_path)
@@ -1139,14 +1563,6 @@ def auto_label_image():
     training_file_obj = training_file_service.get_file(training_file_id=training_file_id)
     print(training_file_obj)
     print("LABEL ID", training_file_id)
-    # Dictionary mapping for each model algorithm id
-    model_mapping = {
-        0: "svm",
-        1: "rf",
-        2: "xgb",
-        3: "knn"
-    }
-
     # Loading the segment image object from database
     segment_image_obj = segment_image_service.get_user_image(segment_image_id=segment_image_id,
                                                              user_id=user_obj.id,
@@ -1156,7 +1572,10 @@ def auto_label_image():
     segment_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.segment_path)
 
     # Retrieving the segment image and info from disk
-    segment_image, segment_info = read_segment_image(segment_image_path)
+    segment_image, segment_info = read_cached_segment_image(segment_image_path)
+
+    # Labels before the edit for the delta response
+    previous_labels = segment_info[:,1].copy()
 
     # Getting the associated crop image from database
     crop_image_obj = crop_image_service.get_image(segment_image_obj.crop_image_id)
@@ -1183,88 +1602,70 @@ def auto_label_image():
 
 
     research_field_obj = research_field_service.get_by_id(research_id=segment_image_obj.research_id)
-    research_label_map = research_field_obj.label_map
-    for label in research_label_map:
-        if label["name"].lower() == "unknown":
-            unknown_label_id = label["id"]
-            break
+    unknown_label_id = get_unknown_label_from_research_field(research_field_obj)
 
     # File directory for the model file
     model_file_directory = merge_directory(STATIC_FOLDER,training_file_obj.model_path)
 
-    # Naming convention is {label_file_id} + _ + {file_name} + _ + {algorithm_id}
-    model_file_name = str(training_file_obj.id) +"_"+ training_file_obj.file_name.split(".")[0] + "_" +  model_mapping[algorithm_id] + ".pkl"
-
-    # List of files in model directory
-    model_files = os.listdir(model_file_directory)
-
-    # File path for the model file
-    model_file_path = merge_directory(model_file_directory, model_file_name)
-
-    # Checking if the model already exists/has been trained
-    if model_file_name in model_files:
-
-        # If it exists do not need to retrain
-        needs_retrain = False
-
-        # Getting the last time the file was modified
-        timestamp  = os.path.getmtime(model_file_path)
-        last_modified = datetime.fromtimestamp(timestamp, timezone.utc)
-
-        # Today's time
-        now = datetime.now(timezone.utc)
-
-        # retrain if it is too long since last modify date
-        # TODO make this check for new images or auto retrain with new images
-        if (now - last_modified).days >= app.config['MODEL_RETRAIN_SPAN']:
-            needs_retrain = True
-    else:
-        # If file doesn't exist its needs to be trained
-        needs_retrain = True
-    needs_retrain = True
     # Image type for model analysis
     image_type = 'srgb'
 
     # The training file to use
     target_training_file = merge_directory(STATIC_FOLDER,training_file_obj.file_path)
 
-    # Loading the training dataset
-    training_dataset = read_training_file(target_training_file, image_type, int(unknown_label_id))
-
-    # classify image
-    classified_flags = classify_image(cropped_image_reshape, segment_image, training_dataset, \
-                                                    [image_type, research_field_obj.name], probability_threshold, algorithm_id, \
-                                                    model_file_path, needs_retrain)
-
+    # Loading the latest classifier, the classifier of the current training
+    # data is trained in the background if it isn't ready yet
+    try:
+        model_entry, model_stale = load_ready_classifier(target_training_file, image_type,
+                                                         int(unknown_label_id), algorithm_id,
+                                                         model_file_directory,
+                                                         get_model_name(training_file_obj))
+    except ValueError as error:
+        # Such as a training file with a single label
+        print("Error:", error)
+        traceback.print_tb(error.__traceback__)
+        return {'status': 400, 'error': "The model couldn't be trained on this training file: " + str(error)}
+    if model_entry is None:
+        return {'status': 202, 'model_stale': True,
+                'error': "The model is still training, try again shortly"}
 
-    # loop through to do return count for front end
-    for segment in segment_info:
-        if classified_flags[segment[0]] == -1:
-            segment_info[segment[0]-1][1] = 0
-        else:
-            segment_info[segment[0]-1][1] = int(classified_flags[segment[0]])
-    update_segment_image_info(segment_info, segment_image_path)
+    # classify image, the label ids are aligned to the segment info rows
+    segment_info[:,1] = classify_image(cropped_image_reshape, segment_image, segment_info, model_entry, \
+                                       [image_type, research_field_obj.name], probability_threshold)
+    update_cached_segment_info(segment_info, segment_image_path, previous_labels)
 
     # Gettting the counts of labeled and unlabeled segments
-    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_labeled_segment_count(segment_info)
+    label_histogram = read_cached_label_histogram(segment_image_path, segment_info)
+    total_segment_count, labeled_segment_count, unlabeled_segment_count = get_histogram_segment_count(label_histogram)
+
+    # In delta mode only the changed segment labels are returned
+    # and the client composites the overlay from the segment raster
+    if request.args.get('mode') == 'delta':
+        return {'status': 200,
+                'label_delta': get_label_delta(previous_labels, segment_info),
+                'model_stale': model_stale,
+                'labeled_segments':labeled_segment_count,
+                'total_segments':total_segment_count,
+                'label_class_list':get_label_class_list(label_histogram)}
 
 
     # Formatting path to marked image
     marked_image_path = merge_directory(STATIC_FOLDER,segment_image_obj.marked_image_path)
 
     # Reading marked image
-    marked_image = read_cv_image(marked_image_path,noflag=True)
+    marked_image = read_cached_marked_image(marked_image_path)
     # done labeling, draw the color image
     # Color the labeled segments in the image
     # Skips logic if there is no labeled segments to avoid unnecessary processing
     if unlabeled_segment_count == total_segment_count:
         color_image = marked_image
     else:
-        color_image = color_labeled_image(input_image=marked_image,
-                                          segment_image=segment_image,
-                                          segment_info=segment_info,
-                                          research_label_map=research_field_obj.label_map,
-                                          alpha=session['label_opacity'])
+        color_image = render_label_overlay(overlay_key=segment_image_path,
+                                           marked_image=marked_image,
+                                           segment_image=segment_image,
+                                           segment_info=segment_info,
+                                           research_label_map=research_field_obj.label_map,
+                                           alpha=session['label_opacity'])
     print('Color image is generated.')
 
     # Converting image to base 64 for front-end return
@@ -1272,9 +1673,11 @@ def auto_label_image():
 
     return {'status': 200,
             'image_string':base64_image,
+            'image_type':get_image_mime_type(),
+            'model_stale': model_stale,
             'labeled_segments': labeled_segment_count,
             'total_segments': labeled_segment_count,
-            'label_class_list': np.column_stack(np.unique(segment_info[:,1], return_counts=True)).tolist()}
+            'label_class_list': get_label_class_list(label_histogram)}
 
 
 @LABEL.route('/deleteImageFromTrainingFile/', methods=[ 'GET', 'POST'], endpoint="deleteImageFromTrainingFile")
@@ -1287,6 +1690,7 @@ def delete_image_from_training_file():
     user_service = db.user_service
     training_file_service = db.training_file_service
     label_image_service = db.label_image_service
+    research_field_service = db.research_field_service
 
     # Verifying the session is valid and retrieving user object
     valid_session = oauth.validate_user_session()
@@ -1306,6 +1710,13 @@ def delete_image_from_training_file():
 
     file_path = merge_directory(STATIC_FOLDER, training_file_obj.file_path)
     delete_image_from_file(file_path, segment_image_id)
+
+    # Training the classifiers of the changed training file in the background
+    research_field_obj = research_field_service.get_by_id(training_file_obj.research_id)
+    request_model_training(file_path,
+                           get_unknown_label_from_research_field(research_field_obj),
+                           merge_directory(STATIC_FOLDER, training_file_obj.model_path),
+                           get_model_name(training_file_obj))
     label_image_obj = label_image_service.get_image_from_parents(segment_image_id=segment_image_id,
                                                                  training_file_id=training_file_obj.id)
     color_image_path = merge_directory(STATIC_FOLDER,label_image_obj.color_image_path)
@@ -9,14 +9,15 @@ from flask import (render_template, request,
                    make_response, current_app as app,
                    Blueprint, redirect,
                    url_for)
+import celery.states as states
 
 # Local Library Imports
 from classxlib.file import *
 from classxlib.security import verify_session
-from classxlib.segment import (run_segmentation, get_image_segment_count,
-                               write_segment_image)
+from classxlib.segment import (run_segmentation_preview, write_preview_artifact,
+                               read_preview_artifact_image, promote_preview_artifact,
+                               delete_preview_artifact)
 from classxlib.segment.process import process_segment_parameters
-from classxlib.image import image_as_b64, write_cv_image
 from classxlib.database import DatabaseService, is_default_user
 from classxlib.database.service import (UserService, ResearchFieldService,
                                         OriginalImageService, CropImageService,
@@ -27,6 +28,7 @@ from classxlib.database.model import (User, ResearchField,
 from classxlib.security.keycloak import oAuthManager
 from .oauth import get_oauth
 from .database import get_db
+from .celery import preview_segment_image as preview_segment_image_task
 from .globals import (STATIC_FOLDER,ADMIN_UPLOAD_FOLDER,
                       USER_UPLOAD_FOLDER)
 
@@ -56,6 +58,8 @@ def preview_segment_image():
         
      Request Args:
         parameter_data(dict): The paramter of the data
+        async(int): Query argument, if 1 the segmentation is queued on the
+        celery worker and a job id is returned for previewSegmentImageStatus
 
 
     Returns:
@@ -84,8 +88,10 @@ def preview_segment_image():
         # Processing the segment parameters from front-end
         parameter_data = process_segment_parameters(request.get_json())
 
-        # Setting the session image to empty
-        session['image'] = {}
+        # Removing the previews of the last request and
+        # setting the session image to empty
+        _clear_session_previews()
+        session.pop('preview_job', None)
 
         # Retrieving the crop image object
         crop_image_obj = crop_image_service.get_user_image(crop_image_id=parameter_data['crop_image_id'],
@@ -141,26 +147,114 @@ def preview_segment_image():
 
         # If lighting adjustment isn't checked then the other algorithms will never be used
         histogram_range = 1 if parameter_data['light_adjustment_check'] == 0 else 4
-        #try:
-        print("Running Segmentation for", crop_image_obj.name)
-        for histogram_method in range(histogram_range):
-            parameter_data['histogram_method'] = histogram_method
-            #Marking the boundaries of whole image
-            marked_image, segment_image = run_segmentation(image_path=crop_image_path,
-                                                            h5_image_path=h5_crop_image_path,
-                                                            parameter_dict=parameter_data)
 
+        # Queuing the segmentation on the celery worker, the front-end polls
+        # previewSegmentImageStatus with the job id for progress and the previews
+        if request.args.get('async', default=0, type=int) == 1:
+            print("Queuing Segmentation for", crop_image_obj.name)
+            preview_job = preview_segment_image_task.delay(parameter_data,
+                                                           crop_image_path,
+                                                           h5_crop_image_path,
+                                                           list(range(histogram_range)))
+            session['preview_job'] = preview_job.id
+            return {'status':202, 'job_id':preview_job.id}
 
+        #try:
+        print("Running Segmentation for", crop_image_obj.name)
+        # The image is read once and every histogram method is segmented concurrently
+        segmentation_list = run_segmentation_preview(image_path=crop_image_path,
+                                                     h5_image_path=h5_crop_image_path,
+                                                     parameter_dict=parameter_data,
+                                                     histogram_method_list=list(range(histogram_range)))
+        for histogram_method, (marked_image, segment_image) in enumerate(segmentation_list):
             print(histogram_method_name[histogram_method])
-            base64_image = image_as_b64(marked_image)
-            session['image'][histogram_method] = {'marked_image':marked_image,'segment_image':segment_image, 'status':200}
-            return_object.append({"hist_method":histogram_method,"image":base64_image,"hist_name":histogram_method_name[histogram_method]})
+            # The preview is written to disk once and only its token is kept in the session
+            artifact_token = write_preview_artifact(marked_image=marked_image,
+                                                    segment_image=segment_image)
+            if artifact_token is None:
+                # Dropping the previews already written by this request
+                _clear_session_previews()
+                return {'status' : 400,'error':"Segmentation Failed Cause: Preview Could Not Be Written"}
+            base64_image, image_type = read_preview_artifact_image(artifact_token)
+            session['image'][histogram_method] = {'artifact_token':artifact_token, 'status':200}
+            return_object.append({"hist_method":histogram_method,"image":base64_image,"image_type":image_type,"hist_name":histogram_method_name[histogram_method]})
         return make_response(jsonify(return_object))
         # except Exception as error:
         #     traceback.print_tb(error.__traceback__)
         #     print("EXCEPTION AT previewSegmentation")
         #     return {'status' : 400,'error':"Segmentation Failed Cause: Unknown"}
 
+@SEGMENT_IMAGE.route('/previewSegmentImageStatus/<job_id>', methods=['GET'], endpoint="previewSegmentImageStatus")
+def preview_segment_image_status(job_id):
+    """API ENDPOINT
+    Returns the progress of a queued segmentation preview, once the job
+    has finished the previews are added to the session and returned
+
+     Session Args:
+        preview_job(str): The job id of the last queued preview.
+
+     Request Args:
+        job_id(str): The job id returned by previewSegmentImage.
+
+    Returns:
+        JSON:Formatted response dict object for front-end
+            -status(int): 202 while the job is queued or running, 200 once
+                          the previews are ready and 400/404 on errors
+            -state(str): The celery state of the job
+            -stage(str): The last finished stage ONLY returned while running
+            -timings(dict): Seconds spent in each stage per histogram method
+            -previews(list): The preview images ONLY returned when status 200
+    """
+    # Retrieving Database
+    oauth = get_oauth()
+
+    # Verifying the session is valid
+    valid_session = oauth.validate_user_session()
+
+    # If user is none then session is invalid
+    if not valid_session:
+        session['url'] = 'go-back'
+        return redirect(url_for('auth.login'))
+
+    # Users can only poll their own latest preview job
+    if session.get('preview_job') != job_id:
+        return {'status':404, 'error':"Segmentation Preview Not Found"}
+
+    preview_job = preview_segment_image_task.AsyncResult(job_id)
+
+    if preview_job.state == states.FAILURE:
+        session.pop('preview_job', None)
+        return {'status':400, 'state':preview_job.state,
+                'error':"Segmentation Failed Cause: " + str(preview_job.result)}
+
+    if preview_job.state != states.SUCCESS:
+        # PENDING is also returned for unknown jobs so the progress
+        # info is only available once the worker started the job
+        progress = preview_job.info if isinstance(preview_job.info, dict) else {}
+        return {'status':202, 'state':preview_job.state,
+                'stage':progress.get('stage'),
+                'timings':progress.get('timings', {})}
+
+    # Dict for the lighting adjustment algorithms
+    histogram_method_name = {0:"Default",1:"Histogram Equalization",2:"Adaptive Equalization",3:"CLAHE"}
+
+    # Registering the finished previews in the session
+    job_result = preview_job.result
+    return_object = []
+    for preview in job_result['previews']:
+        histogram_method = preview['hist_method']
+        session['image'][histogram_method] = {'artifact_token':preview['artifact_token'], 'status':200}
+        base64_image, image_type = read_preview_artifact_image(preview['artifact_token'])
+        return_object.append({"hist_method":histogram_method,
+                              "image":base64_image,
+                              "image_type":image_type,
+                              "hist_name":histogram_method_name[histogram_method]})
+    session.pop('preview_job', None)
+    preview_job.forget()
+    return {'status':200, 'state':preview_job.state,
+            'timings':job_result['timings'],
+            'previews':return_object}
+
 @SEGMENT_IMAGE.route('/saveSegmentImage/', methods=['GET', 'POST'], endpoint="saveSegmentImage")
 def save_segment_image():
     """API ENDPOINT
@@ -216,9 +310,8 @@ def save_segment_image():
             date_utc = datetime.now(timezone.utc)
             date_time = date_utc.strftime("%m_%d_%Y_%H_%M_%S")
 
-            # Retrieving the segment image and marked image from the session
-            segment_image = session['image'][parameter_data['histogram_method']]['segment_image']
-            marked_image = session['image'][parameter_data['histogram_method']]['marked_image']
+            # Retrieving the preview token from the session
+            artifact_token = session['image'][parameter_data['histogram_method']]['artifact_token']
 
             # Setting file name based off algorithm used
             if parameter_data['segment_method_id'] == 1:
@@ -242,16 +335,11 @@ def save_segment_image():
 
             print(f'Creating object for segmented image {segment_image_filename} at {segment_image_savepath} for user {user_obj.username}')
 
-            # Getting the total segments
-            total_segments = get_image_segment_count(segment_image)
-
-            # Saving marked image and segment image to disk
-            write_cv_image(marked_image, marked_image_savepath)
-
-            # Writing the segment image data and segment info to disk
-            write_segment_image(segment_image=segment_image,
-                                savepath=segment_image_savepath,
-                                datatype=c_uint32)
+            # Moving the already written preview files to their save paths
+            if not promote_preview_artifact(token=artifact_token,
+                                            marked_image_savepath=marked_image_savepath,
+                                            segment_image_savepath=segment_image_savepath):
+                return {'status' : 400,'error':"Segmentation Saving Failed Cause: Preview Expired"}
 
             # Creating segment image object for database
             segment_image_obj = SegmentImage(name=segment_image_filename,
@@ -283,8 +371,8 @@ def save_segment_image():
             #print('inserted image to table..')
             #print(f'total segments in the image {total_segments}')
 
-            # Clearing the session to reduce memory
-            session['image'] = {}
+            # Clearing the session and the remaining previews
+            _clear_session_previews()
             return {'status': 200, 'image' : segment_image_obj}
 
         except Exception as error:
@@ -342,4 +430,12 @@ def get_segment_images():
                                                                                user_id=user_obj.id,
                                                                                default_id=db.DEFAULT_ID)
     #print(segment_image_obj_list)
-    return make_response(jsonify(segment_image_obj_list))
\ No newline at end of file
+    return make_response(jsonify(segment_image_obj_list))
+
+def _clear_session_previews():
+    """Deletes the preview artifacts referenced by the session
+    and sets the session image to empty"""
+    for preview in session.get('image', {}).values():
+        if isinstance(preview, dict) and preview.get('artifact_token') is not None:
+            delete_preview_artifact(preview['artifact_token'])
+    session['image'] = {}
@@ -33,8 +33,14 @@ autoLabelConfirm.addEventListener('click', function Auto_Label() {
         url: autoLabelImageURL,
         success: function (response) {
             loadSegmentImage(image_click);
-            if (response.status != 200) {
+            if (response.status == 202) {
+                notification(response.error, "#f0ad4e", "#000", "20px");
+            } else if (response.status == 400) {
+                notification(response.error, "#d9534f", "#fff", "20px");
+            } else if (response.status != 200) {
                 console.log("error: ", response.error)
+            } else if (response.model_stale) {
+                notification("Auto labeled with the previous model, the latest training data is still training.", "#f0ad4e", "#000", "20px");
             } else {
                 notification("Auto labeled segment image.", "#5cb85c", "#000", "20px");
             }
@@ -0,0 +1,148 @@
+/*
+ * Composites the label overlay of a segment image in the browser.
+ * The segment raster is downloaded once (revalidated with its ETag),
+ * label edits only send back the changed segment labels and the
+ * overlay is blended here the same way the server colors images.
+ */
+function LabelCompositor(canvas) {
+  this.canvas = canvas;
+  this.ready = false;
+  this.segmentImageId = null;
+  this.raster = null;
+  this.width = 0;
+  this.height = 0;
+  this.markedPixels = null;
+  this.segmentLabels = null;
+  this.labelColors = {};
+  this.opacity = 0.7;
+  this.buffer = document.createElement('canvas');
+}
+
+// Loads the raster, marked image and labels of a segment image
+LabelCompositor.prototype.load = function (segmentImageId, stateURL, rasterURL) {
+  var compositor = this;
+  compositor.ready = false;
+  compositor.segmentImageId = segmentImageId;
+  var query = '?segment_image_id=' + encodeURIComponent(segmentImageId);
+
+  var statePromise = fetch(stateURL + query, {credentials: 'same-origin'})
+    .then(function (response) { return response.json(); });
+  var rasterPromise = fetch(rasterURL + query, {credentials: 'same-origin', cache: 'no-cache'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error('segment raster request failed');
+      }
+      var dtype = response.headers.get('X-Raster-Dtype');
+      var width = parseInt(response.headers.get('X-Raster-Width'));
+      var height = parseInt(response.headers.get('X-Raster-Height'));
+      return response.arrayBuffer().then(function (buffer) {
+        var raster = dtype === 'uint16' ? new Uint16Array(buffer) : new Uint32Array(buffer);
+        return {raster: raster, width: width, height: height};
+      });
+    });
+
+  return Promise.all([statePromise, rasterPromise]).then(function (results) {
+    var state = results[0];
+    var raster = results[1];
+    if (state.status !== 200) {
+      throw new Error(state.error);
+    }
+    return compositor._loadMarkedImage(state.marked_image_url, raster.width, raster.height)
+      .then(function (markedPixels) {
+        // A newer load started while this one was in flight
+        if (compositor.segmentImageId !== segmentImageId) {
+          return state;
+        }
+        compositor.raster = raster.raster;
+        compositor.width = raster.width;
+        compositor.height = raster.height;
+        compositor.markedPixels = markedPixels;
+        compositor.segmentLabels = Int32Array.from(state.segment_labels);
+        compositor.labelColors = state.label_colors;
+        compositor.opacity = state.label_opacity;
+        compositor.ready = true;
+        compositor.render();
+        return state;
+      });
+  });
+};
+
+LabelCompositor.prototype._loadMarkedImage = function (url, width, height) {
+  var buffer = this.buffer;
+  return new Promise(function (resolve, reject) {
+    var markedImage = new Image();
+    markedImage.onload = function () {
+      buffer.width = width;
+      buffer.height = height;
+      var bufferContext = buffer.getContext('2d');
+      bufferContext.drawImage(markedImage, 0, 0, width, height);
+      resolve(bufferContext.getImageData(0, 0, width, height).data.slice());
+    };
+    markedImage.onerror = reject;
+    markedImage.src = url;
+  });
+};
+
+// Applies a label_delta response of the labeling endpoints
+LabelCompositor.prototype.applyDelta = function (labelDelta) {
+  var segments = labelDelta.segments;
+  var labels = labelDelta.labels;
+  for (var i = 0; i < segments.length; ++i) {
+    if (segments[i] >= this.segmentLabels.length) {
+      var grown = new Int32Array(segments[i] + 1);
+      grown.set(this.segmentLabels);
+      this.segmentLabels = grown;
+    }
+    this.segmentLabels[segments[i]] = labels[i];
+  }
+  this.render();
+};
+
+LabelCompositor.prototype.setOpacity = function (opacity) {
+  this.opacity = parseFloat(opacity);
+  this.render();
+};
+
+// Blends the label colors on the marked image and draws it on the canvas
+LabelCompositor.prototype.render = function () {
+  if (!this.ready) {
+    return;
+  }
+  var segmentCount = this.segmentLabels.length;
+  var palette = new Uint8Array(segmentCount * 3);
+  for (var segment = 0; segment < segmentCount; ++segment) {
+    var color = this.labelColors[this.segmentLabels[segment]];
+    if (color) {
+      palette[segment * 3] = color[0];
+      palette[segment * 3 + 1] = color[1];
+      palette[segment * 3 + 2] = color[2];
+    }
+  }
+
+  // 8 bit fixed point weight, matches the server side blend
+  var labelWeight = Math.round(Math.min(Math.max(this.opacity, 0), 1) * 256);
+  var imageWeight = 256 - labelWeight;
+  var bufferContext = this.buffer.getContext('2d');
+  var output = bufferContext.createImageData(this.width, this.height);
+  var outputPixels = output.data;
+  var markedPixels = this.markedPixels;
+  var raster = this.raster;
+  for (var pixel = 0; pixel < raster.length; ++pixel) {
+    var offset = pixel * 4;
+    var colorOffset = raster[pixel] < segmentCount ? raster[pixel] * 3 : -1;
+    for (var channel = 0; channel < 3; ++channel) {
+      var value = markedPixels[offset + channel];
+      var labelValue = colorOffset < 0 ? 0 : palette[colorOffset + channel];
+      outputPixels[offset + channel] = labelValue === 0 ? value :
+        (value * imageWeight + labelValue * labelWeight) >> 8;
+    }
+    outputPixels[offset + 3] = 255;
+  }
+  bufferContext.putImageData(output, 0, 0);
+
+  var context = this.canvas.getContext('2d');
+  var ratio = this.height / this.width;
+  context.canvas.width = 4096;
+  context.canvas.height = context.canvas.width * ratio;
+  context.drawImage(this.buffer, 0, 0, context.canvas.width, context.canvas.height);
+};
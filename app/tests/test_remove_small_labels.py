@@ -0,0 +1,88 @@
+"""Regression tests of remove_small_labels against the sequential
+implementation it replaced, on felzenszwalb segmentations"""
+
+# Python Standard Library Imports
+import inspect
+
+# Python Third Party Imports
+import numpy as np
+import pytest
+from skimage import data, morphology
+from skimage.segmentation import felzenszwalb
+
+# Local Library Imports
+from classxlib.label import remove_small_labels
+
+UNKNOWN_LABEL_ID = 9
+
+def _reference_label_mask(segment_image:np.ndarray,
+                          segment_info:np.ndarray,
+                          unique_label_ids:list[int]) -> np.ndarray:
+    """The label mask as extract_label_mask_from_image built it"""
+    label_mask = np.zeros(segment_image.shape)
+    for label_id in unique_label_ids:
+        if label_id == UNKNOWN_LABEL_ID:
+            continue
+        mask = np.isin(segment_image,
+                       np.where(segment_info[:, 1] == label_id, segment_info[:, 0], 0))
+        label_mask = np.where(mask, label_id, label_mask)
+    return label_mask
+
+def _remove_small_holes(sub_mask:np.ndarray,
+                        area_threshold:int) -> np.ndarray:
+    """remove_small_holes filling holes smaller than the threshold as in
+    the pinned scikit-image, newer releases fill holes of equal area too"""
+    if 'max_size' in inspect.signature(morphology.remove_small_holes).parameters:
+        return morphology.remove_small_holes(sub_mask, max_size=area_threshold - 1)
+    return morphology.remove_small_holes(sub_mask, area_threshold)
+
+def _reference_remove_small_labels(segment_image:np.ndarray,
+                                   segment_info:np.ndarray,
+                                   unique_label_ids:list[int],
+                                   area_removal_percentage:float) -> np.ndarray:
+    """The per label remove_small_holes implementation"""
+    label_mask = _reference_label_mask(segment_image, segment_info, unique_label_ids)
+    image_area = segment_image.shape[0] * segment_image.shape[1]
+    area_removal_threshold = int(image_area * area_removal_percentage)
+    for label_id in dict.fromkeys(unique_label_ids):
+        if label_id == 0:
+            continue
+        sub_mask = label_mask == label_id
+        new_sub_mask = _remove_small_holes(np.copy(sub_mask), area_removal_threshold)
+        segment_update = np.unique(np.where(sub_mask != new_sub_mask,
+                                            segment_image, 0)).tolist()
+        segment_update.pop(0)
+        for segment_number in segment_update:
+            segment_info[segment_number-1][1] = label_id
+        label_mask = _reference_label_mask(segment_image, segment_info, unique_label_ids)
+    return segment_info
+
+def _felzenszwalb_case(seed:int,
+                       size:int) -> tuple:
+    """Segments a crop of a sample image and labels its segments at random"""
+    rng = np.random.default_rng(seed)
+    image = data.astronaut()
+    x_start, y_start = rng.integers(0, image.shape[0] - size, 2)
+    crop = image[x_start:x_start+size, y_start:y_start+size]
+    segment_image = felzenszwalb(crop, scale=float(rng.choice([50, 100, 300])),
+                                 sigma=0.7, min_size=int(rng.choice([10, 20, 50]))) + 1
+    segment_count = int(np.amax(segment_image))
+    segment_info = np.zeros((segment_count, 3), dtype=np.int64)
+    segment_info[:, 0] = np.arange(1, segment_count + 1)
+    segment_info[:, 1] = rng.choice([0, 1, 2, 3, 4, UNKNOWN_LABEL_ID], segment_count,
+                                    p=[0.3, 0.25, 0.15, 0.1, 0.1, 0.1])
+    segment_info[:, 2] = np.bincount(segment_image.ravel())[1:]
+    return segment_image, segment_info
+
+@pytest.mark.parametrize('seed', range(12))
+@pytest.mark.parametrize('area_removal_percentage', [0.001, 0.01, 0.05])
+def test_matches_sequential_removal(seed:int,
+                                    area_removal_percentage:float) -> None:
+    """Every felzenszwalb case gives the same labels as the old implementation"""
+    segment_image, segment_info = _felzenszwalb_case(seed, 128)
+    unique_label_ids = [0, 3, 1, UNKNOWN_LABEL_ID, 4, 2]
+    expected = _reference_remove_small_labels(segment_image, segment_info.copy(),
+                                              unique_label_ids, area_removal_percentage)
+    result = remove_small_labels(segment_image, segment_info.copy(), unique_label_ids,
+                                 area_removal_percentage, UNKNOWN_LABEL_ID)
+    np.testing.assert_array_equal(result, expected)